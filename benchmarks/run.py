@@ -0,0 +1,367 @@
+"""End-to-end latency benchmarks of TerminalGPT against the local stand-in server.
+
+The stand-in answers instantly, so the timings are the client's own overhead:
+building requests, counting tokens, saving conversations and printing.
+
+    python benchmarks/run.py                 # compare with benchmarks/baselines.json
+    python benchmarks/run.py --save          # store the results as the new baselines
+    python benchmarks/run.py --only one_shot # run some of the benchmarks
+
+Exits with 1 when a median is slower than its baseline by more than the tolerance.
+"""
+
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from typing import Callable, Dict
+from unittest.mock import MagicMock
+
+import click
+from click.testing import CliRunner
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# pylint: disable=wrong-import-position
+from terminalgpt import config
+from terminalgpt.chat import ChatManager
+from terminalgpt.conversations import ConversationManager
+from terminalgpt.main import cli
+from terminalgpt.models import get_encoder
+from terminalgpt.printer import PrinterFactory
+from terminalgpt.standin import StandInServer
+from terminalgpt.tokens import Tokenizer, tokenizer_threads
+
+BASELINES_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "baselines.json"
+)
+
+CHAT_TURNS = 10
+LARGE_CONVERSATION_MESSAGES = 2000
+TOKENIZED_MESSAGES = 20000
+PRINTED_BLOCKS = 200
+
+# name -> setup(server, workdir), the setup returns the timed run, which returns
+# the number of operations it did
+BENCHMARKS: Dict[str, Callable] = {}
+
+
+def benchmark(function: Callable) -> Callable:
+    """Registers a benchmark setup function under its name."""
+
+    BENCHMARKS[function.__name__] = function
+    return function
+
+
+def create_client(server: StandInServer):
+    """Returns a client of the stand-in server."""
+
+    # pylint: disable-next=import-outside-toplevel
+    from openai import OpenAI
+
+    return OpenAI(api_key="standin", base_url=server.url, max_retries=0)
+
+
+@benchmark
+def chat_turn(server: StandInServer, workdir: str):
+    """A turn of ChatManager.chat_loop: prompt, request, save and print."""
+
+    config.CONVERSATIONS_PATH = tempfile.mkdtemp(dir=workdir)
+    client = create_client(server)
+    printer = PrinterFactory.get_printer("plain", instant=True)
+    conv_manager = ConversationManager(printer=printer, model="gpt-4o-mini")
+    conv_manager.client = client
+
+    session = MagicMock()
+    session.prompt.side_effect = ["Hello there, how are you?"] * CHAT_TURNS + ["exit"]
+    chat_manager = ChatManager(
+        conversations_manager=conv_manager,
+        token_limit=4096,
+        session=session,
+        messages=[config.INIT_SYSTEM_MESSAGE],
+        model="gpt-4o-mini",
+        printer=printer,
+        client=client,
+    )
+
+    def run():
+        try:
+            chat_manager.chat_loop()
+        except SystemExit:
+            pass
+        conv_manager.wait_for_title()
+        return CHAT_TURNS + 1
+
+    return run
+
+
+@benchmark
+def one_shot(server: StandInServer, _):
+    """The one-shot command end to end, from argument parsing to the printed answer."""
+
+    runner = CliRunner()
+    env = {"OPENAI_API_KEY": "standin", "OPENAI_BASE_URL": server.url}
+    # in-process, a running daemon would answer from the real API
+    args = [
+        "--style",
+        "plain",
+        "--instant",
+        "--no-daemon",
+        "one-shot",
+        "--no-cache",
+        "Hello there",
+    ]
+
+    def run():
+        result = runner.invoke(cli, args, env=env)
+        if result.exit_code != 0:
+            raise RuntimeError(result.output) from result.exception
+        return 1
+
+    return run
+
+
+@benchmark
+def load_large(_, workdir: str):
+    """Loading a large conversation and counting its tokens, like the load command."""
+
+    config.CONVERSATIONS_PATH = os.path.join(workdir, "large")
+    path = os.path.join(config.CONVERSATIONS_PATH, "large_conversation")
+    if not os.path.exists(path):
+        os.makedirs(config.CONVERSATIONS_PATH, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as file:
+            for number in range(LARGE_CONVERSATION_MESSAGES):
+                role = "user" if number % 2 else "assistant"
+                content = f"Message {number}: " + "some words of a long answer " * 20
+                file.write(json.dumps({"role": role, "content": content}) + "\n")
+
+    printer = PrinterFactory.get_printer("plain", instant=True)
+
+    def run():
+        conv_manager = ConversationManager(printer=printer, model="gpt-4o-mini")
+        conv_manager.conversation_name = "large_conversation"
+        chat_manager = ChatManager(
+            conversations_manager=conv_manager,
+            token_limit=4096,
+            session=MagicMock(),
+            messages=[],
+            model="gpt-4o-mini",
+            printer=printer,
+        )
+        chat_manager.messages = conv_manager.load_conversation()
+        chat_manager.total_usage = chat_manager.num_tokens_from_messages()
+        if chat_manager.exceeding_token_limit():
+            chat_manager.reduce_tokens()
+        return 1
+
+    return run
+
+
+def tokenized_history(batched: bool):
+    """Returns a run counting the tokens of a very large history.
+
+    The batched run counts the whole history at once, on as many threads as
+    the tokenizer uses on this machine.
+    """
+
+    tokenizer = Tokenizer(get_encoder("gpt-4o-mini"))
+    messages = [
+        {
+            "role": "user" if number % 2 else "assistant",
+            "content": f"Message {number}: " + "some words of a long answer " * 20,
+        }
+        for number in range(TOKENIZED_MESSAGES)
+    ]
+
+    def run():
+        if batched:
+            tokenizer.count_messages(messages)
+        else:
+            for message in messages:
+                tokenizer.count_message(message)
+        return 1
+
+    return run
+
+
+@benchmark
+def tokens_inline(*_):
+    """Counting the tokens of a very large history one message at a time."""
+
+    return tokenized_history(batched=False)
+
+
+@benchmark
+def tokens_batched(*_):
+    """Counting the tokens of a very large history in a batch on the tokenizer pool."""
+
+    return tokenized_history(batched=True)
+
+
+def markdown_blocks():
+    """Returns a markdown answer of PRINTED_BLOCKS blocks."""
+
+    blocks = []
+    for number in range(PRINTED_BLOCKS):
+        if number % 4 == 0:
+            blocks.append(f"```python\nprint({number})\nvalue = {number} * 2\n```")
+        elif number % 4 == 1:
+            blocks.append(f"- item {number}\n- another item\n- `code` item")
+        else:
+            blocks.append(f"Paragraph {number} with **bold** and `code` words. " * 3)
+    return "\n\n".join(blocks)
+
+
+@benchmark
+def printer_plain(*_):
+    """Printing a long plain answer without the typing effect."""
+
+    printer = PrinterFactory.get_printer("plain", instant=True)
+    text = markdown_blocks()
+
+    def run():
+        # a single print is too short to time on its own
+        for _ in range(1000):
+            printer.print_assistant_message(text)
+        return 1000
+
+    return run
+
+
+@benchmark
+def printer_markdown_stream(*_):
+    """Rendering a streamed markdown answer arriving in small chunks."""
+
+    printer = PrinterFactory.get_printer("markdown", instant=True)
+    text = markdown_blocks()
+    chunks = [text[offset : offset + 8] for offset in range(0, len(text), 8)]
+
+    def run():
+        printer.print_assistant_stream(chunks)
+        return 1
+
+    return run
+
+
+def measure(name: str, server: StandInServer, workdir: str, repeat: int) -> dict:
+    """Runs a benchmark repeat times after a warm up, returns its timings in ms per operation."""
+
+    timings = []
+    for iteration in range(repeat + 1):
+        run = BENCHMARKS[name](server, workdir)
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            operations = run()
+            elapsed = time.perf_counter() - start
+        if iteration:  # the first run warms up imports and caches
+            timings.append(elapsed / operations * 1000)
+
+    timings.sort()
+    return {
+        "median_ms": round(statistics.median(timings), 6),
+        "p95_ms": round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 6),
+    }
+
+
+def read_baselines() -> dict:
+    try:
+        with open(BASELINES_PATH, "r", encoding="utf-8") as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {"benchmarks": {}}
+
+
+@click.command()
+@click.option("--save", is_flag=True, help="Store the results as the new baselines.")
+@click.option("--repeat", type=click.IntRange(min=1), default=10, show_default=True)
+@click.option(
+    "--tolerance",
+    type=float,
+    default=0.25,
+    show_default=True,
+    help="Allowed slowdown of a median against its baseline.",
+)
+@click.option("--only", multiple=True, type=click.Choice(list(BENCHMARKS)))
+def main(save: bool, repeat: int, tolerance: float, only: tuple):
+    """Runs the benchmarks and compares them with the stored baselines."""
+
+    baselines = read_baselines()
+    results = {}
+
+    with StandInServer() as server, tempfile.TemporaryDirectory() as workdir:
+        conversations_path = config.CONVERSATIONS_PATH
+        try:
+            for name in only or BENCHMARKS:
+                results[name] = measure(name, server, workdir, repeat)
+        finally:
+            config.CONVERSATIONS_PATH = conversations_path
+
+    regressions = print_results(results, baselines, tolerance)
+
+    if save:
+        save_baselines(baselines, results)
+    elif regressions:
+        print(
+            f"\nSlower than the baselines by more than {tolerance:.0%}: "
+            + ", ".join(regressions)
+        )
+        sys.exit(1)
+
+
+def print_results(results: dict, baselines: dict, tolerance: float) -> list:
+    """Prints the results next to their baselines, returns the regressed ones."""
+
+    regressions = []
+    print(
+        f"{'benchmark':<26}{'median ms':>12}{'p95 ms':>12}"
+        f"{'baseline':>12}{'change':>10}"
+    )
+    for name, result in results.items():
+        baseline = baselines["benchmarks"].get(name, {}).get("median_ms")
+        change = ""
+        if baseline:
+            ratio = result["median_ms"] / baseline - 1
+            change = f"{ratio:+.0%}"
+            if ratio > tolerance:
+                regressions.append(name)
+                change += " !"
+        print(
+            f"{name:<26}{result['median_ms']:>12.3f}{result['p95_ms']:>12.3f}"
+            f"{baseline or 0:>12.3f}{change:>10}"
+        )
+
+    if "tokens_inline" in results and "tokens_batched" in results:
+        speedup = (
+            results["tokens_inline"]["median_ms"]
+            / results["tokens_batched"]["median_ms"]
+        )
+        print(
+            f"\nBatched tokenization speedup: {speedup:.2f}x "
+            f"({tokenizer_threads()} threads on {os.cpu_count()} CPUs)"
+        )
+    return regressions
+
+
+def save_baselines(baselines: dict, results: dict):
+    """Stores the results as the new baselines, with the machine they ran on."""
+
+    baselines["benchmarks"].update(results)
+    baselines["machine"] = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "processor": platform.machine(),
+        "cpus": os.cpu_count(),
+    }
+    with open(BASELINES_PATH, "w", encoding="utf-8") as file:
+        json.dump(baselines, file, indent=2)
+        file.write("\n")
+    print(f"\nBaselines saved to {BASELINES_PATH}")
+
+
+if __name__ == "__main__":
+    main()  # pylint: disable=no-value-for-parameter
@@ -0,0 +1,6 @@
+"""TerminalGPT - Your Personal Terminal Assistant."""
+
+import time
+
+# Reference point for the startup timing report printed on LOG_LEVEL=DEBUG
+STARTUP_TIME = time.perf_counter()
@@ -0,0 +1,319 @@
+"""Asyncio chat engine on top of AsyncOpenAI.
+
+Runs the turns of a ChatManager (context, cache and compaction stay there) with
+awaited requests, and overlaps the work that does not depend on each other:
+the welcome message is generated and printed while the user types the first
+prompt, and conversation saves (and the title generation they start) run in a
+worker thread while the answer is rendered.
+
+Ctrl-C during a request cancels the request task, which closes its HTTP
+connection instead of leaving the request running in the background.
+"""
+
+import asyncio
+import signal
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Awaitable, Callable, List, Optional, Tuple
+
+from colorama import Back, Fore, Style
+from openai import AsyncOpenAI
+from prompt_toolkit import PromptSession
+from prompt_toolkit.patch_stdout import patch_stdout
+
+from terminalgpt import config
+from terminalgpt.chat import STREAM_OPTIONS, ChatManager, waiting
+from terminalgpt.conversations import ConversationManager
+from terminalgpt.printer import Printer, PrintUtils
+from terminalgpt.profiling import PROFILER, span
+
+if TYPE_CHECKING:
+    from terminalgpt.cache import ResponseCache
+    from terminalgpt.transport import HttpTransport
+
+
+class AsyncChatManager:
+    """Drives a ChatManager's context with non-blocking requests."""
+
+    def __init__(self, **kwargs):
+        self.__chat: ChatManager = kwargs["chat_manager"]
+        self.__convers_manager: ConversationManager = kwargs["conversations_manager"]
+        self.__session: PromptSession = kwargs["session"]
+        self.__model = kwargs["model"]
+        self.__printer: Printer = kwargs["printer"]
+        self.__client: AsyncOpenAI = kwargs.get("client", None)
+        self.__stream: bool = kwargs.get("stream", False)
+        self.__transport: Optional["HttpTransport"] = kwargs.get("transport", None)
+        self.__saver = ThreadPoolExecutor(max_workers=1, thread_name_prefix="save")
+        self.__saves: List[asyncio.Future] = []
+        self.__interrupted = False
+        self.__welcome: Optional[asyncio.Task] = None
+
+    @property
+    def client(self):
+        return self.__client
+
+    @client.setter
+    def client(self, client: AsyncOpenAI):
+        self.__client = client
+
+    @property
+    def stream(self) -> bool:
+        return self.__stream
+
+    @stream.setter
+    def stream(self, stream: bool):
+        self.__stream = stream
+
+    async def chat_loop(
+        self,
+        welcome_messages: Optional[list] = None,
+        on_welcome: Optional[Callable[[str], None]] = None,
+    ):
+        """Main chat loop, greets the user with welcome_messages while they type.
+
+        on_welcome is called with the welcome message once it was generated.
+        """
+        if self.__transport is not None:
+            # connect while the user types the first prompt
+            self.__transport.prewarm_async(self.__client.base_url)
+        discard_welcome = self.welcome_in_background(welcome_messages, on_welcome)
+
+        try:
+            while True:
+                # Print the breakdown of the previous turn, on --profile
+                PROFILER.end_turn()
+
+                with patch_stdout(raw=True):
+                    user_input = await self.__session.prompt_async()
+                PROFILER.begin_turn()
+
+                if discard_welcome is not None:
+                    # the user did not wait for the welcome message
+                    discard_welcome()
+                    discard_welcome = None
+                self.__printer.printt()
+
+                messages = self.__chat.begin_turn(user_input)
+                try:
+                    message, interrupted = await self.__interruptible(
+                        self.answer(messages)
+                    )
+                except (KeyboardInterrupt, Exception) as error:
+                    self.__chat.print_turn_error(error)
+                    continue
+                self.__chat.end_turn(message, interrupted)
+
+                # Save in the background while the answer is rendered
+                self.save_context()
+
+                self.__chat.print_turn(message, interrupted)
+                if user_input == "exit" and not interrupted:
+                    return
+        finally:
+            await self.wait_for_saves()
+            if self.__welcome is not None and on_welcome is None:
+                # nothing keeps a welcome that is still being generated
+                self.__welcome.cancel()
+            elif self.__welcome is not None:
+                # a welcome still being generated is cached before exiting
+                await asyncio.wait(
+                    [self.__welcome], timeout=config.SYSTEM_ANSWER_TIMEOUT
+                )
+            # waits for a title still being generated and writes the index updates
+            await asyncio.to_thread(
+                self.__convers_manager.close, config.SYSTEM_ANSWER_TIMEOUT
+            )
+
+    async def one_shot(self, messages: list, cache: Optional["ResponseCache"] = None):
+        """Answers a single question, Ctrl-C cancels the request."""
+
+        try:
+            message, _ = await self.__interruptible(self.answer(messages, cache))
+        except KeyboardInterrupt:
+            self.__printer.print_assistant_message(
+                PrintUtils.choose_random_message(PrintUtils.STOPPED_MESSAGES),
+                color=Fore.YELLOW + Style.RESET_ALL,
+            )
+            return
+
+        if not self.__stream:
+            if cache is not None and cache.last_hit:
+                self.__printer.typewriter.instant = True
+            self.__printer.print_assistant_message(message)
+
+    def welcome_in_background(
+        self,
+        messages: Optional[list],
+        on_welcome: Optional[Callable[[str], None]] = None,
+    ) -> Optional[Callable[[], None]]:
+        """Requests the welcome message in a task and prints it when it arrives.
+
+        Returns a function to call once the user sent a message, a welcome
+        that did not arrive by then is never printed, or None without messages.
+        on_welcome is called with the generated welcome message, printed or not.
+        """
+        if not messages:
+            return None
+
+        print()
+        discarded = False
+
+        async def welcome():
+            try:
+                answer = await self.get_user_answer(messages, spinner=False)
+            except Exception as error:  # pylint: disable=broad-except
+                answer = error
+            message, color = self.__chat.welcome_arrived(answer, on_welcome)
+            if not discarded:
+                # the typewriter sleeps between characters, keep the loop free
+                await asyncio.to_thread(
+                    self.__printer.print_assistant_message, message, color=color
+                )
+
+        def discard():
+            nonlocal discarded
+            discarded = True
+
+        self.__welcome = asyncio.create_task(welcome())
+        return discard
+
+    async def answer(
+        self, messages: list, cache: Optional["ResponseCache"] = None
+    ) -> Tuple[str, bool]:
+        """Returns the answer and whether it was interrupted, streamed into the printer if stream is set."""
+
+        if self.__stream:
+            return await self.stream_user_answer(messages)
+
+        answer = await self.get_user_answer(messages, cache=cache)
+
+        # Parse total_usage from answer
+        self.__chat.total_usage = answer.usage.total_tokens
+        return answer.choices[0].message.content, False
+
+    async def get_user_answer(
+        self,
+        messages: list,
+        stream: bool = False,
+        spinner: bool = True,
+        cache: Optional["ResponseCache"] = None,
+    ):
+        """Returns the answer from OpenAI API, or a chunks stream when stream is set.
+
+        With a cache, a cached answer is returned without a request, and a new
+        answer is cached. Streams are never cached.
+        """
+        if stream:
+            return await self.__request_answer(messages, spinner, **STREAM_OPTIONS)
+
+        answer = self.__chat.cached_answer(messages, cache)
+        if answer is not None:
+            return answer
+
+        request = time.perf_counter(), self.__chat.retry_scheduler.retries
+        answer = await self.__request_answer(messages, spinner)
+        self.__chat.answered(messages, answer, cache, request)
+        return answer
+
+    async def __request_answer(self, messages: list, spinner: bool, **kwargs):
+        """Requests an answer from OpenAI API, showing a spinner if spinner is set."""
+
+        def request():
+            return self.__client.chat.completions.create(
+                model=self.__model, messages=messages, **kwargs
+            )
+
+        def trim_context():
+            return self.__chat.trim_context(messages)
+
+        with span("request"), waiting(spinner):
+            return await self.__chat.retry_scheduler.acall(request, trim_context)
+
+    async def stream_user_answer(
+        self, messages: list, spinner: bool = True
+    ) -> Tuple[str, bool]:
+        """Streams the answer from OpenAI API straight into the printer.
+
+        Returns the answer and whether it was interrupted with Ctrl-C, in which
+        case the answer is only the part received so far.
+        """
+        start, retries = time.perf_counter(), self.__chat.retry_scheduler.retries
+        stream = await self.get_user_answer(messages, stream=True, spinner=spinner)
+        parts = []
+        usage, ttft = None, None
+
+        print(Style.BRIGHT + "Assistant:" + Style.RESET_ALL)
+        printer_stream = self.__printer.open_stream()
+        try:
+            async for chunk in stream:
+                if chunk.usage:
+                    usage = chunk.usage
+                    self.__chat.total_usage = chunk.usage.total_tokens
+                if chunk.choices and chunk.choices[0].delta.content:
+                    if ttft is None:
+                        ttft = time.perf_counter() - start
+                    parts.append(chunk.choices[0].delta.content)
+                    printer_stream.feed(chunk.choices[0].delta.content)
+        except asyncio.CancelledError:
+            if not self.__interrupted:
+                raise
+            return "".join(parts), True
+        finally:
+            printer_stream.close()
+            await stream.close()
+
+        self.__chat.record_metrics(usage, start, retries, ttft)
+        return "".join(parts), False
+
+    def save_context(self) -> asyncio.Future:
+        """Saves the context in the save worker thread, saves run one after another."""
+
+        future = asyncio.get_running_loop().run_in_executor(
+            self.__saver,
+            self.__convers_manager.save_context,
+            list(self.__chat.messages),
+            self.__chat.total_usage,
+            self.__chat.token_limit,
+        )
+        self.__saves.append(future)
+        return future
+
+    async def wait_for_saves(self):
+        """Waits for the pending saves and prints their errors."""
+
+        saves, self.__saves = self.__saves, []
+        for result in await asyncio.gather(*saves, return_exceptions=True):
+            if isinstance(result, Exception):
+                self.__printer.print_assistant_message(
+                    str(result), color=Back.RED + Style.BRIGHT
+                )
+
+    async def __interruptible(self, awaitable: Awaitable):
+        """Awaits in a task that Ctrl-C cancels, raising KeyboardInterrupt when it does."""
+
+        loop = asyncio.get_running_loop()
+        task = asyncio.ensure_future(awaitable)
+
+        def interrupt():
+            self.__interrupted = True
+            task.cancel()
+
+        previous_handler = signal.getsignal(signal.SIGINT)
+        try:
+            loop.add_signal_handler(signal.SIGINT, interrupt)
+        except (NotImplementedError, RuntimeError):
+            # no loop signal handlers here, Ctrl-C stops the loop
+            previous_handler = None
+
+        self.__interrupted = False
+        try:
+            return await task
+        except asyncio.CancelledError:
+            if not self.__interrupted:
+                raise
+            raise KeyboardInterrupt from None
+        finally:
+            if previous_handler is not None:
+                loop.remove_signal_handler(signal.SIGINT)
+                signal.signal(signal.SIGINT, previous_handler)
@@ -0,0 +1,153 @@
+"""Concurrent one shot answers for many prompts.
+
+Prompts are read one per line, either as plain text or as JSON objects with a
+"prompt" key (and an optional "id"). They are answered by a pool of threads
+sharing one client, so its connections are reused, and written back as JSON
+lines in input order or in completion order.
+"""
+
+import json
+import sys
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from typing import IO, Iterable, Iterator, List, Optional
+
+import openai
+from colorama import Fore, Style
+from openai import OpenAI
+
+from terminalgpt import config
+from terminalgpt.metrics import MetricsStore, percentile
+from terminalgpt.retry import RetryScheduler
+
+
+def read_prompts(lines: Iterable[str]) -> List[dict]:
+    """Parses the prompts lines, blank lines are skipped."""
+
+    prompts = []
+    for number, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line:
+            continue
+
+        if line.startswith("{"):
+            try:
+                prompt = json.loads(line)
+            except json.JSONDecodeError as error:
+                raise ValueError(f"line {number}: {error}") from error
+            if not isinstance(prompt.get("prompt"), str):
+                raise ValueError(f'line {number}: missing a "prompt" string')
+        else:
+            prompt = {"prompt": line}
+
+        prompt.setdefault("id", len(prompts))
+        prompts.append(prompt)
+
+    return prompts
+
+
+class BatchRunner:
+    """Answers prompts with bounded concurrency over one shared client."""
+
+    def __init__(self, **kwargs):
+        self.__client: OpenAI = kwargs["client"]
+        self.__model: str = kwargs["model"]
+        self.__concurrency: int = kwargs.get("concurrency", config.BATCH_CONCURRENCY)
+        self.__order: str = kwargs.get("order", "input")
+        self.__metrics: Optional[MetricsStore] = kwargs.get("metrics", None)
+
+    def answer(self, prompt: dict) -> dict:
+        """Returns the result record of a single prompt, with its error if it failed."""
+
+        messages = [
+            config.INIT_SYSTEM_MESSAGE,
+            {"role": "user", "content": prompt["prompt"]},
+        ]
+        result = {"id": prompt["id"], "prompt": prompt["prompt"]}
+        retry_scheduler = RetryScheduler()
+
+        start = time.perf_counter()
+        try:
+            answer = retry_scheduler.call(
+                lambda: self.__client.chat.completions.create(
+                    model=self.__model, messages=messages
+                )
+            )
+            result["answer"] = answer.choices[0].message.content
+            result["tokens"] = answer.usage.total_tokens if answer.usage else 0
+            if self.__metrics is not None and answer.usage:
+                self.__metrics.record(
+                    model=self.__model,
+                    prompt_tokens=answer.usage.prompt_tokens,
+                    completion_tokens=answer.usage.completion_tokens,
+                    latency=time.perf_counter() - start,
+                    retries=retry_scheduler.retries,
+                )
+        except openai.OpenAIError as error:
+            result["error"] = str(error)
+            result["tokens"] = 0
+
+        result["latency"] = round(time.perf_counter() - start, 3)
+        result["retries"] = retry_scheduler.retries
+        return result
+
+    def results(self, prompts: List[dict]) -> Iterator[dict]:
+        """Yields the result records, in input order or as they complete."""
+
+        with ThreadPoolExecutor(
+            max_workers=self.__concurrency, thread_name_prefix="batch"
+        ) as executor:
+            futures: List[Future] = [
+                executor.submit(self.answer, prompt) for prompt in prompts
+            ]
+            if self.__order == "completion":
+                futures = as_completed(futures)
+            for future in futures:
+                yield future.result()
+
+    def run(self, prompts: List[dict], output: IO[str]) -> dict:
+        """Writes the result records of prompts to output as JSON lines, returns a report."""
+
+        latencies = []
+        tokens = errors = retries = 0
+
+        start = time.perf_counter()
+        for result in self.results(prompts):
+            output.write(json.dumps(result, ensure_ascii=False) + "\n")
+            output.flush()
+
+            latencies.append(result["latency"])
+            tokens += result["tokens"]
+            retries += result["retries"]
+            errors += "error" in result
+        elapsed = time.perf_counter() - start
+
+        return {
+            "prompts": len(prompts),
+            "errors": errors,
+            "retries": retries,
+            "elapsed": elapsed,
+            "throughput": len(prompts) / elapsed if elapsed else 0.0,
+            "p50": percentile(latencies, 50),
+            "p95": percentile(latencies, 95),
+            "tokens": tokens,
+        }
+
+
+def print_report(report: dict):
+    """Prints a batch report, to stderr so it stays out of the results."""
+
+    print(
+        Style.BRIGHT
+        + f"\n{report['prompts']} prompts in {report['elapsed']:.2f}s "
+        + f"({report['throughput']:.2f} prompts/s)"
+        + Style.RESET_ALL
+        + f"\nLatency p50: {report['p50']:.3f}s p95: {report['p95']:.3f}s"
+        + f"\nTotal tokens: {report['tokens']} Retries: {report['retries']}"
+        + (
+            Fore.RED + f"\nErrors: {report['errors']}" + Style.RESET_ALL
+            if report["errors"]
+            else ""
+        ),
+        file=sys.stderr,
+    )
@@ -0,0 +1,175 @@
+"""On-disk cache of one shot answers.
+
+Every entry is a JSON file named after the sha256 of the model and the request
+messages, holding the answer and its creation time. Entries expire after a TTL,
+and the least recently used ones (by file mtime, touched on every hit) are
+evicted when the cache grows past its size limit. Hit and miss counts are kept
+in the .stats.json file of the cache directory.
+"""
+
+import hashlib
+import json
+import os
+import time
+
+from colorama import Fore, Style
+
+from terminalgpt import config
+
+STATS_FILE = ".stats.json"
+
+
+class ResponseCache:
+    """Content addressed cache of chat completions."""
+
+    def __init__(self, **kwargs):
+        self.__path: str = kwargs.get("path", config.CACHE_PATH)
+        self.__ttl: float = kwargs.get("ttl", config.CACHE_TTL)
+        self.__max_bytes: int = kwargs.get("max_bytes", config.CACHE_MAX_BYTES)
+        self.__last_hit = False
+
+    @property
+    def last_hit(self) -> bool:
+        """Returns True if the last lookup was answered from the cache."""
+        return self.__last_hit
+
+    @staticmethod
+    def key(model: str, messages: list) -> str:
+        """Returns the cache key of a request."""
+
+        request = json.dumps({"model": model, "messages": messages}, sort_keys=True)
+        return hashlib.sha256(request.encode("utf-8")).hexdigest()
+
+    def get(self, model: str, messages: list):
+        """Returns the cached answer of a request, or None on a miss."""
+
+        # pylint: disable-next=import-outside-toplevel
+        from openai.types.chat import ChatCompletion
+
+        path = self.__entry_path(self.key(model, messages))
+        answer = None
+        try:
+            with open(path, "r", encoding="utf-8") as file:
+                entry = json.load(file)
+            if time.time() - entry["created"] < self.__ttl:
+                answer = ChatCompletion.model_validate(entry["answer"])
+                os.utime(path)  # most recently used
+            else:
+                os.remove(path)
+        except (OSError, ValueError, KeyError):
+            answer = None
+
+        self.__last_hit = answer is not None
+        self.__count("hits" if self.__last_hit else "misses")
+        return answer
+
+    def put(self, model: str, messages: list, answer):
+        """Caches the answer of a request, evicting the least recently used entries if needed.
+
+        A cache that cannot be written is skipped, the answer was already given.
+        """
+
+        try:
+            os.makedirs(self.__path, exist_ok=True)
+            self.__write_json(
+                self.__entry_path(self.key(model, messages)),
+                {"created": time.time(), "answer": answer.model_dump(mode="json")},
+            )
+            self.evict()
+        except OSError as error:
+            if os.environ.get("LOG_LEVEL") == "DEBUG":
+                print(
+                    Fore.LIGHTRED_EX + f"Cache write failed: {error}" + Style.RESET_ALL
+                )
+
+    def evict(self) -> int:
+        """Removes the expired entries and the least recently used ones past the size limit.
+
+        Returns the number of removed entries.
+        """
+        now = time.time()
+        entries = []
+        removed = 0
+        for entry in self.__entries():
+            stat = entry.stat()
+            # an entry is never touched more than the ttl after its creation,
+            # so one unused for longer has expired
+            if now - stat.st_mtime >= self.__ttl:
+                removed += self.__remove(entry.path)
+            else:
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        size = sum(entry_size for _, entry_size, _ in entries)
+        for _, entry_size, path in sorted(entries):
+            if size <= self.__max_bytes:
+                break
+            removed += self.__remove(path)
+            size -= entry_size
+
+        return removed
+
+    def clear(self) -> int:
+        """Removes all the entries and statistics, returns the number of removed entries."""
+
+        removed = sum(self.__remove(entry.path) for entry in self.__entries())
+        self.__remove(os.path.join(self.__path, STATS_FILE))
+        return removed
+
+    def stats(self) -> dict:
+        """Returns the number and size of the entries, and the hit and miss counts."""
+
+        entries = [entry.stat().st_size for entry in self.__entries()]
+        stats = {"entries": len(entries), "size": sum(entries), "hits": 0, "misses": 0}
+        stats.update(self.__read_stats())
+        return stats
+
+    def __entry_path(self, key: str) -> str:
+        return os.path.join(self.__path, f"{key}.json")
+
+    def __entries(self):
+        """Yields the dir entries of the cached answers."""
+
+        try:
+            with os.scandir(self.__path) as entries:
+                for entry in entries:
+                    if entry.name.endswith(".json") and not entry.name.startswith("."):
+                        yield entry
+        except FileNotFoundError:
+            pass
+
+    def __remove(self, path: str) -> int:
+        try:
+            os.remove(path)
+            return 1
+        except FileNotFoundError:
+            return 0
+
+    def __read_stats(self) -> dict:
+        try:
+            with open(
+                os.path.join(self.__path, STATS_FILE), "r", encoding="utf-8"
+            ) as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+    def __count(self, counter: str):
+        """Increments a statistics counter, a lost update between processes is fine."""
+
+        stats = self.__read_stats()
+        stats[counter] = stats.get(counter, 0) + 1
+        try:
+            os.makedirs(self.__path, exist_ok=True)
+            self.__write_json(os.path.join(self.__path, STATS_FILE), stats)
+        except OSError:
+            pass
+
+    def __write_json(self, path: str, data: dict):
+        """Writes a JSON file atomically, readers never see a partial file."""
+
+        temp_path = os.path.join(
+            os.path.dirname(path), f".{os.path.basename(path)}.{os.getpid()}.tmp"
+        )
+        with open(temp_path, "w", encoding="utf-8") as file:
+            json.dump(data, file)
+        os.replace(temp_path, path)
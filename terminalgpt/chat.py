@@ -1,31 +1,68 @@
 import os
 import sys
+import threading
 import time
+from contextlib import nullcontext
+from typing import TYPE_CHECKING, Callable, Optional, Tuple
 
-import openai
-import tiktoken
 from colorama import Back, Fore, Style
 from openai import OpenAI
 from prompt_toolkit import PromptSession
-from tiktoken.core import Encoding
+from prompt_toolkit.patch_stdout import patch_stdout
 from yaspin import yaspin
 from yaspin.spinners import Spinners
 
 from terminalgpt import config
-from terminalgpt.conversations import ConversationManager
+from terminalgpt.conversations import ConversationManager, is_summary
+from terminalgpt.models import get_encoder
 from terminalgpt.printer import Printer, PrintUtils
+from terminalgpt.profiling import PROFILER, profiled, span
+from terminalgpt.retrieval import MessageIndex
+from terminalgpt.retry import RetryScheduler
+from terminalgpt.tokens import REPLY_PRIMING, Tokenizer, TokenLedger, plan_truncation
 
+if TYPE_CHECKING:
+    from terminalgpt.cache import ResponseCache
+    from terminalgpt.metrics import MetricsStore
 
-class ChatManager:
+# request arguments of a streamed answer, with the usage in its last chunk
+STREAM_OPTIONS = {"stream": True, "stream_options": {"include_usage": True}}
+
+
+def waiting(spinner: bool = True):
+    """Returns the spinner shown while waiting for an answer, if spinner is set."""
+
+    if not spinner:
+        return nullcontext()
+    return yaspin(
+        Spinners.earth,
+        text=Style.BRIGHT + "Assistant:" + Style.RESET_ALL,
+        color="blue",
+        side="right",
+    )
+
+
+class ChatManager:  # pylint: disable=too-many-public-methods
     def __init__(self, **kwargs):
-        self.__tiktoken_encoder: Encoding = tiktoken.get_encoding(config.ENCODING_MODEL)
+        self.__tokenizer: Tokenizer = kwargs.get("tokenizer") or Tokenizer(
+            get_encoder(kwargs["model"])
+        )
         self.__convers_manager: ConversationManager = kwargs["conversations_manager"]
         self.__session: PromptSession = kwargs["session"]
         self.__messages: list = kwargs["messages"]
+        self.__ledger = TokenLedger(self.__tokenizer, self.__messages)
         self.__model = kwargs["model"]
         self.__printer: Printer = kwargs["printer"]
         self.__token_limit: int = kwargs["token_limit"]
         self.__client: OpenAI = kwargs.get("client", None)
+        self.__stream: bool = kwargs.get("stream", False)
+        self.__retry_scheduler: RetryScheduler = kwargs.get(
+            "retry_scheduler", RetryScheduler()
+        )
+        self.__metrics: Optional["MetricsStore"] = kwargs.get("metrics", None)
+        self.__compaction: str = kwargs.get("compaction", "truncate")
+        self.__context: str = kwargs.get("context", "recent")
+        self.__index = MessageIndex()
         self.__total_usage = 0
 
     @property
@@ -35,6 +72,7 @@ class ChatManager:
     @messages.setter
     def messages(self, messages: list):
         self.__messages = messages
+        self.__ledger.reset(messages)
 
     @property
     def token_limit(self) -> int:
@@ -52,6 +90,42 @@ class ChatManager:
     def total_usage(self, total_usage: int):
         self.__total_usage = total_usage
 
+    @property
+    def stream(self) -> bool:
+        return self.__stream
+
+    @stream.setter
+    def stream(self, stream: bool):
+        self.__stream = stream
+
+    @property
+    def compaction(self) -> str:
+        return self.__compaction
+
+    @compaction.setter
+    def compaction(self, compaction: str):
+        self.__compaction = compaction
+
+    @property
+    def context(self) -> str:
+        return self.__context
+
+    @context.setter
+    def context(self, context: str):
+        self.__context = context
+
+    @property
+    def retry_scheduler(self) -> RetryScheduler:
+        return self.__retry_scheduler
+
+    @property
+    def metrics(self) -> Optional["MetricsStore"]:
+        return self.__metrics
+
+    @metrics.setter
+    def metrics(self, metrics: Optional["MetricsStore"]):
+        self.__metrics = metrics
+
     @property
     def client(self):
         return self.__client
@@ -60,7 +134,7 @@ class ChatManager:
     def client(self, client: OpenAI):
         self.__client = client
 
-    def __print_usage(self):
+    def print_usage(self):
         """Prints the total usage"""
         print(
             Fore.LIGHTBLUE_EX
@@ -72,145 +146,548 @@ class ChatManager:
             + f"Counter Total Usage: {str(self.num_tokens_from_messages())} tokens"
             + Style.RESET_ALL
         )
+        print(
+            Fore.LIGHTMAGENTA_EX
+            + f"API Retries: {self.__retry_scheduler.retries} "
+            + f"(waited {self.__retry_scheduler.waited:.1f}s)"
+            + Style.RESET_ALL
+        )
 
-    def chat_loop(self):
-        """Main chat loop."""
-
-        while True:
-            # flush stdin
-            sys.stdin.flush()
+    def append_message(self, message: dict):
+        """Appends a message to the context and counts its tokens."""
+        self.__messages.append(message)
+        self.__ledger.append(message)
+        if self.__context == "relevant":
+            self.__index.add(message)
+
+    def pop_message(self, index: int = -1) -> dict:
+        """Removes a message from the context and forgets its tokens."""
+        self.__ledger.pop(index)
+        return self.__messages.pop(index)
+
+    def trim_context(self, messages: list) -> bool:
+        """Drops the oldest message after the first one and the summary.
+
+        Called when the request is too long. A list chosen by select_context
+        loses its least relevant message instead, the context itself is kept.
+        Returns False if messages is another list or there is nothing left to drop.
+        """
+        if messages is not self.__messages:
+            return self.__context == "relevant" and self.__trim_selected(messages)
+
+        first = self.__first_turn()
+        if len(messages) <= first + 1:
+            return False
+        self.pop_message(first)
+        return True
+
+    def __trim_selected(self, messages: list) -> bool:
+        """Drops the selected message scoring the lowest against the question."""
+
+        # the system messages and the question itself always go
+        candidates = [
+            position
+            for position, message in enumerate(messages[:-1])
+            if message.get("role") != "system"
+        ]
+        if not candidates:
+            return False
+
+        self.__index.sync(self.__messages)
+        question = str(messages[-1].get("content") or "")
+        scores = self.__index.scores(
+            question, [messages[position] for position in candidates]
+        )
+        # the oldest of the lowest scores goes first
+        _, drop = min(zip(scores, candidates))
+        del messages[drop]
+        return True
+
+    def chat_loop(
+        self,
+        welcome_messages: Optional[list] = None,
+        on_welcome: Optional[Callable[[str], None]] = None,
+    ):
+        """Main chat loop, greets the user with welcome_messages while they type.
+
+        on_welcome is called with the welcome message once it was generated.
+        """
+        discard_welcome = self.welcome_in_background(welcome_messages, on_welcome)
 
-            # Get user input
-            user_input = self.__session.prompt()
-            self.__printer.printt()
+        try:
+            while True:
+                # flush stdin
+                sys.stdin.flush()
+
+                # Print the breakdown of the previous turn, on --profile
+                PROFILER.end_turn()
+
+                # Get user input, a pending welcome message is printed above the prompt
+                with patch_stdout(raw=True) if discard_welcome else nullcontext():
+                    user_input = self.__session.prompt()
+                    if discard_welcome is not None:
+                        # the user did not wait for the welcome message
+                        discard_welcome()
+                        discard_welcome = None
+                PROFILER.begin_turn()
+                self.__printer.printt()
+
+                messages = self.begin_turn(user_input)
+                try:
+                    message, interrupted = self.answer(messages)
+                except (KeyboardInterrupt, Exception) as error:
+                    self.print_turn_error(error)
+                    continue
+                self.end_turn(message, interrupted)
+
+                # Save context or wait for some context
+                self.__convers_manager.save_context(
+                    self.__messages, self.__total_usage, self.__token_limit
+                )
 
-            # Append to messages and send to ChatGPT
-            self.__messages.append({"role": "user", "content": user_input})
+                self.print_turn(message, interrupted)
+                if user_input == "exit" and not interrupted:
+                    sys.exit()
+        finally:
+            # waits for a title still being generated and writes the index updates
+            self.__convers_manager.close(config.SYSTEM_ANSWER_TIMEOUT)
+
+    def begin_turn(self, user_input: str) -> list:
+        """Adds the user message, returns the messages to send for it.
+
+        The context is compacted, or the messages selected from it, to stay
+        under the token limit.
+        """
+        self.append_message({"role": "user", "content": user_input})
+        self.__total_usage = self.num_tokens_from_messages()
+        return self.prepare_context()
+
+    def end_turn(self, message: str, interrupted: bool):
+        """Adds the answer, a stopped stream keeps the part received so far."""
+
+        if message:
+            self.append_message({"role": "assistant", "content": message})
+        if interrupted:
             self.__total_usage = self.num_tokens_from_messages()
 
-            # Prevent reaching tokens limit
-            if self.exceeding_token_limit():
-                self.reduce_tokens()
+    def print_turn(self, message: str, interrupted: bool):
+        """Prints the answer of a turn, a streamed one is already printed."""
 
-            # Get answer
-            try:
-                answer = self.get_user_answer(self.__messages)
-            except KeyboardInterrupt:
-                self.__printer.print_assistant_message(
-                    PrintUtils.choose_random_message(
-                        PrintUtils.STOPPED_CONTINUE_MESSAGES
-                    )
-                )
-                continue
-            except Exception as error:
-                self.__printer.print_assistant_message(
-                    str(error), color=Back.RED + Style.BRIGHT
-                )
-                continue
+        if interrupted:
+            self.__printer.printt(
+                PrintUtils.choose_random_message(PrintUtils.STOPPED_CONTINUE_MESSAGES)
+            )
+            return
 
-            # Parse total_usage and message from answer
-            self.__total_usage = answer.usage.total_tokens
+        if not self.__stream:
+            self.__printer.print_assistant_message(message)
 
-            message = answer.choices[0].message.content
+        # Print usage
+        if os.environ.get("LOG_LEVEL") == "DEBUG":
+            self.print_usage()
 
-            # Append to messages list for next iteration keeping context
-            self.__messages.append({"role": "assistant", "content": message})
+    def print_turn_error(self, error: BaseException):
+        """Prints why a turn got no answer, Ctrl-C or a failed request."""
 
-            # Save context or wait for some context
-            self.__convers_manager.save_context(
-                self.__messages, self.__total_usage, self.__token_limit
+        if isinstance(error, KeyboardInterrupt):
+            self.__printer.print_assistant_message(
+                PrintUtils.choose_random_message(PrintUtils.STOPPED_CONTINUE_MESSAGES)
+            )
+        else:
+            self.__printer.print_assistant_message(
+                str(error), color=Back.RED + Style.BRIGHT
             )
 
-            # Print answer message
-            self.__printer.print_assistant_message(message)
-
-            # Print usage
-            if os.environ.get("LOG_LEVEL") == "DEBUG":
-                self.__print_usage()
+    def answer(self, messages: list) -> Tuple[str, bool]:
+        """Returns the answer and whether it was interrupted, streamed into the printer if stream is set."""
+
+        if self.__stream:
+            return self.stream_user_answer(messages)
+
+        answer = self.get_user_answer(messages)
+
+        # Parse total_usage from answer
+        self.__total_usage = answer.usage.total_tokens
+        return answer.choices[0].message.content, False
+
+    def cached_answer(self, messages: list, cache: Optional["ResponseCache"]):
+        """Returns the cached answer of messages, if there is a cache and one."""
+
+        if cache is None:
+            return None
+        return cache.get(self.__model, messages)
+
+    def answered(
+        self,
+        messages: list,
+        answer,
+        cache: Optional["ResponseCache"],
+        request: Tuple[float, int],
+    ):
+        """Records a new answer in the metrics and caches it, if there is a cache.
+
+        request is the perf_counter time the request was sent at and the retry
+        scheduler count before it.
+        """
+        self.record_metrics(answer.usage, *request)
+        if cache is not None:
+            cache.put(self.__model, messages, answer)
+
+    def get_user_answer(
+        self,
+        messages: list,
+        stream: bool = False,
+        cache: Optional["ResponseCache"] = None,
+        spinner: bool = True,
+    ):
+        """Returns the answer from OpenAI API, or a chunks stream when stream is set.
+
+        With a cache, a cached answer is returned without a request, and a new
+        answer is cached. Streams are never cached.
+        """
+        if stream:
+            return self.__request_answer(messages, spinner, **STREAM_OPTIONS)
+
+        answer = self.cached_answer(messages, cache)
+        if answer is not None:
+            return answer
+
+        request = time.perf_counter(), self.__retry_scheduler.retries
+        answer = self.__request_answer(messages, spinner)
+        self.answered(messages, answer, cache, request)
+        return answer
+
+    def __request_answer(self, messages: list, spinner: bool = True, **kwargs):
+        """Requests an answer from OpenAI API, showing a spinner if spinner is set."""
+
+        with span("request"), waiting(spinner):
+            return self.__retry_scheduler.call(
+                lambda: self.__client.chat.completions.create(
+                    model=self.__model, messages=messages, **kwargs
+                ),
+                trim_context=lambda: self.trim_context(messages),
+            )
 
-            if user_input == "exit":
-                sys.exit()
+    def stream_user_answer(self, messages: list) -> Tuple[str, bool]:
+        """Streams the answer from OpenAI API straight into the printer.
+
+        Returns the answer and whether it was interrupted with Ctrl-C, in which
+        case the answer is only the part received so far.
+        """
+        start, retries = time.perf_counter(), self.__retry_scheduler.retries
+        stream = self.get_user_answer(messages, stream=True)
+        parts = []
+        usage, ttft = None, None
+
+        def deltas():
+            nonlocal usage, ttft
+            for chunk in stream:
+                if chunk.usage:
+                    usage = chunk.usage
+                    self.__total_usage = chunk.usage.total_tokens
+                if chunk.choices and chunk.choices[0].delta.content:
+                    if ttft is None:
+                        ttft = time.perf_counter() - start
+                    parts.append(chunk.choices[0].delta.content)
+                    yield chunk.choices[0].delta.content
 
-    def get_user_answer(self, messages: list):
-        """Returns the answer from OpenAI API."""
-        while True:
-            try:
-                with yaspin(
-                    Spinners.earth,
-                    text=Style.BRIGHT + "Assistant:" + Style.RESET_ALL,
-                    color="blue",
-                    side="right",
-                ):
-                    return self.__client.chat.completions.create(
-                        model=self.__model, messages=messages
-                    )
-            except openai.RateLimitError:
-                self.__messages.pop(1)
-                time.sleep(0.5)
+        try:
+            self.__printer.print_assistant_stream(deltas())
+        except KeyboardInterrupt:
+            stream.close()
+            return "".join(parts), True
+
+        self.record_metrics(usage, start, retries, ttft)
+        return "".join(parts), False
+
+    def record_metrics(
+        self, usage, start: float, retries: int, ttft: Optional[float] = None
+    ):
+        """Records an answered request in the metrics store, if there is one.
+
+        start is the perf_counter time the request was sent at, retries the
+        retry scheduler count before it and ttft the time to the first streamed
+        token. Answers without usage are not recorded.
+        """
+        if self.__metrics is None or usage is None:
+            return
+
+        latency = time.perf_counter() - start
+        self.__metrics.record(
+            model=self.__model,
+            prompt_tokens=usage.prompt_tokens,
+            completion_tokens=usage.completion_tokens,
+            latency=latency,
+            ttft=latency if ttft is None else ttft,
+            retries=self.__retry_scheduler.retries - retries,
+        )
 
     def exceeding_token_limit(self):
         """Returns True if the total_usage is greater than the token limit with some safe buffer."""
         return self.__total_usage > self.__token_limit
 
+    def prepare_context(self) -> list:
+        """Returns the messages to send for the last question, under the token limit.
+
+        With the relevant context the messages are selected from the whole
+        conversation, otherwise the context itself is compacted when needed.
+        """
+        if self.__context == "relevant":
+            return self.select_context()
+
+        if self.exceeding_token_limit():
+            self.fit_context()
+        return self.__messages
+
+    @profiled("select")
+    def select_context(self, budget: Optional[int] = None) -> list:
+        """Selects the messages most worth sending for the last question.
+
+        Returns the first message and the summary, the most relevant older
+        messages (BM25 against the last message) and the config.CONTEXT_RECENT_MESSAGES
+        last ones, in conversation order and within budget tokens (the token
+        limit by default). The older messages are picked best first, at most
+        config.CONTEXT_RELEVANT_MESSAGES of them.
+        """
+        budget = budget or self.__token_limit
+        counts = self.__ledger.counts
+        if len(counts) != len(self.__messages):
+            self.__ledger.reset(self.__messages)
+            counts = self.__ledger.counts
+
+        first = self.__first_turn()
+        if len(self.__messages) <= first:
+            return self.__messages
+
+        # the last message always goes, then the recent ones that fit, newest first
+        recent = len(self.__messages) - 1
+        used = sum(counts[:first]) + counts[recent] - REPLY_PRIMING
+        while (
+            recent > first
+            and len(self.__messages) - recent < config.CONTEXT_RECENT_MESSAGES
+            and used + counts[recent - 1] <= budget
+        ):
+            recent -= 1
+            used += counts[recent]
+
+        self.__index.sync(self.__messages)
+        selected = []
+        question = str(self.__messages[-1].get("content") or "")
+        for position in self.__index.search(
+            question, self.__messages[first:recent], config.CONTEXT_RELEVANT_MESSAGES
+        ):
+            if used + counts[first + position] <= budget:
+                selected.append(first + position)
+                used += counts[first + position]
+
+        return (
+            self.__messages[:first]
+            + [self.__messages[position] for position in sorted(selected)]
+            + self.__messages[recent:]
+        )
+
+    def fit_context(self):
+        """Brings the context under the token limit, by summarizing or truncating it.
+
+        Summarizing falls back to truncation when it fails or is not enough.
+        """
+        if self.__compaction == "summarize" and self.summarize_context():
+            if not self.exceeding_token_limit():
+                return
+        self.reduce_tokens()
+
+    @profiled("summarize")
+    def summarize_context(self) -> bool:
+        """Folds the oldest messages into the rolling summary message.
+
+        Folds whole messages until config.COMPACTION_HEADROOM of the token limit
+        is free, the last message (the new question) is never folded. Only the
+        previous summary and the folded messages are sent to the summary model.
+        Returns False if there was nothing to fold or the summary request failed.
+        """
+        first = self.__first_turn()
+        excess = (
+            self.__total_usage
+            - self.__token_limit
+            + int(self.__token_limit * config.COMPACTION_HEADROOM)
+        )
+        drop, cut = plan_truncation(self.__ledger.counts[:-1], excess, first)
+        fold = drop + (1 if cut else 0)
+        if fold == 0:
+            return False
+
+        previous = ""
+        if first == 2:
+            previous = self.__messages[1]["content"][len(config.SUMMARY_PREFIX) :]
+
+        try:
+            summary = self.__request_summary(
+                previous, self.__messages[first : first + fold]
+            )
+        except Exception as error:  # pylint: disable=broad-except
+            if os.environ.get("LOG_LEVEL") == "DEBUG":
+                print(Fore.LIGHTRED_EX + f"Summary failed: {error}" + Style.RESET_ALL)
+            return False
+        if not summary:
+            return False
+
+        # the summary replaces the previous one and the folded messages
+        self.__ledger.delete(1, first + fold)
+        del self.__messages[1 : first + fold]
+        message = {"role": "system", "content": config.SUMMARY_PREFIX + summary}
+        self.__messages.insert(1, message)
+        self.__ledger.insert(1, message)
+
+        self.__total_usage = self.num_tokens_from_messages()
+        if os.environ.get("LOG_LEVEL") == "DEBUG":
+            self.print_usage()
+        return True
+
+    def __request_summary(self, previous: str, messages: list) -> str:
+        """Returns the previous summary updated with messages, by the summary model."""
+
+        transcript = "\n\n".join(
+            f"{message['role']}: {message['content']}" for message in messages
+        )
+        request = [
+            {"role": "system", "content": config.SUMMARY_MESSAGE},
+            {
+                "role": "user",
+                "content": f"Current summary:\n{previous or '(empty)'}\n\n"
+                + f"New messages:\n{transcript}",
+            },
+        ]
+        model = config.get_default_config().get(
+            "compaction_model", config.COMPACTION_MODEL
+        )
+
+        with yaspin(
+            Spinners.earth,
+            text=Style.DIM + "Summarizing older messages" + Style.RESET_ALL,
+            color="blue",
+            side="right",
+        ):
+            answer = self.__retry_scheduler.call(
+                lambda: self.__client.chat.completions.create(
+                    model=model, messages=request
+                )
+            )
+        return answer.choices[0].message.content or ""
+
+    def __first_turn(self) -> int:
+        """Returns the index of the oldest message that can be dropped or folded."""
+
+        if len(self.__messages) > 1 and is_summary(self.__messages[1]):
+            return 2
+        return 1
+
+    @profiled("reduce")
     def reduce_tokens(self) -> int:
-        """Reduce tokens in messages context."""
+        """Reduce tokens in messages context.
+
+        Drops the oldest messages (the first message and the summary are kept)
+        and cuts the beginning of the boundary message, planned in one pass
+        over the token ledger counts.
+        """
         total_reduced_amount = self.__total_usage - self.__token_limit
-        reduce_amount = self.__total_usage - self.__token_limit
-        tokenized_message = []
-
-        while self.exceeding_token_limit():
-            message = self.__messages.pop(1)
-            tokenized_message = self.__tiktoken_encoder.encode(message["content"])
-            while reduce_amount > 0 and len(tokenized_message) > 0:
-                self.__total_usage -= 1
-                reduce_amount -= 1
-                tokenized_message.pop(0)
-            if len(tokenized_message) == 0 and self.exceeding_token_limit():
-                reduce_amount -= 4  # every message follows <im_start>{role/name}\n{content}<im_end>\n
-                self.__total_usage -= 4
-                for key, _ in message.items():
-                    if key == "name":  # if there's a name, the role is omitted
-                        reduce_amount += 1  # role is always required and always 1 token
-                        self.__total_usage += 1
-        if len(tokenized_message) > 0:
-            message["content"] = self.__tiktoken_encoder.decode(tokenized_message)
-            self.__messages.insert(1, message)
+        first = self.__first_turn()
+        drop, cut = plan_truncation(self.__ledger.counts, total_reduced_amount, first)
+
+        reduced = self.__ledger.delete(first, first + drop)
+        del self.__messages[first : first + drop]
+
+        if cut:
+            message = self.__messages[first]
+            tokenized_message = self.__tokenizer.encode(message["content"])
+            if cut < len(tokenized_message):
+                self.__messages[first] = {
+                    **message,
+                    "content": self.__tokenizer.decode(tokenized_message[cut:]),
+                }
+                self.__ledger.update(first, self.__ledger.counts[first] - cut)
+                reduced += cut
+            else:  # cutting the content is not enough, drop the whole message
+                reduced += self.__ledger.delete(first, first + 1)
+                del self.__messages[first]
+
+        self.__total_usage -= reduced
         if os.environ.get("LOG_LEVEL") == "DEBUG":
-            self.__print_usage()
+            self.print_usage()
 
         return total_reduced_amount
 
+    @profiled("tokens")
     def num_tokens_from_messages(self) -> int:
-        """Returns the number of tokens used by a list of messages."""
-        encoding = tiktoken.get_encoding(config.ENCODING_MODEL)
-        num_tokens = 0
-        for message in self.__messages:
-            num_tokens += (
-                4  # every message follows <im_start>{role/name}\n{content}<im_end>\n
+        """Returns the number of tokens used by the messages, read from the token ledger.
+
+        With LOG_LEVEL=DEBUG the ledger is cross-checked against a full recount.
+        """
+        if len(self.__ledger) != len(self.__messages):
+            # the list was changed behind our back, resync
+            self.__ledger.reset(self.__messages)
+
+        if os.environ.get("LOG_LEVEL") == "DEBUG" and not self.__ledger.verify(
+            self.__messages
+        ):
+            print(
+                Fore.LIGHTRED_EX
+                + f"Token ledger drift: ledger={self.__ledger.total} "
+                + f"recount={self.__ledger.recount(self.__messages)}"
+                + Style.RESET_ALL
             )
-            for key, value in message.items():
-                num_tokens += len(encoding.encode(value))
-                if key == "name":  # if there's a name, the role is omitted
-                    num_tokens -= 1  # role is always required and always 1 token
-        num_tokens -= 2  # every reply is primed with <im_start>assistant
-        return num_tokens
-
-    def welcome_message(self, messages: list):
-        """Prints the welcome message."""
+            self.__ledger.reset(self.__messages)
+
+        return self.__ledger.total
+
+    def welcome_in_background(
+        self,
+        messages: Optional[list],
+        on_welcome: Optional[Callable[[str], None]] = None,
+    ) -> Optional[Callable[[], None]]:
+        """Requests the welcome message in a thread and prints it when it arrives.
+
+        Returns a function to call once the user sent a message, a welcome
+        that did not arrive by then is never printed, or None without messages.
+        on_welcome is called with the generated welcome message, printed or not.
+        """
+        if not messages:
+            return None
+
         print()
-        try:
-            welcome_message = self.get_user_answer(messages)
-            self.__printer.print_assistant_message(
-                welcome_message.choices[0].message.content
-            )
-        except KeyboardInterrupt:
-            self.__printer.print_assistant_message(
-                PrintUtils.choose_random_message(PrintUtils.STOPPED_MESSAGES),
-                color=Fore.YELLOW + Style.RESET_ALL,
-            )
-            sys.exit(0)
-        except Exception as error:
-            self.__printer.print_assistant_message(
-                str(error), color=Back.RED + Style.BRIGHT
-            )
-            sys.exit(1)
+        lock = threading.Lock()
+        discarded = False
+
+        def welcome():
+            try:
+                answer = self.get_user_answer(messages, spinner=False)
+            except Exception as error:  # pylint: disable=broad-except
+                answer = error
+            message, color = self.welcome_arrived(answer, on_welcome)
+            with lock:
+                if not discarded:
+                    self.__printer.print_assistant_message(message, color=color)
+
+        def discard():
+            nonlocal discarded
+            # waits for a welcome being printed
+            with lock:
+                discarded = True
+
+        threading.Thread(target=welcome, name="welcome", daemon=True).start()
+        return discard
+
+    @staticmethod
+    def welcome_arrived(
+        answer, on_welcome: Optional[Callable[[str], None]] = None
+    ) -> Tuple[str, str]:
+        """Returns the welcome message of answer, or the error it is, and its color.
+
+        on_welcome is called with a generated welcome message.
+        """
+        if isinstance(answer, Exception):
+            return str(answer), Back.RED + Style.BRIGHT
+
+        message = answer.choices[0].message.content
+        if on_welcome is not None:
+            on_welcome(message)
+        return message, Fore.YELLOW
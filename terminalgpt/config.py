@@ -2,6 +2,7 @@
 
 import json
 import platform
+from functools import lru_cache
 from os import path
 
 APP_NAME = "terminalgpt"
@@ -11,17 +12,122 @@ DEFAULTS_PATH = f"{BASE_PATH}/defaults.json"
 CONVERSATIONS_PATH = f"{BASE_PATH}/conversations"
 SECRET_PATH = f"{BASE_PATH}/{APP_NAME}.encrypted"
 KEY_PATH = f"{BASE_PATH}/{APP_NAME}.key"
+CACHE_PATH = f"{BASE_PATH}/cache"
+METRICS_PATH = f"{BASE_PATH}/metrics.bin"
+DAEMON_SOCKET = f"{BASE_PATH}/daemon.sock"
 
+# Tokenizer of the models without one in MODELS
 ENCODING_MODEL = "cl100k_base"
 
+# Typewriter output speed, in characters per second and frames (flushes) per second
+PRINT_CPS = 500
+PRINT_FPS = 60
+
+# Metadata and full-text search indexes of the saved conversations, and the
+# directory of their cached welcome-back messages, kept in the conversations
+# directory
+CONVERSATIONS_INDEX = ".index.json"
+SEARCH_INDEX = ".search.db"
+WELCOMES_DIR = ".welcomes"
+
+# System answers (e.g. conversation titles) give up after these many attempts of up to TIMEOUT seconds
+SYSTEM_ANSWER_ATTEMPTS = 3
+SYSTEM_ANSWER_TIMEOUT = 20
+
+# Retries of transient API errors: attempts per request, total wait per request
+# and the exponential backoff base and cap, in seconds
+RETRY_MAX_ATTEMPTS = 5
+RETRY_MAX_WAIT = 60
+RETRY_BASE_DELAY = 0.5
+RETRY_MAX_DELAY = 20
+
+# One shot answers cache, entries expire after TTL seconds and the least recently
+# used ones are evicted past MAX_BYTES
+CACHE_TTL = 7 * 24 * 60 * 60
+CACHE_MAX_BYTES = 16 * 1024 * 1024
+
+# HTTP transport of the API clients: pooled connections, seconds an idle one is
+# kept alive, connect and read timeouts in seconds, and HTTP/2 (needs the h2
+# package)
+HTTP_MAX_CONNECTIONS = 10
+HTTP_KEEPALIVE_EXPIRY = 120
+HTTP_CONNECT_TIMEOUT = 10
+HTTP_READ_TIMEOUT = 600
+HTTP2 = False
+
+# Tokenizer threads (0 for one per CPU, up to 8, never more than the CPUs), and
+# the batch size in texts from which the tokens are counted on them
+TOKENIZER_THREADS = 0
+TOKENIZER_BATCH_SIZE = 256
+
+# Concurrent requests of the batch command
+BATCH_CONCURRENCY = 8
+
+# Summarizing compaction: the cheaper model folding the oldest messages into a
+# rolling summary, and the share of the token limit every compaction frees, so the
+# summary is not refreshed on every turn
+COMPACTION_MODEL = "gpt-4o-mini"
+COMPACTION_HEADROOM = 0.25
+
+# Relevant context: the last messages always sent, and the most relevant older
+# messages picked on top of them
+CONTEXT_RECENT_MESSAGES = 6
+CONTEXT_RELEVANT_MESSAGES = 8
+
+# The daemon exits after this many seconds without a request, 0 keeps it running
+DAEMON_IDLE_TIMEOUT = 30 * 60
+
+# Request metrics are rotated to a single backup file past this size
+METRICS_MAX_BYTES = 4 * 1024 * 1024
+
+# Conversation logs with dead records are compacted once they grow past this size
+CONVERSATION_COMPACT_THRESHOLD = 512 * 1024
+
+# Models: their tokenizer encoding, context window and maximum output tokens, and
+# the default token limit of a conversation (see models.py for the overrides)
 MODELS = {
-    "gpt-3.5-turbo": 16385,
-    "gpt-4-turbo": 16385,  # can be 120000
-    "gpt-4o": 16385,  # can be 120000
-    "gpt-4o-mini": 16385,  # can be 120000
-    "o1": 16385,
-    "o1-mini": 16385,
-    "gpt-5-mini": 16385,
+    "gpt-3.5-turbo": {
+        "encoding": "cl100k_base",
+        "context_window": 16385,
+        "max_output": 4096,
+        "token_limit": 16385,
+    },
+    "gpt-4-turbo": {
+        "encoding": "cl100k_base",
+        "context_window": 128000,
+        "max_output": 4096,
+        "token_limit": 16385,
+    },
+    "gpt-4o": {
+        "encoding": "o200k_base",
+        "context_window": 128000,
+        "max_output": 16384,
+        "token_limit": 16385,
+    },
+    "gpt-4o-mini": {
+        "encoding": "o200k_base",
+        "context_window": 128000,
+        "max_output": 16384,
+        "token_limit": 16385,
+    },
+    "o1": {
+        "encoding": "o200k_base",
+        "context_window": 200000,
+        "max_output": 100000,
+        "token_limit": 16385,
+    },
+    "o1-mini": {
+        "encoding": "o200k_base",
+        "context_window": 128000,
+        "max_output": 65536,
+        "token_limit": 16385,
+    },
+    "gpt-5-mini": {
+        "encoding": "o200k_base",
+        "context_window": 400000,
+        "max_output": 128000,
+        "token_limit": 16385,
+    },
 }
 
 
@@ -31,25 +137,34 @@ def machine_info():
     return platform.platform()
 
 
+@lru_cache(maxsize=None)
 def get_default_config() -> dict:
-    """Get the default configuration from the config file."""
+    """Get the default configuration from the config file, read once per process."""
     try:
         with open(DEFAULTS_PATH, "r", encoding="utf-8") as file:
             return json.load(file)
     except FileNotFoundError:
-        return {"model": "gpt-4o-mini", "style": "plain", "models": MODELS}
+        return {"model": "gpt-4o-mini", "style": "plain"}
 
 
-INIT_SYSTEM_MESSAGE = {
-    "role": "system",
-    "content": f"""
+def __getattr__(name: str):
+    """Builds INIT_SYSTEM_MESSAGE on first access, machine_info() is slow on some platforms."""
+
+    if name == "INIT_SYSTEM_MESSAGE":
+        init_system_message = {
+            "role": "system",
+            "content": f"""
 - Your name is "TerminalGPT".
 - You are a helpful personal assistant for programers.
 - You are running on {machine_info()} machine.
 - Please note that your answers will be displayed on the terminal.
 - So keep answers short as possible and use a suitable format for printing on a terminal.
 """,
-}
+        }
+        globals()[name] = init_system_message
+        return init_system_message
+
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 INIT_WELCOME_MESSAGE = {
@@ -75,6 +190,21 @@ After the welcome back message, please summarize the last conversation. (e.g. "L
 """,
 }
 
+WELCOME_BACK_UPDATE_MESSAGE = {
+    "role": "system",
+    "content": """
+The conversation you remember was a while ago, now we are continuing it.
+Your last welcome back message summarized it, the messages after that one are new.
+Please start the conversation with a new random and short welcome back message.
+- Start with 'Welcome back to terminalGPT'.
+- Add a ton of self humor.
+- Keep it short as possible, one line.
+
+After the welcome back message, update the summary of your last welcome back message with the new messages. (e.g. "Last time we talked about ...")
+- End with a something that invites the user to continue the conversation.
+""",
+}
+
 TITLE_MESSAGE = """
 Please give this conversation a short title.
 I'm going to use this title as a file name for the conversation.
@@ -94,3 +224,14 @@ There are going to a lot of files like that under a folder "~/.terminalgpt/conve
 - Don't use word like: "macos", "programmer_assistant", "conversation".
 - Don't use any file extensions. (e.g. ".txt" or ".json")
 """
+
+SUMMARY_PREFIX = "Summary of the earlier conversation:\n"
+
+SUMMARY_MESSAGE = """
+You keep a running summary of a conversation between a user and an assistant.
+Update the current summary with the new messages.
+- Keep every fact, decision, name, number, file name and code detail that later questions may need.
+- Drop greetings and small talk.
+- Write it as short bullet points, no introduction.
+- Answer with the updated summary only.
+"""
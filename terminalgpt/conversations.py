@@ -1,25 +1,94 @@
-"""Conversations module."""
-
+"""Conversations module.
+
+Conversations are saved as append-only JSONL logs, one message per line. A
+reset record starts the conversation over, everything before the last one is
+dead and gets dropped by compaction. Older conversations saved as a single JSON
+list are still loaded, and converted to a log on their next save.
+
+With summarizing compaction the oldest messages are folded into a summary
+message right after the system message. A summary record stores it together with
+the number of saved messages it keeps, so the log replays to the compacted
+context without summarizing again.
+
+A metadata index (name, mtime, message count, token count and model) is kept
+next to the logs, so listing conversations does not touch every file, and so is
+the full-text search index of their messages (see search.py), updated on every
+save. The index is written when a conversation is added to it, renamed or
+deleted; the entry updates of later saves are kept in memory and written when
+the conversation is closed, so a turn does not rewrite the whole index.
+
+The last welcome-back message of every conversation is cached in a file of its
+own, with a hash of the history it summarizes, so reloading an unchanged
+conversation needs no request, and a grown one only sends the new turns.
+
+New conversations are saved under a temporary name while their title is
+generated in the background, then renamed. A conversation left with its
+temporary name is titled again on its next save or load.
+"""
+
+import hashlib
 import json
 import os
+import sqlite3
+import threading
 import time
+import uuid
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
 
-import openai
 from colorama import Back, Style
-from openai import OpenAI
 
-from terminalgpt import config
+from terminalgpt import config, models
 from terminalgpt.printer import Printer
+from terminalgpt.profiling import profiled
+from terminalgpt.search import SearchIndex, fts5_available
+
+if TYPE_CHECKING:
+    from openai import OpenAI
+
+
+RESET_RECORD = {"op": "reset"}
+UNTITLED_PREFIX = "untitled_"
+SUMMARY_OP = "summary"
+
+
+def is_summary(message: dict) -> bool:
+    """Checks if a message is the rolling summary of the oldest messages."""
+
+    return message.get("role") == "system" and str(
+        message.get("content", "")
+    ).startswith(config.SUMMARY_PREFIX)
+
 
+def history_hash(messages: list) -> str:
+    """Returns a hash of the roles and contents of messages."""
 
-class ConversationManager:
+    digest = hashlib.sha256()
+    for message in messages:
+        record = [message.get("role"), message.get("content")]
+        digest.update(json.dumps(record).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class ConversationManager:  # pylint: disable=too-many-public-methods
     """Manages conversations."""
 
     def __init__(self, **kwargs):
         self.__base_path = config.CONVERSATIONS_PATH
         self.__conversation_name = kwargs.get("conversation_name", "")
         self.__printer: Printer = kwargs["printer"]
-        self.__client: OpenAI = kwargs.get("client", None)
+        self.__model: str = kwargs.get("model", "")
+        self.__client: "OpenAI" = kwargs.get("client", None)
+        self.__lock = threading.Lock()
+        self.__saved: Dict[int, dict] = {}  # messages already in the log, by id
+        self.__saved_name = ""
+        self.__needs_compaction = False
+        self.__title_thread: Optional[threading.Thread] = None
+        self.__search_index: Optional[SearchIndex] = None
+        # index entry of the current conversation, and whether the index file
+        # is behind it
+        self.__entry: Optional[dict] = None
+        self.__entry_name = ""
+        self.__entry_dirty = False
 
     @property
     def conversation_name(self):
@@ -34,24 +103,35 @@ class ConversationManager:
         return self.__client
 
     @client.setter
-    def client(self, client: OpenAI):
+    def client(self, client: "OpenAI"):
         self.__client = client
 
     def get_system_answer(self, messages):
-        """Returns the answer from OpenAI API."""
-
-        while True:
-            try:
-                answer = self.__client.chat.completions.create(
-                    model=config.get_default_config()["model"], messages=messages
-                )
-                return answer
-            except openai.OpenAIError:
-                time.sleep(10)
+        """Returns the answer from OpenAI API.
+
+        Transient errors are retried, giving up with the last error after
+        config.SYSTEM_ANSWER_ATTEMPTS attempts of up to config.SYSTEM_ANSWER_TIMEOUT
+        seconds each.
+        """
+        # pylint: disable-next=import-outside-toplevel
+        from terminalgpt.retry import RetryScheduler
+
+        return RetryScheduler(max_attempts=config.SYSTEM_ANSWER_ATTEMPTS).call(
+            lambda: self.__client.chat.completions.create(
+                model=config.get_default_config()["model"],
+                messages=messages,
+                timeout=config.SYSTEM_ANSWER_TIMEOUT,
+            )
+        )
 
     def create_conversation_name(self, messages: list):
         """Creates a context file name based on the title of the conversation."""
 
+        self.conversation_name = self.generate_conversation_title(messages)
+
+    def generate_conversation_title(self, messages: list) -> str:
+        """Asks for a short title of the conversation, to be used as its file name."""
+
         files = self.get_conversations()
 
         message_suffix = f"- Keep it unique amongst the next file names list: {files}"
@@ -63,45 +143,208 @@ class ConversationManager:
         answer = self.get_system_answer(messages + [title_message])
         context_file_name = answer.choices[0].message.content
 
-        self.conversation_name = context_file_name or ""
+        return context_file_name or ""
 
+    @profiled("save")
     def save_context(self, messages: list, total_usage: int, token_limit: int):
         # Save context or wait for some context
         if not self.conversation_name and total_usage > token_limit / 12:
-            self.create_conversation_name(messages)
-        elif self.conversation_name:
-            self.save_conversation(messages)
+            # Save under a temporary name until the title arrives, unique so
+            # sessions started in the same second do not share a log
+            self.conversation_name = (
+                time.strftime(f"{UNTITLED_PREFIX}%Y%m%d_%H%M%S_") + uuid.uuid4().hex[:8]
+            )
+
+        self.retry_title(messages)
+        if self.conversation_name:
+            self.save_conversation(messages, tokens=total_usage)
+
+    def retry_title(self, messages: list):
+        """Generates the title of an untitled conversation in the background.
+
+        Conversations keep their temporary name when the title failed or the
+        program exited before it arrived, the title is asked for again on their
+        next save or load.
+        """
+        if not self.conversation_name.startswith(UNTITLED_PREFIX):
+            return
+        if self.__title_thread is not None and self.__title_thread.is_alive():
+            return
+
+        self.__title_thread = threading.Thread(
+            target=self.__name_conversation, args=(list(messages),), daemon=True
+        )
+        self.__title_thread.start()
+
+    def wait_for_title(self, timeout: Optional[float] = None):
+        """Waits for the conversation title being generated in the background, if any."""
+
+        if self.__title_thread is not None:
+            self.__title_thread.join(timeout)
+
+    def close(self, timeout: Optional[float] = None):
+        """Waits up to timeout for a pending title, then writes the index updates."""
+
+        self.wait_for_title(timeout)
+        self.flush_index()
+
+    def flush_index(self):
+        """Writes the index updates of the saves since the last write, if any."""
+
+        with self.__lock:
+            self.__flush_index()
 
-    def save_conversation(self, messages: list):
-        """Saves a conversation to a file."""
+    @profiled("title")
+    def __name_conversation(self, messages: list):
+        """Generates the conversation title and renames the conversation file to it."""
+
+        try:
+            title = self.generate_conversation_title(messages)
+        except Exception:  # pylint: disable=broad-except
+            return  # keep the temporary name, the conversation is saved anyway
+
+        if title:
+            self.rename_conversation(title)
+
+    def rename_conversation(self, new_name: str) -> str:
+        """Renames the current conversation file atomically, returns the name used.
+
+        A number is added to the name if it is already taken.
+        """
+
+        new_name = new_name.strip().replace("/", "_")
+
+        with self.__lock:
+            old_path = f"{self.__base_path}/{self.conversation_name}"
+            name, suffix = new_name, 1
+            while os.path.exists(f"{self.__base_path}/{name}"):
+                suffix += 1
+                name = f"{new_name}_{suffix}"
+
+            if os.path.exists(old_path):
+                os.rename(old_path, f"{self.__base_path}/{name}")
+                self.__update_search("rename", self.conversation_name, name)
+                welcome_path = self.__welcome_path(self.conversation_name)
+                if os.path.exists(welcome_path):
+                    os.replace(welcome_path, self.__welcome_path(name))
+
+                self.__flush_index()
+                index = self.__read_index()
+                if index is not None and self.conversation_name in index:
+                    index[name] = index.pop(self.conversation_name)
+                    self.__write_index(index)
+                if self.__entry_name == self.conversation_name:
+                    self.__entry_name = name
+
+            if self.__saved_name == self.conversation_name:
+                self.__saved_name = name
+            self.conversation_name = name
+
+        return name
+
+    def save_conversation(self, messages: list, tokens: Optional[int] = None):
+        """Saves a conversation to a file, appending only the messages not saved yet.
+
+        tokens is the current token count of the conversation, kept in the index.
+        """
 
         if not os.path.exists(self.__base_path):
             os.makedirs(self.__base_path)
 
-        with open(
-            file=f"{self.__base_path}/{self.conversation_name}",
-            mode="w",
-            encoding="utf-8",
-        ) as conv_file:
-            json.dump(messages, conv_file)
+        with self.__lock:
+            path = f"{self.__base_path}/{self.conversation_name}"
+            new_messages = self.__unsaved_messages(messages)
+            appended = new_messages is not None
+
+            if new_messages is None:
+                # Not an extension of the log, start the conversation over
+                if os.path.exists(path) and not self.__is_legacy(path):
+                    self.__append_records(path, [RESET_RECORD] + messages)
+                    self.__needs_compaction = True
+                else:
+                    self.__write_records(path, messages)
+                self.__update_search("replace", self.conversation_name, messages)
+            elif len(messages) > 1 and self.__is_new_summary(messages[1]):
+                # The oldest messages were folded into a new summary, the saved
+                # messages right after it are kept when the log is replayed
+                tail = messages[2:]
+                keep = 0
+                while keep < len(tail) and id(tail[keep]) in self.__saved:
+                    keep += 1
+                record = {"op": SUMMARY_OP, "message": messages[1], "keep": keep}
+                self.__append_records(path, [record] + tail[keep:])
+                self.__needs_compaction = True
+                appended = False
+                # the folded messages stay searchable
+                self.__update_search("add", self.conversation_name, tail[keep:])
+            elif new_messages:
+                self.__append_records(path, new_messages)
+                self.__update_search("add", self.conversation_name, new_messages)
+
+            self.__index_conversation(
+                path,
+                messages=len(new_messages) if appended else len(messages),
+                appended=appended,
+                tokens=tokens,
+            )
+            self.__mark_saved(messages)
+            compact = (
+                self.__needs_compaction
+                and os.path.getsize(path) > config.CONVERSATION_COMPACT_THRESHOLD
+            )
+            if compact:
+                self.__needs_compaction = False
+
+        if compact:
+            threading.Thread(target=self.compact_conversation, daemon=True).start()
+
+    def compact_conversation(self):
+        """Rewrites the conversation log without the records before its last reset.
+
+        The path is read when the compaction runs, so a title rename that got
+        there first is followed.
+        """
+
+        with self.__lock:
+            path = f"{self.__base_path}/{self.conversation_name}"
+            try:
+                messages, _ = self.__read_messages(path)
+            except FileNotFoundError:
+                # renamed away before the name was updated, nothing to compact
+                return
+            self.__write_records(path, messages)
 
     def delete_conversation(self, conversation_name: str):
         """Deletes a conversation from a file."""
 
         os.remove(f"{self.__base_path}/{conversation_name}")
 
+        with self.__lock:
+            if self.__entry_name == conversation_name:
+                self.__entry, self.__entry_name = None, ""
+                self.__entry_dirty = False
+            index = self.__read_index()
+            if index is not None and index.pop(conversation_name, None) is not None:
+                self.__write_index(index)
+            self.__update_search("delete", conversation_name)
+            try:
+                os.remove(self.__welcome_path(conversation_name))
+            except FileNotFoundError:
+                pass
+
     def load_conversation(self) -> list:
         """Loads a conversation from a file. returns a list of messages."""
 
         messages = []
+        path = f"{self.__base_path}/{self.conversation_name}"
 
         try:
-            with open(
-                file=f"{self.__base_path}/{self.conversation_name}",
-                mode="r",
-                encoding="utf-8",
-            ) as conv_file:
-                messages = json.load(conv_file)
+            with self.__lock:
+                messages, self.__needs_compaction = self.__read_messages(path)
+                self.__saved = {}
+                # an old format file is rewritten as a log on its next save
+                if not self.__is_legacy(path):
+                    self.__mark_saved(messages)
         except FileNotFoundError as error:
             error_message = f"Failed loading conversation {self.conversation_name} from {self.__base_path}.\n{str(error)}"
             self.__printer.printt(
@@ -111,19 +354,384 @@ class ConversationManager:
 
         return messages
 
+    def __unsaved_messages(self, messages: list) -> Optional[list]:
+        """Returns the messages appended since the last save.
+
+        Returns None when messages does not extend what is already saved.
+        Messages dropped from the beginning of the context stay in the log.
+        """
+
+        if self.__saved_name != self.conversation_name or not self.__saved:
+            return None
+
+        for index in range(len(messages) - 1, -1, -1):
+            if id(messages[index]) in self.__saved:
+                return messages[index + 1 :]
+
+        return None
+
+    def __is_new_summary(self, message: dict) -> bool:
+        """Checks if a message is a summary that is not in the log yet."""
+
+        return is_summary(message) and id(message) not in self.__saved
+
+    def __mark_saved(self, messages: list):
+        """Remembers messages as saved in the current conversation log."""
+
+        if self.__saved_name != self.conversation_name:
+            self.__saved = {}
+            self.__saved_name = self.conversation_name
+
+        # keeping the message objects keeps their ids from being reused
+        self.__saved.update((id(message), message) for message in messages)
+
+    @staticmethod
+    def __is_legacy(path: str) -> bool:
+        """Checks if a conversation file is in the old single JSON list format."""
+
+        try:
+            with open(path, mode="r", encoding="utf-8") as conv_file:
+                return conv_file.read(1) == "["
+        except FileNotFoundError:
+            return False
+
+    @staticmethod
+    def __read_messages(path: str) -> Tuple[list, bool]:
+        """Reads the messages of a conversation file, in either format.
+
+        Also returns whether the log has dead records that compaction would drop.
+        """
+
+        with open(path, mode="r", encoding="utf-8") as conv_file:
+            content = conv_file.read()
+
+        if content.lstrip().startswith("["):
+            return json.loads(content), False
+
+        messages = []
+        dead_records = False
+        for line in content.splitlines():
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # a write torn by a crash, the rest of the log is fine
+            if record == RESET_RECORD:
+                dead_records = True
+                messages = []
+            elif record.get("op") == SUMMARY_OP:
+                # the summary replaces everything but the first message and the
+                # last kept ones
+                dead_records = True
+                keep = record["keep"]
+                kept = messages[len(messages) - keep :] if keep else []
+                messages = messages[:1] + [record["message"]] + kept
+            else:
+                messages.append(record)
+
+        return messages, dead_records
+
+    @staticmethod
+    def __append_records(path: str, records: List[dict]):
+        """Appends records to a conversation log."""
+
+        with open(path, mode="a+", encoding="utf-8") as conv_file:
+            # Start on a new line if the last write was torn by a crash
+            if conv_file.tell() > 0:
+                conv_file.seek(conv_file.tell() - 1)
+                if conv_file.read(1) != "\n":
+                    conv_file.write("\n")
+            conv_file.write("".join(json.dumps(record) + "\n" for record in records))
+
+    @staticmethod
+    def __write_records(path: str, records: List[dict]):
+        """Writes a whole conversation log atomically."""
+
+        directory, name = os.path.split(path)
+        tmp_path = os.path.join(directory, f".{name}.tmp")
+        with open(tmp_path, mode="w", encoding="utf-8") as conv_file:
+            conv_file.write("".join(json.dumps(record) + "\n" for record in records))
+            conv_file.flush()
+            os.fsync(conv_file.fileno())
+        os.replace(tmp_path, path)
+
+    def cached_welcome(self, history: list) -> Optional[str]:
+        """Returns the cached welcome-back message, if history did not change since."""
+
+        welcome = self.__read_welcome()
+        if welcome is None or welcome["hash"] != history_hash(history):
+            return None
+        return welcome["message"]
+
+    def welcome_back_messages(self, history: list) -> list:
+        """Returns the messages requesting the welcome-back message of history.
+
+        When a welcome-back message was generated for an earlier history of
+        the current conversation, the request only has the turns that came
+        after its last message, to update it.
+        """
+        welcome = self.__read_welcome()
+        if welcome is not None:
+            new_turns = self.__turns_after(history, welcome)
+            if new_turns:
+                previous = {"role": "assistant", "content": welcome["message"]}
+                update = [previous] + new_turns + [config.WELCOME_BACK_UPDATE_MESSAGE]
+                return history[:1] + update
+
+        return history + [config.INIT_WELCOME_BACK_MESSAGE]
+
+    def save_welcome(self, history: list, message: str):
+        """Caches the welcome-back message generated for history."""
+
+        with self.__lock:
+            if not os.path.exists(f"{self.__base_path}/{self.conversation_name}"):
+                return
+            path = self.__welcome_path(self.conversation_name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, mode="w", encoding="utf-8") as welcome_file:
+                json.dump(
+                    {
+                        "hash": history_hash(history),
+                        "last": history_hash(history[-1:]),
+                        "messages": len(history),
+                        "message": message,
+                    },
+                    welcome_file,
+                )
+            os.replace(tmp_path, path)
+
+    def __read_welcome(self) -> Optional[dict]:
+        """Reads the cached welcome-back message of the current conversation."""
+
+        try:
+            with open(
+                self.__welcome_path(self.conversation_name), mode="r", encoding="utf-8"
+            ) as welcome_file:
+                return json.load(welcome_file)
+        except (OSError, ValueError):
+            return None
+
+    def __welcome_path(self, conversation_name: str) -> str:
+        return os.path.join(self.__base_path, config.WELCOMES_DIR, conversation_name)
+
+    @staticmethod
+    def __turns_after(history: list, welcome: dict) -> list:
+        """Returns the messages of history after the last one welcome summarized.
+
+        The last summarized message is looked for where it was, then from the
+        end, as truncation may have dropped the oldest messages since.
+        """
+        last = welcome["messages"] - 1
+        positions = [last] if 0 < last < len(history) else []
+        for position in positions + list(range(len(history) - 1, 0, -1)):
+            if history_hash(history[position : position + 1]) == welcome["last"]:
+                return history[position + 1 :]
+        return []
+
     def get_conversations(self):
-        """Lists all saved conversations."""
+        """Lists all saved conversations, newest first, from the index."""
 
         if not os.path.exists(self.__base_path):
             os.makedirs(self.__base_path)
 
-        files = os.listdir(self.__base_path)
-        files.sort(
-            key=lambda x: os.path.getmtime(os.path.join(self.__base_path, x)),
-            reverse=True,
-        )
+        with self.__lock:
+            self.__flush_index()
+            index = self.__read_index()
+            if index is None:
+                index = self.__rebuild_index()
+
+        return sorted(index, key=lambda name: index[name]["mtime"], reverse=True)
+
+    def get_conversation_info(self, conversation_name: str) -> Optional[dict]:
+        """Returns the index entry of a conversation."""
+
+        with self.__lock:
+            self.__flush_index()
+            index = self.__read_index()
+
+        return (index or {}).get(conversation_name)
+
+    def rebuild_index(self) -> int:
+        """Rebuilds the index from the conversations directory, returns its size."""
+
+        if not os.path.exists(self.__base_path):
+            os.makedirs(self.__base_path)
+
+        with self.__lock:
+            return len(self.__rebuild_index(count_tokens=True))
+
+    def __rebuild_index(self, count_tokens: bool = False) -> dict:
+        """Rebuilds the index from the files, keeping the tokens and models.
+
+        With count_tokens the conversations without a token count are counted,
+        all of them in one tokenizer batch.
+        """
+        self.__flush_index()
+        old_index = self.__read_index() or {}
+        index = {}
+        conversations = {}
 
-        return files
+        for name in os.listdir(self.__base_path):
+            path = os.path.join(self.__base_path, name)
+            if name.startswith(".") or not os.path.isfile(path):
+                continue  # dot files are temporary files, not conversations
+
+            try:
+                messages, _ = self.__read_messages(path)
+            except (OSError, ValueError):
+                messages = []
+
+            conversations[name] = messages
+            old_entry = old_index.get(name, {})
+            index[name] = {
+                "mtime": os.path.getmtime(path),
+                "messages": len(messages),
+                "tokens": old_entry.get("tokens"),
+                "model": old_entry.get("model", ""),
+            }
+
+        if count_tokens:
+            self.__count_tokens(index, conversations)
+
+        self.__write_index(index)
+        self.__update_search("rebuild", conversations)
+        return index
+
+    def __count_tokens(self, index: dict, conversations: Dict[str, list]):
+        """Sets the token count of the index entries missing one.
+
+        The conversations are counted with the tokenizer of their model, in one
+        batch per model.
+        """
+        # pylint: disable-next=import-outside-toplevel
+        from terminalgpt.tokens import REPLY_PRIMING
+
+        batches: Dict[str, List[str]] = {}
+        for name, entry in index.items():
+            if entry["tokens"] is None and conversations[name]:
+                model = entry["model"] or self.__model
+                batches.setdefault(model, []).append(name)
+
+        for model, names in batches.items():
+            counts = iter(
+                models.get_tokenizer(model).count_messages(
+                    [message for name in names for message in conversations[name]]
+                )
+            )
+            for name in names:
+                tokens = sum(next(counts) for _ in conversations[name])
+                index[name]["tokens"] = tokens - REPLY_PRIMING
+
+    @property
+    def search_available(self) -> bool:
+        """Returns True if the conversations can be searched, SQLite has FTS5."""
+        return fts5_available()
+
+    def search_conversations(self, query: str, **kwargs) -> List[dict]:
+        """Returns the best search hits of query, one per conversation.
+
+        The search index is built from all the conversations on first use.
+        kwargs are passed to SearchIndex.search (limit, highlight).
+        Without search_available there are no hits.
+        """
+
+        if not self.search_available:
+            return []
+
+        if not os.path.exists(self.__base_path):
+            os.makedirs(self.__base_path)
+
+        search_index = self.__get_search_index()
+        if not search_index.built:
+            with self.__lock:
+                self.__rebuild_index()
+
+        return search_index.search(query, **kwargs)
+
+    def __get_search_index(self) -> SearchIndex:
+        if self.__search_index is None:
+            self.__search_index = SearchIndex(
+                os.path.join(self.__base_path, config.SEARCH_INDEX)
+            )
+        return self.__search_index
+
+    def __update_search(self, action: str, *args):
+        """Applies a change to the search index, search errors never fail a save."""
+
+        if not self.search_available:
+            return
+
+        try:
+            getattr(self.__get_search_index(), action)(*args)
+        except sqlite3.Error as error:
+            if os.environ.get("LOG_LEVEL") == "DEBUG":
+                print(f"Search index update failed: {error}")
+
+    def __index_conversation(
+        self, path: str, messages: int, appended: bool, tokens: Optional[int]
+    ):
+        """Updates the index entry of a conversation that was just saved.
+
+        The index is only read and written on the first save of a conversation,
+        the later updates are kept in memory until flush_index().
+        """
+        index = None
+        if self.__entry is None or self.__entry_name != self.conversation_name:
+            self.__flush_index()
+            index = self.__read_index()
+            if index is None:
+                index = self.__rebuild_index()  # counts the messages just saved too
+                messages, appended = 0, True
+            self.__entry = index.setdefault(self.conversation_name, {"messages": 0})
+            self.__entry_name = self.conversation_name
+
+        entry = self.__entry
+        entry["mtime"] = os.path.getmtime(path)
+        entry["messages"] = entry["messages"] + messages if appended else messages
+        if tokens is not None:
+            entry["tokens"] = tokens
+        entry["model"] = self.__model or entry.get("model", "")
+
+        if index is not None:
+            self.__write_index(index)
+        else:
+            self.__entry_dirty = True
+
+    def __flush_index(self):
+        """Writes the in-memory entry of the current conversation, if it changed."""
+
+        if not self.__entry_dirty:
+            return
+
+        self.__entry_dirty = False
+        index = self.__read_index()
+        if index is None:
+            self.__rebuild_index()  # counts the saved messages too
+            return
+        index[self.__entry_name] = self.__entry
+        self.__write_index(index)
+
+    def __read_index(self) -> Optional[dict]:
+        """Reads the conversations index, None if it is missing or broken."""
+
+        try:
+            with open(
+                os.path.join(self.__base_path, config.CONVERSATIONS_INDEX),
+                mode="r",
+                encoding="utf-8",
+            ) as index_file:
+                return json.load(index_file)["conversations"]
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def __write_index(self, index: dict):
+        """Writes the conversations index atomically."""
+
+        index_path = os.path.join(self.__base_path, config.CONVERSATIONS_INDEX)
+        tmp_path = f"{index_path}.tmp"
+        with open(tmp_path, mode="w", encoding="utf-8") as index_file:
+            json.dump({"conversations": index}, index_file)
+        os.replace(tmp_path, index_path)
 
     def is_conversations_empty(self, files: list, message: str):
         """Checks if the conversations directory is empty."""
@@ -0,0 +1,605 @@
+"""Warm background daemon serving the chat requests over a Unix socket.
+
+Starting the CLI costs an OpenAI client, a decrypted API key and a new TLS
+connection on every run. The daemon pays them once and keeps them, and the
+commands talk to it over a Unix socket in the user's terminalgpt directory.
+The socket is created with 0600 permissions and, where the platform tells,
+the peer uid of every connection is checked against the daemon's own.
+
+The protocol is one JSON request line per connection, answered with JSON event
+lines:
+
+- ping: {"pid", "uptime", "requests", "idle_timeout"}
+- stop: {"stopping": true}, and the daemon exits.
+- one_shot: the whole one shot question, retried and cached by the daemon,
+  answered with {"delta"} events when streamed and a final {"done", "answer",
+  "cached"} event.
+- complete: a raw chat completion request, answered with {"chunk"} events or
+  a {"completion"} event. The chat sessions retry these themselves.
+- count_tokens: the token counts of {"model", "texts"}, answered with a
+  {"counts"} event by the daemon's warm encoder, so chat sessions load none.
+
+Failures are answered with an {"error"} event. The daemon exits once no request
+came for its idle timeout.
+
+Nothing in this module imports openai or tiktoken at the top, the one shot
+client path stays as light as the CLI itself. Chat sessions still import openai
+for the completion types and the retry scheduler.
+"""
+
+import itertools
+import json
+import os
+import socket
+import struct
+import threading
+import time
+from contextlib import contextmanager
+from types import SimpleNamespace
+from typing import TYPE_CHECKING, Callable, Iterator, List, Optional, Tuple
+
+from colorama import Style
+
+from terminalgpt import config
+from terminalgpt.models import get_encoder, get_tokenizer
+from terminalgpt.tokens import Tokenizer
+
+if TYPE_CHECKING:
+    from terminalgpt.printer import Printer
+
+
+class DaemonError(Exception):
+    """A request the daemon could not serve."""
+
+
+def supported() -> bool:
+    """Returns True if the platform has Unix sockets."""
+    return hasattr(socket, "AF_UNIX")
+
+
+def peer_uid(connection: socket.socket) -> Optional[int]:
+    """Returns the uid of the process at the other end of a Unix socket.
+
+    Returns None where the platform does not tell, the socket permissions are
+    the only check there.
+    """
+    if not hasattr(socket, "SO_PEERCRED"):
+        return None
+
+    credentials = connection.getsockopt(
+        socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i")
+    )
+    _, uid, _ = struct.unpack("3i", credentials)
+    return uid
+
+
+def error_event(error: Exception) -> dict:
+    """Returns the error event of a failed request, with what rebuilding it needs."""
+
+    message = getattr(error, "message", str(error))
+    event = {"type": type(error).__name__, "message": message}
+    response = getattr(error, "response", None)
+    if response is not None:
+        event["status"] = response.status_code
+        event["headers"] = dict(response.headers)
+        event["body"] = getattr(error, "body", None)
+    return {"error": event}
+
+
+def raise_openai_error(event: dict):
+    """Raises the OpenAI error of an error event, so chat sessions retry it as usual.
+
+    The rebuilt errors carry a minimal response, with what the errors and the
+    retry scheduler read from it.
+    """
+    # pylint: disable-next=import-outside-toplevel
+    import openai
+
+    request = SimpleNamespace(method="POST", url="daemon:/chat/completions")
+    error_type = getattr(openai, event["type"], None)
+    if "status" in event:
+        status_error = isinstance(error_type, type) and issubclass(
+            error_type, openai.APIStatusError
+        )
+        if not status_error:
+            error_type = openai.APIStatusError
+        response = SimpleNamespace(
+            status_code=event["status"],
+            headers=event.get("headers") or {},
+            request=request,
+        )
+        raise error_type(event["message"], response=response, body=event.get("body"))
+    if error_type is openai.APITimeoutError:
+        raise openai.APITimeoutError(request=request)
+    if error_type is openai.APIConnectionError:
+        raise openai.APIConnectionError(message=event["message"], request=request)
+    raise DaemonError(event["message"])
+
+
+class DaemonServer:
+    """Serves the requests of the CLI commands with a warm client."""
+
+    def __init__(self, **kwargs):
+        self.__path: str = kwargs.get("path", config.DAEMON_SOCKET)
+        self.__idle_timeout: float = kwargs.get(
+            "idle_timeout", config.DAEMON_IDLE_TIMEOUT
+        )
+        self.__client = kwargs.get("client", None)
+        self.__cache = kwargs.get("cache", None)
+        self.__metrics = kwargs.get("metrics", None)
+        self.__lock = threading.Lock()
+        self.__stopping = threading.Event()
+        self.__started = time.monotonic()
+        self.__last_active = self.__started
+        self.__active = 0
+        self.__requests = 0
+
+    @property
+    def path(self) -> str:
+        return self.__path
+
+    @property
+    def requests(self) -> int:
+        """Returns the number of requests served so far."""
+        return self.__requests
+
+    def stop(self):
+        """Makes serve_forever return, the requests in progress are finished."""
+
+        self.__stopping.set()
+        # wake the listener up rather than waiting for its next poll
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as wake_up:
+            try:
+                wake_up.connect(self.__path)
+            except OSError:
+                pass
+
+    def serve_forever(self, ready: Optional[Callable[[], None]] = None):
+        """Listens on the socket until stopped or idle, calls ready once listening."""
+
+        self.__warm_up()
+        listener = self.__listen()
+        # wake up regularly to check for idleness and stop requests
+        listener.settimeout(min(1.0, self.__idle_timeout or 1.0))
+        if ready is not None:
+            ready()
+
+        try:
+            while not self.__stopping.is_set() and not self.__idle():
+                try:
+                    connection, _ = listener.accept()
+                except socket.timeout:
+                    continue
+                if self.__stopping.is_set():
+                    connection.close()
+                    break
+                threading.Thread(
+                    target=self.__serve_connection, args=(connection,), daemon=True
+                ).start()
+        finally:
+            listener.close()
+            try:
+                os.remove(self.__path)
+            except FileNotFoundError:
+                pass
+
+    def __warm_up(self):
+        """Creates the client with the decrypted API key, the cache and the metrics."""
+
+        # pylint: disable=import-outside-toplevel
+        if self.__client is None:
+            from openai import OpenAI
+
+            from terminalgpt.encryption import EncryptionManager
+            from terminalgpt.transport import TRANSPORT
+
+            # one shot requests are retried by the daemon's retry scheduler and
+            # chat requests by the chat session, not by the client
+            self.__client = OpenAI(
+                api_key=EncryptionManager().get_api_key(),
+                max_retries=0,
+                http_client=TRANSPORT.http_client,
+            )
+            TRANSPORT.prewarm(self.__client.base_url)
+            # the encoder of the default model, for the token counts of the
+            # chat sessions
+            get_encoder(config.get_default_config().get("model", "gpt-3.5-turbo"))
+        if self.__cache is None:
+            from terminalgpt.cache import ResponseCache
+
+            self.__cache = ResponseCache()
+        if self.__metrics is None:
+            from terminalgpt.metrics import MetricsStore
+
+            self.__metrics = MetricsStore()
+
+    def __listen(self) -> socket.socket:
+        """Binds the socket, readable and writable by the user only."""
+
+        directory = os.path.dirname(self.__path)
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        if os.path.exists(self.__path):
+            if DaemonClient(self.__path).ping() is not None:
+                raise DaemonError(f"A daemon is already listening on {self.__path}.")
+            os.remove(self.__path)  # left behind by a killed daemon
+
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        umask = os.umask(0o177)  # no window where others could connect
+        try:
+            listener.bind(self.__path)
+        finally:
+            os.umask(umask)
+        os.chmod(self.__path, 0o600)
+        listener.listen()
+        return listener
+
+    def __idle(self) -> bool:
+        if not self.__idle_timeout:
+            return False
+        with self.__lock:
+            idle = time.monotonic() - self.__last_active
+            return self.__active == 0 and idle > self.__idle_timeout
+
+    @contextmanager
+    def __activity(self):
+        """Counts a request in progress, the daemon is not idle until it ends."""
+
+        with self.__lock:
+            self.__active += 1
+            self.__requests += 1
+        try:
+            yield
+        finally:
+            with self.__lock:
+                self.__active -= 1
+                self.__last_active = time.monotonic()
+
+    def __serve_connection(self, connection: socket.socket):
+        # pylint: disable-next=import-outside-toplevel
+        import openai
+
+        def send(event: dict):
+            connection.sendall((json.dumps(event) + "\n").encode("utf-8"))
+
+        with connection, self.__activity():
+            try:
+                uid = peer_uid(connection)
+                if uid is not None and uid != os.getuid():
+                    return
+
+                try:
+                    with connection.makefile("rb") as reader:
+                        request = json.loads(reader.readline())
+                    command = request["command"]
+                except (ValueError, KeyError, TypeError):
+                    send({"error": {"type": "DaemonError", "message": "Bad request."}})
+                    return
+
+                handler = {
+                    "ping": self.__ping,
+                    "stop": self.__stop,
+                    "one_shot": self.__one_shot,
+                    "complete": self.__complete,
+                    "count_tokens": self.__count_tokens,
+                }.get(command)
+                if handler is None:
+                    message = f"Unknown command: {command}."
+                    send({"error": {"type": "DaemonError", "message": message}})
+                    return
+
+                try:
+                    handler(request, send)
+                except openai.OpenAIError as error:
+                    send(error_event(error))
+                except Exception as error:
+                    # e.g. a malformed request, answered rather than left hanging
+                    send(error_event(error))
+            except OSError:
+                pass  # the client went away, e.g. interrupted with Ctrl-C
+
+    def __ping(self, _, send: Callable[[dict], None]):
+        send(
+            {
+                "pid": os.getpid(),
+                "uptime": time.monotonic() - self.__started,
+                "requests": self.__requests,
+                "idle_timeout": self.__idle_timeout,
+            }
+        )
+
+    def __stop(self, _, send: Callable[[dict], None]):
+        self.stop()
+        send({"stopping": True})
+
+    def __one_shot(self, request: dict, send: Callable[[dict], None]):
+        """Answers a one shot question like the one_shot command does in-process."""
+
+        # pylint: disable-next=import-outside-toplevel
+        from terminalgpt.retry import RetryScheduler
+
+        model, messages = request["model"], request["messages"]
+        stream = request.get("stream", False)
+        cache = self.__cache if request.get("cache") and not stream else None
+
+        if cache is not None:
+            answer = cache.get(model, messages)
+            if answer is not None:
+                message = answer.choices[0].message.content
+                send({"done": True, "answer": message, "cached": True})
+                return
+
+        if stream:
+            self.__stream_one_shot(model, messages, send)
+            return
+
+        scheduler = RetryScheduler()
+        start = time.perf_counter()
+        answer = scheduler.call(
+            lambda: self.__client.chat.completions.create(
+                model=model, messages=messages
+            )
+        )
+        if cache is not None:
+            cache.put(model, messages, answer)
+        message = answer.choices[0].message.content
+        send({"done": True, "answer": message, "cached": False})
+        self.__record(model, answer.usage, (start, scheduler.retries))
+
+    def __stream_one_shot(
+        self, model: str, messages: list, send: Callable[[dict], None]
+    ):
+        """Answers a streamed one shot question, sending every delta."""
+
+        # pylint: disable-next=import-outside-toplevel
+        from terminalgpt.retry import RetryScheduler
+
+        scheduler = RetryScheduler()
+        start = time.perf_counter()
+        chunks = scheduler.call(
+            lambda: self.__client.chat.completions.create(
+                model=model,
+                messages=messages,
+                stream=True,
+                stream_options={"include_usage": True},
+            )
+        )
+        parts, usage, ttft = [], None, None
+        try:
+            for chunk in chunks:
+                if chunk.usage:
+                    usage = chunk.usage
+                if chunk.choices and chunk.choices[0].delta.content:
+                    if ttft is None:
+                        ttft = time.perf_counter() - start
+                    parts.append(chunk.choices[0].delta.content)
+                    send({"delta": chunk.choices[0].delta.content})
+        finally:
+            chunks.close()
+        send({"done": True, "answer": "".join(parts), "cached": False})
+        self.__record(model, usage, (start, scheduler.retries), ttft)
+
+    def __complete(self, request: dict, send: Callable[[dict], None]):
+        """Forwards a chat completion request, the caller retries its errors."""
+
+        answer = self.__client.chat.completions.create(**request["kwargs"])
+        if not request["kwargs"].get("stream"):
+            send({"completion": answer.model_dump(mode="json")})
+            return
+
+        try:
+            for chunk in answer:
+                send({"chunk": chunk.model_dump(mode="json")})
+        finally:
+            answer.close()
+        send({"done": True})
+
+    def __count_tokens(self, request: dict, send: Callable[[dict], None]):
+        """Counts the tokens of texts with the warm encoder of a model."""
+
+        tokenizer = get_tokenizer(request["model"])
+        send({"counts": tokenizer.count_texts(request["texts"])})
+
+    def __record(self, model, usage, request: Tuple[float, int], ttft=None):
+        """Records the usage and timing of an answer in the metrics.
+
+        request is the perf_counter time the request was sent at and the number
+        of retries it took.
+        """
+        if usage is None:
+            return
+        start, retries = request
+        latency = time.perf_counter() - start
+        self.__metrics.record(
+            model=model,
+            prompt_tokens=usage.prompt_tokens,
+            completion_tokens=usage.completion_tokens,
+            latency=latency,
+            ttft=latency if ttft is None else ttft,
+            retries=retries,
+        )
+
+
+class DaemonClient:
+    """Talks to the daemon, and stands in for the OpenAI client of a chat session.
+
+    Only chat.completions.create is provided, it is all the chat uses.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.__path = path or config.DAEMON_SOCKET
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def ping(self) -> Optional[dict]:
+        """Returns the daemon status, or None if no daemon is listening."""
+
+        try:
+            return next(self.request({"command": "ping"}, timeout=1.0))
+        except (OSError, StopIteration, DaemonError):
+            return None
+
+    def stop(self) -> bool:
+        """Asks the daemon to exit, returns False if no daemon is listening."""
+
+        try:
+            next(self.request({"command": "stop"}, timeout=1.0))
+        except (OSError, StopIteration):
+            return False
+        return True
+
+    def request(self, request: dict, timeout: Optional[float] = None) -> Iterator[dict]:
+        """Sends a request, returns the events of the answer.
+
+        Raises OSError at once if no daemon is listening, and DaemonError for
+        an error event.
+        """
+        connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            connection.settimeout(timeout)
+            connection.connect(self.__path)
+            connection.sendall((json.dumps(request) + "\n").encode("utf-8"))
+        except OSError:
+            connection.close()
+            raise
+        return self.__events(connection)
+
+    def create(self, **kwargs):
+        """Requests a chat completion through the daemon, like the OpenAI client.
+
+        The errors of the request are raised as the OpenAI errors they were in
+        the daemon, and a lost daemon as a connection error.
+        """
+        # pylint: disable-next=import-outside-toplevel
+        from openai.types.chat import ChatCompletion, ChatCompletionChunk
+
+        try:
+            events = self.request(
+                {"command": "complete", "kwargs": kwargs}, kwargs.get("timeout")
+            )
+        except OSError as error:
+            message = f"Lost the daemon: {error}"
+            raise_openai_error({"type": "APIConnectionError", "message": message})
+        first = self.__next_event(events)
+
+        if "completion" in first:
+            events.close()
+            return ChatCompletion.model_validate(first["completion"])
+
+        def chunks():
+            event = first
+            try:
+                while "chunk" in event:
+                    yield ChatCompletionChunk.model_validate(event["chunk"])
+                    event = self.__next_event(events)
+            finally:
+                events.close()
+
+        return chunks()
+
+    def count_tokens(self, model: str, texts: List[str]) -> List[int]:
+        """Returns the token counts of texts, from the daemon's encoder of model."""
+
+        request = {"command": "count_tokens", "model": model, "texts": texts}
+        return next(self.request(request))["counts"]
+
+    @staticmethod
+    def __next_event(events: Iterator[dict]) -> dict:
+        """Returns the next event, raising the error events as OpenAI errors."""
+
+        try:
+            event = next(events)
+        except StopIteration:
+            message = "The daemon closed the connection."
+            event = {"error": {"type": "APIConnectionError", "message": message}}
+        except socket.timeout:
+            event = {"error": {"type": "APITimeoutError", "message": "Timed out."}}
+        except DaemonError as error:
+            event = {"error": error.args[1]}
+        except OSError as error:
+            message = f"Lost the daemon: {error}"
+            event = {"error": {"type": "APIConnectionError", "message": message}}
+        if "error" in event:
+            events.close()
+            raise_openai_error(event["error"])
+        return event
+
+    @staticmethod
+    def __events(connection: socket.socket) -> Iterator[dict]:
+        with connection, connection.makefile("rb") as reader:
+            for line in reader:
+                event = json.loads(line)
+                if "error" in event:
+                    raise DaemonError(event["error"]["message"], event["error"])
+                yield event
+
+
+class DaemonTokenizer(Tokenizer):
+    """Counts tokens with the daemon's warm encoder, for a chat session.
+
+    The session loads an encoder of its own only if the daemon went away, or to
+    cut a message at a token boundary.
+    """
+
+    def __init__(self, client: DaemonClient, model: str):
+        super().__init__(None)
+        self.__client = client
+        self.__model = model
+        self.__encoder = None
+
+    @property
+    def encoder(self):
+        if self.__encoder is None:
+            self.__encoder = get_encoder(self.__model)
+        return self.__encoder
+
+    def count_texts(self, texts: List[str]) -> List[int]:
+        try:
+            return self.__client.count_tokens(self.__model, texts)
+        except (OSError, StopIteration, DaemonError, KeyError):
+            return super().count_texts(texts)
+
+    def count_message(self, message: dict) -> int:
+        return self.count_messages([message])[0]
+
+
+def connect(path: Optional[str] = None) -> Optional[DaemonClient]:
+    """Returns a client of the running daemon, or None to work in-process."""
+
+    path = path or config.DAEMON_SOCKET
+    if not supported() or not os.path.exists(path):
+        return None
+    client = DaemonClient(path)
+    return client if client.ping() is not None else None
+
+
+def print_one_shot(printer: "Printer", events: Iterator[dict]):
+    """Prints the answer events of a one_shot request.
+
+    A streamed answer is printed as its deltas arrive, Ctrl-C closes the
+    connection and the daemon stops the request. A cached answer is printed at
+    once. Raises DaemonError if the daemon failed or closed the connection.
+    """
+    # pylint: disable=import-outside-toplevel
+    from yaspin import yaspin
+    from yaspin.spinners import Spinners
+
+    with yaspin(
+        Spinners.earth,
+        text=Style.BRIGHT + "Assistant:" + Style.RESET_ALL,
+        color="blue",
+        side="right",
+    ):
+        event = next(events, None)
+    if event is None:
+        raise DaemonError("The daemon closed the connection without an answer")
+
+    if "delta" in event:
+        rest = (later["delta"] for later in events if "delta" in later)
+        try:
+            printer.print_assistant_stream(itertools.chain([event["delta"]], rest))
+        except KeyboardInterrupt:
+            events.close()
+        return
+
+    if event["cached"]:
+        printer.typewriter.instant = True
+    printer.print_assistant_message(event["answer"])
@@ -1,23 +1,125 @@
 """Main module for the terminalgpt package."""
 
+import asyncio
+import functools
 import getpass
 import json
 import os
 import sys
 import time
+from typing import TYPE_CHECKING
 
 import click
 from colorama import Fore, Style
-from openai import OpenAI
-from prompt_toolkit import PromptSession, prompt
-from prompt_toolkit.completion import WordCompleter
-from prompt_toolkit.styles import Style as PromptStyle
 
-from terminalgpt import config
-from terminalgpt.chat import ChatManager
+from terminalgpt import config, models
 from terminalgpt.conversations import ConversationManager
-from terminalgpt.encryption import EncryptionManager
 from terminalgpt.printer import Printer, PrinterFactory, PrintUtils
+from terminalgpt.profiling import PROFILER, print_startup_report
+
+if TYPE_CHECKING:
+    from openai import OpenAI
+
+    from terminalgpt.chat import ChatManager
+
+
+def create_client(ctx) -> "OpenAI":
+    """Creates the OpenAI client with the decrypted API key."""
+
+    # pylint: disable=import-outside-toplevel
+    from openai import OpenAI
+
+    from terminalgpt.encryption import EncryptionManager
+    from terminalgpt.transport import TRANSPORT
+
+    ctx.obj["ENC_MNGR"] = EncryptionManager()
+
+    # requests are retried by the retry scheduler, not by the client
+    client = OpenAI(
+        api_key=ctx.obj["ENC_MNGR"].get_api_key(),
+        max_retries=0,
+        http_client=TRANSPORT.http_client,
+    )
+    # connect while the rest of the command starts up
+    TRANSPORT.prewarm(client.base_url)
+    return client
+
+
+def print_chat_settings(ctx, printer: Printer):
+    """Prints the model, token limit and style of a chat."""
+
+    token_limit = int(ctx.obj["TOKEN_LIMIT"] / 1000)
+    printer.printt(
+        f"{Style.RESET_ALL}{Style.BRIGHT}Model: {Style.RESET_ALL}{ctx.obj['MODEL']} "
+        f"{Style.BRIGHT}Token Limit: {Style.RESET_ALL}{token_limit}k "
+        f"{Style.RESET_ALL}{Style.BRIGHT}Style: {Style.RESET_ALL}{ctx.obj['STYLE']}"
+    )
+
+
+def setup_chat(ctx) -> "ChatManager":
+    """Creates the chat objects and the OpenAI client for the chatting commands."""
+
+    # pylint: disable=import-outside-toplevel
+    from prompt_toolkit import PromptSession
+    from prompt_toolkit.styles import Style as PromptStyle
+
+    from terminalgpt.chat import ChatManager
+    from terminalgpt.daemon import DaemonTokenizer, connect
+    from terminalgpt.metrics import MetricsStore
+
+    # the async engine keeps its own async client, in-process
+    client, tokenizer = None, None
+    if ctx.obj["DAEMON"] and ctx.obj["ENGINE"] == "sync":
+        client = connect()
+    if client is None:
+        client = create_client(ctx)
+    else:
+        # the tokens are counted by the daemon's warm encoder
+        tokenizer = DaemonTokenizer(client, ctx.obj["MODEL"])
+    ctx.obj["SESSION"] = PromptSession(
+        style=PromptStyle.from_dict({"prompt": "bold"}),
+        message="\nUser: ",
+    )
+    ctx.obj["CHAT"] = ChatManager(
+        conversations_manager=ctx.obj["CONV_MANAGER"],
+        token_limit=ctx.obj["CHAT_TOKEN_LIMIT"],
+        session=ctx.obj["SESSION"],
+        messages=[],
+        model=ctx.obj["MODEL"],
+        printer=ctx.obj["PRINTER"],
+        stream=ctx.obj["STREAM"],
+        compaction=ctx.obj["COMPACTION"],
+        context=ctx.obj["CONTEXT"],
+        tokenizer=tokenizer,
+    )
+
+    ctx.obj["CHAT"].client = client
+    ctx.obj["CHAT"].metrics = MetricsStore()
+    ctx.obj["CONV_MANAGER"].client = client
+
+    if ctx.obj["ENGINE"] == "async":
+        from openai import AsyncOpenAI
+
+        from terminalgpt.async_chat import AsyncChatManager
+        from terminalgpt.transport import TRANSPORT
+
+        ctx.obj["ASYNC_CHAT"] = AsyncChatManager(
+            chat_manager=ctx.obj["CHAT"],
+            conversations_manager=ctx.obj["CONV_MANAGER"],
+            session=ctx.obj["SESSION"],
+            model=ctx.obj["MODEL"],
+            printer=ctx.obj["PRINTER"],
+            stream=ctx.obj["STREAM"],
+            client=AsyncOpenAI(
+                api_key=ctx.obj["ENC_MNGR"].get_api_key(),
+                max_retries=0,
+                http_client=TRANSPORT.async_http_client,
+            ),
+            transport=TRANSPORT,
+        )
+
+    print_startup_report("chat ready")
+    return ctx.obj["CHAT"]
 
 
 @click.group()
@@ -25,7 +127,7 @@ from terminalgpt.printer import Printer, PrinterFactory, PrintUtils
 @click.option(
     "--model",
     "-m",
-    type=click.Choice(list(config.MODELS.keys())),
+    type=click.Choice(list(models.get_models())),
     default=config.get_default_config().get("model", "gpt-3.5-turbo"),
     show_default=True,
     help="Choose a model to use.",
@@ -46,17 +148,82 @@ from terminalgpt.printer import Printer, PrinterFactory, PrintUtils
     default=0,
     help="Set the token limit. this will override the default token limit for the chosen model.",
 )
+@click.option(
+    "--stream/--no-stream",
+    default=config.get_default_config().get("stream", False),
+    show_default=True,
+    help="Print answers while they are generated.",
+)
+@click.option(
+    "--engine",
+    type=click.Choice(["sync", "async"]),
+    default=config.get_default_config().get("engine", "sync"),
+    show_default=True,
+    help="Chat engine, the async one overlaps requests with typing, saving and printing.",
+)
+@click.option(
+    "--compaction",
+    type=click.Choice(["truncate", "summarize"]),
+    default=config.get_default_config().get("compaction", "truncate"),
+    show_default=True,
+    help="Past the token limit, drop the oldest messages or fold them into a summary.",
+)
+@click.option(
+    "--context",
+    type=click.Choice(["recent", "relevant"]),
+    default=config.get_default_config().get("context", "recent"),
+    show_default=True,
+    help="Send the most recent messages, or the last few and the older ones most relevant to the question.",
+)
+@click.option(
+    "--instant",
+    is_flag=True,
+    default=config.get_default_config().get("instant", False),
+    help="Print answers at once, without the typing effect. (default when the output is not a terminal)",
+)
+@click.option(
+    "--no-daemon",
+    is_flag=True,
+    help="Work in-process even if a daemon is running.",
+)
+@click.option(
+    "--profile",
+    is_flag=True,
+    help="Print how long the phases of every turn take.",
+)
+@click.option(
+    "--profile-output",
+    type=click.Path(dir_okay=False, writable=True),
+    default=None,
+    help="Also write a Chrome trace (.json) or a cProfile dump (any other name).",
+)
 @click.pass_context
-def cli(ctx, model, style: str, token_limit: int = 0):
+def cli(  # pylint: disable=too-many-arguments,too-many-positional-arguments
+    ctx,
+    model,
+    style: str,
+    token_limit: int = 0,
+    stream: bool = False,
+    engine: str = "sync",
+    compaction: str = "truncate",
+    context: str = "recent",
+    instant: bool = False,
+    no_daemon: bool = False,
+    profile: bool = False,
+    profile_output: str = None,
+):
     """*~ TerminalGPT - Your Personal Terminal Assistant ~*"""
 
-    max_token_limit = (
-        config.get_default_config().get("models", config.MODELS).get(model)
-    )
+    if profile or profile_output:
+        PROFILER.enable(profile_output)
+        ctx.call_on_close(PROFILER.finish)
+
+    model_info = models.get_model(model)
+    max_token_limit = model_info["context_window"]
     printer: Printer = PrinterFactory.get_printer("plain")
 
     if token_limit == 0:
-        token_limit = max_token_limit
+        token_limit = min(model_info["token_limit"], max_token_limit)
     elif token_limit > max_token_limit:
         printer.printt(
             Style.BRIGHT
@@ -65,7 +232,7 @@ def cli(ctx, model, style: str, token_limit: int = 0):
         )
         printer.printt(
             f"Model: {model} "
-            f"Default Token Limit: {int(max_token_limit/1000)}k "
+            f"Context Window: {int(max_token_limit/1000)}k "
             f"Your Token Limit: {int(token_limit/1000)}k "
         )
 
@@ -89,41 +256,48 @@ def cli(ctx, model, style: str, token_limit: int = 0):
         )
         sys.exit(1)
 
-    safety_buffer = token_limit * 0.25
     ctx.ensure_object(dict)
 
     ctx.obj["TOKEN_LIMIT"] = token_limit
+    ctx.obj["CHAT_TOKEN_LIMIT"] = models.chat_token_limit(model, token_limit)
     ctx.obj["STYLE"] = style
-    ctx.obj["PRINTER"] = PrinterFactory.get_printer(style)
+    ctx.obj["STREAM"] = stream
+    ctx.obj["ENGINE"] = engine
+    ctx.obj["COMPACTION"] = compaction
+    ctx.obj["CONTEXT"] = context
+    ctx.obj["DAEMON"] = not no_daemon
+    ctx.obj["PRINTER_OPTIONS"] = {
+        "instant": instant or None,  # None lets the printer check for a terminal
+        "cps": config.get_default_config().get("cps", config.PRINT_CPS),
+        "fps": config.get_default_config().get("fps", config.PRINT_FPS),
+    }
+    ctx.obj["PRINTER"] = PrinterFactory.get_printer(style, **ctx.obj["PRINTER_OPTIONS"])
     ctx.obj["MODEL"] = model
-    ctx.obj["ENC_MNGR"] = EncryptionManager()
     ctx.obj["CONV_MANAGER"] = ConversationManager(
         printer=ctx.obj["PRINTER"],
+        model=model,
     )
 
-    ctx.obj["SESSION"] = PromptSession(
-        style=PromptStyle.from_dict({"prompt": "bold"}),
-        message="\nUser: ",
-    )
-
-    ctx.obj["CHAT"] = ChatManager(
-        conversations_manager=ctx.obj["CONV_MANAGER"],
-        token_limit=int(token_limit - safety_buffer),
-        session=ctx.obj["SESSION"],
-        messages=[],
-        model=ctx.obj["MODEL"],
-        printer=ctx.obj["PRINTER"],
-    )
-
-    if ctx.obj['MODEL'] == ('o1-mini'):
+    if ctx.obj["MODEL"] == ("o1-mini"):
         config.INIT_SYSTEM_MESSAGE["role"] = "user"
         config.INIT_WELCOME_MESSAGE["role"] = "user"
         config.INIT_WELCOME_BACK_MESSAGE["role"] = "user"
+        config.WELCOME_BACK_UPDATE_MESSAGE["role"] = "user"
+
+    print_startup_report("cli ready")
+
 
 @click.command(help="Installing the OpenAI API key and setup some default settings.")
 def install():
     """Install the terminalgpt openai api key and create app directories."""
 
+    # pylint: disable=import-outside-toplevel
+    from prompt_toolkit import prompt
+    from prompt_toolkit.completion import WordCompleter
+    from prompt_toolkit.styles import Style as PromptStyle
+
+    from terminalgpt.encryption import EncryptionManager
+
     printer: Printer = PrinterFactory.get_printer(style="plain")
     enc_manager: EncryptionManager = EncryptionManager()
 
@@ -136,20 +310,20 @@ def install():
     printer.printt(f"{Style.BRIGHT}{Fore.GREEN}Great!{Style.RESET_ALL}\n")
     time.sleep(0.5)
 
-    models = list(config.MODELS.keys())
     printer.printt(
         f"{Style.BRIGHT}Please choose one of the models below to be your default model:"
     )
 
-    for model, token_limit in config.MODELS.items():
+    for model, model_info in models.get_models().items():
         printer.printt(
             f"{Style.BRIGHT} - Model: {Style.RESET_ALL}{model}"
-            f"{Style.BRIGHT}    tokens-limit: {Style.RESET_ALL}{int(int(token_limit)/1000)}k"
+            f"{Style.BRIGHT}    tokens-limit: {Style.RESET_ALL}"
+            f"{int(model_info['token_limit']/1000)}k"
         )
 
     model = prompt(
         "\nType the desired model (type gpt to see suggestions):\n",
-        completer=WordCompleter(models, ignore_case=True),
+        completer=WordCompleter(list(models.get_models()), ignore_case=True),
         style=PromptStyle.from_dict({"prompt": "bold lightblue"}),
         default="gpt-4o-mini",
     )
@@ -186,9 +360,7 @@ def install():
 
     # Save the default config to a file
     with open(config.DEFAULTS_PATH, "w", encoding="utf-8") as file:
-        json.dump(
-            {"model": model, "style": printing_style, "models": config.MODELS}, file
-        )
+        json.dump({"model": model, "style": printing_style}, file)
 
     printer.printt(PrintUtils.INSTALL_SUCCESS_MESSAGE)
     printer.printt(PrintUtils.INSTALL_ART)
@@ -200,26 +372,20 @@ def install():
 def new(ctx):
     """Start a new conversation."""
 
-    enc_manager: EncryptionManager = ctx.obj["ENC_MNGR"]
-    chat_manager: ChatManager = ctx.obj["CHAT"]
-    conversation_manager: ConversationManager = ctx.obj["CONV_MANAGER"]
+    chat_manager: ChatManager = setup_chat(ctx)
     printer: Printer = ctx.obj["PRINTER"]
-    client = OpenAI(api_key=enc_manager.get_api_key())
 
-    chat_manager.client = client
-    conversation_manager.client = client
-
-    token_limit = int(ctx.obj["TOKEN_LIMIT"] / 1000)
-    printer.printt(
-        f"{Style.RESET_ALL}{Style.BRIGHT}Model: {Style.RESET_ALL}{ctx.obj['MODEL']} "
-        f"{Style.BRIGHT}Token Limit: {Style.RESET_ALL}{token_limit}k "
-        f"{Style.RESET_ALL}{Style.BRIGHT}Style: {Style.RESET_ALL}{ctx.obj['STYLE']}"
-    )
+    print_chat_settings(ctx, printer)
 
     messages = [config.INIT_SYSTEM_MESSAGE]
-    chat_manager.welcome_message(messages + [config.INIT_WELCOME_MESSAGE])    
     chat_manager.messages = messages
-    chat_manager.chat_loop()
+    if ctx.obj["ENGINE"] == "async":
+        asyncio.run(
+            ctx.obj["ASYNC_CHAT"].chat_loop(messages + [config.INIT_WELCOME_MESSAGE])
+        )
+        return
+
+    chat_manager.chat_loop(messages + [config.INIT_WELCOME_MESSAGE])
 
 
 @cli.command(help="One shot question answer.")
@@ -228,46 +394,388 @@ def new(ctx):
     "question",
     type=str,
 )
+@click.option(
+    "--no-cache",
+    is_flag=True,
+    help="Ask the API even if the same question was answered before.",
+)
 @click.pass_context
-def one_shot(ctx, question):
+def one_shot(ctx, question, no_cache: bool = False):
     """One shot question answer."""
 
-    chat_manager: ChatManager = ctx.obj["CHAT"]
-    enc_manager: EncryptionManager = ctx.obj["ENC_MNGR"]
-    printer: Printer = ctx.obj["PRINTER"]
-    conversation_manager: ConversationManager = ctx.obj["CONV_MANAGER"]
+    messages = [config.INIT_SYSTEM_MESSAGE]
 
-    client = OpenAI(api_key=enc_manager.get_api_key())
+    messages.append({"role": "user", "content": question})
 
-    chat_manager.client = client
-    conversation_manager.client = client
+    if ctx.obj["DAEMON"] and ctx.obj["ENGINE"] == "sync":
+        if daemon_one_shot(ctx, messages, use_cache=not no_cache):
+            return
 
-    messages = [config.INIT_SYSTEM_MESSAGE]
+    # pylint: disable-next=import-outside-toplevel
+    from terminalgpt.cache import ResponseCache
 
-    messages.append({"role": "user", "content": question})
+    chat_manager: ChatManager = setup_chat(ctx)
+    printer: Printer = ctx.obj["PRINTER"]
+    response_cache = None if no_cache else ResponseCache()
 
     printer.printt("")
-    answer = chat_manager.get_user_answer(messages=messages)
+    if ctx.obj["ENGINE"] == "async":
+        asyncio.run(ctx.obj["ASYNC_CHAT"].one_shot(messages, cache=response_cache))
+        return
+
+    if chat_manager.stream:
+        chat_manager.stream_user_answer(messages=messages)
+        return
+
+    answer = chat_manager.get_user_answer(messages=messages, cache=response_cache)
     message = answer.choices[0].message.content
 
+    # a cached answer is printed at once
+    if response_cache is not None and response_cache.last_hit:
+        printer.typewriter.instant = True
     printer.print_assistant_message(message)
 
 
-@cli.command(help="Choose a previous conversation to load.")
+def daemon_one_shot(ctx, messages: list, use_cache: bool) -> bool:
+    """Answers a one shot question through the daemon.
+
+    Returns False, having printed nothing, if no daemon is running.
+    """
+    # pylint: disable=import-outside-toplevel
+    from terminalgpt.daemon import DaemonClient, DaemonError, print_one_shot, supported
+
+    if not supported() or not os.path.exists(config.DAEMON_SOCKET):
+        return False
+
+    printer: Printer = ctx.obj["PRINTER"]
+    request = {
+        "command": "one_shot",
+        "model": ctx.obj["MODEL"],
+        "messages": messages,
+        "stream": ctx.obj["STREAM"],
+        "cache": use_cache,
+    }
+    try:
+        events = DaemonClient().request(request)
+    except OSError:
+        return False
+
+    print_startup_report("daemon connected")
+    printer.printt("")
+    try:
+        print_one_shot(printer, events)
+    except (DaemonError, OSError) as error:
+        printer.printt(
+            Style.BRIGHT + Fore.RED + f"Daemon error: {error}" + Style.RESET_ALL
+        )
+        sys.exit(1)
+    return True
+
+
+@cli.command(help="Show the one shot answers cache statistics.")
+@click.option("--clear", is_flag=True, help="Remove all the cached answers.")
 @click.pass_context
-def load(ctx):
+def cache(ctx, clear: bool = False):
+    """Show or clear the one shot answers cache."""
+
+    # pylint: disable=import-outside-toplevel
+    from terminalgpt.cache import ResponseCache
+
+    printer: Printer = PrinterFactory.get_printer("plain", **ctx.obj["PRINTER_OPTIONS"])
+    response_cache = ResponseCache()
+
+    if clear:
+        removed = response_cache.clear()
+        printer.printt(
+            Style.BRIGHT
+            + Fore.LIGHTBLUE_EX
+            + f"\n** Cache cleared, {removed} answers removed. **\n"
+            + Style.RESET_ALL
+        )
+        return
+
+    cache_stats = response_cache.stats()
+    lookups = cache_stats["hits"] + cache_stats["misses"]
+    hit_rate = cache_stats["hits"] / lookups * 100 if lookups else 0
+    printer.printt(
+        Style.BRIGHT
+        + "\nCache:"
+        + Style.RESET_ALL
+        + f"""
+    Path: {config.CACHE_PATH}
+    Answers: {cache_stats["entries"]} ({cache_stats["size"] / 1024:.1f} KiB)
+    Hits: {cache_stats["hits"]} Misses: {cache_stats["misses"]} Hit rate: {hit_rate:.1f}%
+    """
+    )
+
+
+@cli.command(help="Search the messages of the saved conversations.")
+@click.argument("query", nargs=-1, required=True)
+@click.option(
+    "--limit",
+    "-n",
+    type=click.IntRange(min=1),
+    default=10,
+    show_default=True,
+    help="Maximum number of conversations found.",
+)
+@click.pass_context
+def search(ctx, query: tuple, limit: int = 10):
+    """Search the saved conversations, best matches first."""
+
+    printer: Printer = PrinterFactory.get_printer("plain", **ctx.obj["PRINTER_OPTIONS"])
+    conversation_manager: ConversationManager = ctx.obj["CONV_MANAGER"]
+
+    if not conversation_manager.search_available:
+        printer.printt(
+            Style.BRIGHT
+            + Fore.RED
+            + "\n** Search needs SQLite with FTS5, which this Python's sqlite3 "
+            + "module was built without. **\n"
+            + Style.RESET_ALL
+        )
+        return
+
+    hits = conversation_manager.search_conversations(
+        " ".join(query),
+        limit=limit,
+        highlight=(Style.BRIGHT + Fore.YELLOW, Style.RESET_ALL),
+    )
+    if not hits:
+        printer.printt(
+            Style.BRIGHT
+            + Fore.RED
+            + "\n** No conversations found! **\n"
+            + Style.RESET_ALL
+        )
+        return
+
+    printer.printt()
+    for number, hit in enumerate(hits, start=1):
+        printer.printt(
+            f"{Style.BRIGHT}{number}. {hit['conversation']}{Style.RESET_ALL}\n"
+            f"   {hit['role']}: {hit['snippet']}"
+        )
+    printer.printt(
+        Fore.LIGHTBLUE_EX
+        + f"Load one with: terminalgpt load {hits[0]['conversation']}"
+        + Style.RESET_ALL
+    )
+
+
+@cli.command(help="Show the latency and token statistics of the requests.")
+@click.option(
+    "--days",
+    "-d",
+    type=click.IntRange(min=1),
+    default=None,
+    help="Only the requests of the last days.",
+)
+@click.pass_context
+def stats(ctx, days: int = None):
+    """Show the request percentiles per model and per day."""
+
+    # pylint: disable=import-outside-toplevel
+    from terminalgpt.metrics import MetricsStore, day, format_summaries, summarize
+
+    printer: Printer = PrinterFactory.get_printer("plain", **ctx.obj["PRINTER_OPTIONS"])
+    since = time.time() - days * 24 * 60 * 60 if days else None
+    records = list(MetricsStore().read(since=since))
+
+    if not records:
+        printer.printt(
+            Style.BRIGHT
+            + Fore.LIGHTBLUE_EX
+            + "\n** No requests recorded yet. **\n"
+            + Style.RESET_ALL
+        )
+        return
+
+    for title, key in (("model", lambda record: record["model"]), ("day", day)):
+        printer.printt(
+            Style.BRIGHT + f"\nRequests per {title}:" + Style.RESET_ALL + "\n"
+        )
+        printer.printt(format_summaries(summarize(records, key)))
+
+
+@cli.command(help="Run a daemon keeping a warm client for the other commands.")
+@click.option(
+    "--idle-timeout",
+    type=click.IntRange(min=0),
+    default=config.DAEMON_IDLE_TIMEOUT,
+    show_default=True,
+    help="Exit after this many seconds without a request, 0 never exits.",
+)
+@click.option("--status", is_flag=True, help="Show whether a daemon is running.")
+@click.option("--stop", is_flag=True, help="Stop the running daemon.")
+@click.pass_context
+def daemon(ctx, idle_timeout: int, status: bool = False, stop: bool = False):
+    """Serve the one shot questions and chat requests over a Unix socket."""
+
+    # pylint: disable=import-outside-toplevel
+    from terminalgpt.daemon import DaemonClient, DaemonError, DaemonServer, supported
+
+    printer: Printer = PrinterFactory.get_printer("plain", **ctx.obj["PRINTER_OPTIONS"])
+    if not supported():
+        printer.printt(
+            Style.BRIGHT
+            + Fore.RED
+            + "\nThe daemon needs Unix sockets, this platform has none.\n"
+            + Style.RESET_ALL
+        )
+        sys.exit(1)
+
+    if status or stop:
+        client = DaemonClient()
+        info = client.ping()
+        if info is None:
+            printer.printt(
+                Style.BRIGHT
+                + Fore.LIGHTBLUE_EX
+                + "\n** No daemon is running. **\n"
+                + Style.RESET_ALL
+            )
+        elif stop:
+            client.stop()
+            printer.printt(f"\nStopped the daemon (pid {info['pid']}).\n")
+        else:
+            printer.printt(
+                f"\nDaemon pid {info['pid']}, up {int(info['uptime'])}s, "
+                f"{info['requests']} requests, listening on {config.DAEMON_SOCKET}\n"
+            )
+        return
+
+    server = DaemonServer(idle_timeout=idle_timeout)
+    try:
+        server.serve_forever(
+            ready=lambda: printer.printt(
+                Style.BRIGHT
+                + Fore.GREEN
+                + f"\nDaemon listening on {server.path} (pid {os.getpid()}).\n"
+                + Style.RESET_ALL
+            )
+        )
+    except DaemonError as error:
+        printer.printt(Style.BRIGHT + Fore.RED + f"\n{error}\n" + Style.RESET_ALL)
+        sys.exit(1)
+    except KeyboardInterrupt:
+        pass
+
+
+@cli.command(help="Answer one shot questions from a file or stdin concurrently.")
+@click.argument("prompts_file", type=click.File("r", encoding="utf-8"), default="-")
+@click.option(
+    "--output",
+    "-o",
+    type=click.File("w", encoding="utf-8"),
+    default="-",
+    help="Write the JSONL results to this file instead of stdout.",
+)
+@click.option(
+    "--concurrency",
+    "-c",
+    type=click.IntRange(min=1),
+    default=config.BATCH_CONCURRENCY,
+    show_default=True,
+    help="Number of questions asked at the same time.",
+)
+@click.option(
+    "--order",
+    type=click.Choice(["input", "completion"]),
+    default="input",
+    show_default=True,
+    help="Write the results in input order or as they complete.",
+)
+@click.pass_context
+def batch(ctx, prompts_file, output, concurrency: int, order: str):
+    """Answer one shot questions concurrently.
+
+    Reads a prompt per line, as plain text or JSON with a "prompt" key and an
+    optional "id", and writes a JSON result per line.
+    """
+
+    # pylint: disable=import-outside-toplevel
+    from terminalgpt.batch import BatchRunner, print_report, read_prompts
+    from terminalgpt.metrics import MetricsStore
+    from terminalgpt.transport import TRANSPORT
+
+    try:
+        prompts = read_prompts(prompts_file)
+    except ValueError as error:
+        raise click.BadParameter(str(error), param_hint="PROMPTS_FILE") from error
+
+    # a pooled connection per concurrent request
+    TRANSPORT.max_connections = max(TRANSPORT.max_connections, concurrency)
+
+    runner = BatchRunner(
+        client=create_client(ctx),
+        model=ctx.obj["MODEL"],
+        concurrency=concurrency,
+        order=order,
+        metrics=MetricsStore(),
+    )
+    print_report(runner.run(prompts, output))
+
+
+def fit_loaded_conversation(printer: Printer, chat_manager: "ChatManager") -> bool:
+    """Asks the user to shrink a loaded conversation over the token limit, and does.
+
+    Returns False if the user declined, and the loading is aborted.
+    """
+
+    # pylint: disable=import-outside-toplevel
+    from prompt_toolkit import prompt
+    from prompt_toolkit.styles import Style as PromptStyle
+
+    printer.printt(
+        Style.BRIGHT
+        + Fore.RED
+        + "Warning:\n"
+        + Style.RESET_ALL
+        + "The token length of this conversation is exceeding the token limit (+ some buffer) for the current model.\n"
+        + (
+            "We are about to reduce the token length by summarizing the oldest messages of the conversation.\n"
+            if chat_manager.compaction == "summarize"
+            else "We are about to reduce the token length by removing the oldest messages from the conversation.\n"
+        )
+    )
+    user_approval = prompt(
+        "Should we continue? (y/n)  ",
+        style=PromptStyle.from_dict({"prompt": "bold lightblue"}),
+    )
+
+    if user_approval.lower() != "y":
+        printer.printt(
+            Style.BRIGHT
+            + Fore.LIGHTBLUE_EX
+            + "\n** Conversation loading aborted! **\n"
+            + Style.RESET_ALL
+        )
+        return False
+
+    printer.printt("\nReducing token length...\n")
+    chat_manager.fit_context()
+    printer.printt(
+        f"{Style.BRIGHT}{Fore.GREEN}Token length reduced successfully!{Style.RESET_ALL}"
+    )
+    return True
+
+
+@cli.command(help="Choose a previous conversation to load, or load NAME.")
+@click.argument("name", required=False)
+@click.pass_context
+def load(ctx, name: str = None):
     """Load a previous conversation."""
 
-    printer: Printer = PrinterFactory.get_printer("plain")
-    chat_manager: ChatManager = ctx.obj["CHAT"]
-    enc_manager: EncryptionManager = ctx.obj["ENC_MNGR"]
+    # pylint: disable=import-outside-toplevel
+    from prompt_toolkit import prompt
+    from prompt_toolkit.completion import WordCompleter
+    from prompt_toolkit.styles import Style as PromptStyle
+
+    printer: Printer = PrinterFactory.get_printer("plain", **ctx.obj["PRINTER_OPTIONS"])
     conversation_manager: ConversationManager = ctx.obj["CONV_MANAGER"]
 
     messages = []
-    client = OpenAI(api_key=enc_manager.get_api_key())
-
-    chat_manager.client = client
-    conversation_manager.client = client
 
     # get conversations list
     conversations = conversation_manager.get_conversations()
@@ -282,20 +790,23 @@ def load(ctx):
     if conversation_manager.is_conversations_empty(files=conversations, message=msg):
         return
 
-    # setup file names auto-completion
-    completer = WordCompleter(conversations, ignore_case=True)
-    printer.printt(PrintUtils.CONVERSATIONS_INIT_MESSAGE)
+    if name:
+        # e.g. a search hit, no need to choose
+        conversation = name
+    else:
+        printer.printt(PrintUtils.CONVERSATIONS_INIT_MESSAGE)
 
-    # print conversations list
-    for conversation in conversations:
-        printer.printt(Style.BRIGHT + "- " + conversation)
+        # print conversations list
+        for conversation in conversations:
+            printer.printt(Style.BRIGHT + "- " + conversation)
 
-    # prompt user to choose a conversation and load it into messages
-    conversation = prompt(
-        "\nChoose a conversation:\n",
-        completer=completer,
-        style=PromptStyle.from_dict({"prompt": "bold lightblue"}),
-    )
+        # prompt user to choose a conversation and load it into messages
+        conversation = prompt(
+            "\nChoose a conversation:\n",
+            # file names auto-completion
+            completer=WordCompleter(conversations, ignore_case=True),
+            style=PromptStyle.from_dict({"prompt": "bold lightblue"}),
+        )
 
     # if conversation not found, return
     if conversation not in conversations:
@@ -307,14 +818,16 @@ def load(ctx):
         )
         return
 
+    chat_manager: ChatManager = setup_chat(ctx)
+
     # load conversation
     conversation_manager.conversation_name = conversation
     while not messages:
         messages = conversation_manager.load_conversation()
 
-    messages = [config.INIT_WELCOME_BACK_MESSAGE]
-    if ctx.obj['MODEL'] == ('o1-mini'):
-        messages[0]["role"] = "user"
+    messages.append(config.INIT_WELCOME_BACK_MESSAGE)
+    if ctx.obj["MODEL"] == ("o1-mini"):
+        messages[-1]["role"] = "user"
 
     chat_manager.messages = messages
     chat_manager.total_usage = chat_manager.num_tokens_from_messages()
@@ -326,42 +839,16 @@ def load(ctx):
         + f"""
     Name: {conversation}
     Model: {ctx.obj["MODEL"]}
-    Token Limit: {config.MODELS[ctx.obj["MODEL"]]}
+    Token Limit: {ctx.obj["TOKEN_LIMIT"]}
     Current Token length: {chat_manager.total_usage}
     """
     )
 
-    if chat_manager.exceeding_token_limit():
-        printer.printt(
-            Style.BRIGHT
-            + Fore.RED
-            + "Warning:\n"
-            + Style.RESET_ALL
-            + "The token length of this conversation is exceeding the token limit (+ some buffer) for the current model.\n"
-            "We are about to reduce the token length by removing the oldest messages from the conversation.\n"
-        )
-        user_approval = prompt(
-            "Should we continue? (y/n)  ",
-            style=PromptStyle.from_dict({"prompt": "bold lightblue"}),
-        )
-
-        if user_approval.lower() != "y":
-            printer.printt(
-                Style.BRIGHT
-                + Fore.LIGHTBLUE_EX
-                + "\n** Conversation loading aborted! **\n"
-                + Style.RESET_ALL
-            )
+    # the relevant context is selected from the whole conversation on every turn
+    if chat_manager.context != "relevant" and chat_manager.exceeding_token_limit():
+        if not fit_loaded_conversation(printer, chat_manager):
             return
 
-        printer.printt(
-            "\nReducing token length by removing the oldest messages from the conversation...\n"
-        )
-        chat_manager.reduce_tokens()
-        printer.printt(
-            f"{Style.BRIGHT}{Fore.GREEN}Token length reduced successfully!{Style.RESET_ALL}"
-        )
-
     printer.printt(
         Style.BRIGHT
         + Fore.LIGHTBLUE_EX
@@ -373,18 +860,31 @@ def load(ctx):
         + "- - - - - - - - - - - - - - - - - - - - - - - - -"
         + Style.RESET_ALL
     )
-    token_limit = int(config.MODELS[ctx.obj["MODEL"]] / 1000)
-    printer.printt(
-        f"{Style.RESET_ALL}{Style.BRIGHT}Model: {Style.RESET_ALL}{ctx.obj['MODEL']} "
-        f"{Style.BRIGHT}Token Limit: {Style.RESET_ALL}{token_limit}k "
-        f"{Style.RESET_ALL}{Style.BRIGHT}Style: {Style.RESET_ALL}{ctx.obj['STYLE']}"
-    )
+    print_chat_settings(ctx, printer)
 
-    chat_manager.welcome_message(messages=messages)
+    # the welcome back request only counted for the token limit
     messages.pop()
-
     chat_manager.messages = messages
-    chat_manager.chat_loop()
+    conversation_manager.retry_title(messages)
+
+    # an unchanged conversation gets the welcome back message of its last load,
+    # a grown one gets it updated with the new turns
+    welcome_messages, on_welcome = None, None
+    welcome = conversation_manager.cached_welcome(messages)
+    if welcome is not None:
+        print()
+        ctx.obj["PRINTER"].print_assistant_message(welcome)
+    else:
+        welcome_messages = conversation_manager.welcome_back_messages(messages)
+        on_welcome = functools.partial(
+            conversation_manager.save_welcome, list(messages)
+        )
+
+    if ctx.obj["ENGINE"] == "async":
+        asyncio.run(ctx.obj["ASYNC_CHAT"].chat_loop(welcome_messages, on_welcome))
+        return
+
+    chat_manager.chat_loop(welcome_messages, on_welcome)
 
 
 @click.command(help="Choose a previous conversation to delete.")
@@ -392,7 +892,12 @@ def load(ctx):
 def delete(ctx):
     """Delete previous conversations."""
 
-    printer: Printer = PrinterFactory.get_printer("plain")
+    # pylint: disable=import-outside-toplevel
+    from prompt_toolkit import prompt
+    from prompt_toolkit.completion import WordCompleter
+    from prompt_toolkit.styles import Style as PromptStyle
+
+    printer: Printer = PrinterFactory.get_printer("plain", **ctx.obj["PRINTER_OPTIONS"])
     conv_manager: ConversationManager = ctx.obj["CONV_MANAGER"]
     printer.printt(PrintUtils.CONVERSATIONS_INIT_MESSAGE)
 
@@ -459,6 +964,23 @@ def delete(ctx):
             return
 
 
+@cli.command(help="Rebuild the conversations index from the conversations directory.")
+@click.pass_context
+def rebuild_index(ctx):
+    """Rebuild the conversations index."""
+
+    printer: Printer = PrinterFactory.get_printer("plain", **ctx.obj["PRINTER_OPTIONS"])
+    conv_manager: ConversationManager = ctx.obj["CONV_MANAGER"]
+
+    conversations_count = conv_manager.rebuild_index()
+    printer.printt(
+        Style.BRIGHT
+        + Fore.LIGHTBLUE_EX
+        + f"\n** Conversations index rebuilt, {conversations_count} conversations found. **\n"
+        + Style.RESET_ALL
+    )
+
+
 cli.add_command(install)
 cli.add_command(new)
 cli.add_command(load)
@@ -0,0 +1,167 @@
+"""Local store of per request latency and token metrics.
+
+Every answered request appends one fixed-size binary record (see RECORD) to the
+metrics file, a single small write that costs the same on every turn. When the
+file grows past its size limit it is rotated to "<path>.1", replacing the
+previous rotation, so the store keeps between one and two files worth of
+history.
+"""
+
+import math
+import os
+import struct
+import threading
+import time
+from collections import defaultdict
+from typing import Callable, Dict, Iterator, List, Optional
+
+from terminalgpt import config
+
+FIELDS = (
+    "time",
+    "model",
+    "prompt_tokens",
+    "completion_tokens",
+    "ttft",
+    "latency",
+    "tokens_per_second",
+    "retries",
+)
+RECORD = struct.Struct("<d24sIIfffH")  # FIELDS, 54 bytes
+MODEL_SIZE = 24
+
+
+class MetricsStore:
+    """Appends and reads the request metrics records."""
+
+    def __init__(self, **kwargs):
+        self.__path: str = kwargs.get("path", config.METRICS_PATH)
+        self.__max_bytes: int = kwargs.get("max_bytes", config.METRICS_MAX_BYTES)
+        self.__lock = threading.Lock()
+
+    @property
+    def path(self) -> str:
+        return self.__path
+
+    def record(self, **kwargs):
+        """Appends the metrics of a request.
+
+        kwargs are model, prompt_tokens, completion_tokens, latency in seconds and
+        optionally ttft (time to first token, the latency when not streamed) and
+        retries. Write errors are ignored, metrics never break a chat.
+        """
+        latency: float = kwargs["latency"]
+        ttft: float = kwargs.get("ttft", latency)
+        completion_tokens: int = kwargs["completion_tokens"]
+
+        # a streamed answer is generated after its first token
+        generation = latency - ttft if latency > ttft else latency
+        tokens_per_second = completion_tokens / generation if generation > 0 else 0.0
+
+        record = RECORD.pack(
+            kwargs.get("time", time.time()),
+            kwargs["model"].encode("utf-8")[:MODEL_SIZE],
+            kwargs["prompt_tokens"],
+            completion_tokens,
+            ttft,
+            latency,
+            tokens_per_second,
+            min(kwargs.get("retries", 0), 0xFFFF),
+        )
+
+        with self.__lock:
+            try:
+                os.makedirs(os.path.dirname(self.__path), exist_ok=True)
+                if self.__size() + RECORD.size > self.__max_bytes:
+                    os.replace(self.__path, self.__path + ".1")
+                with open(self.__path, "ab") as file:
+                    file.write(record)
+            except OSError:
+                pass
+
+    def read(self, since: Optional[float] = None) -> Iterator[dict]:
+        """Yields the records, oldest first, optionally only those after since."""
+
+        for path in (self.__path + ".1", self.__path):
+            try:
+                with open(path, "rb") as file:
+                    data = file.read()
+            except OSError:
+                continue
+
+            # a torn last record of an interrupted write is skipped
+            end = len(data) - len(data) % RECORD.size
+            for values in RECORD.iter_unpack(data[:end]):
+                record = dict(zip(FIELDS, values))
+                if since is not None and record["time"] < since:
+                    continue
+                model = record["model"].rstrip(b"\0")
+                record["model"] = model.decode("utf-8", "ignore")
+                yield record
+
+    def __size(self) -> int:
+        try:
+            return os.path.getsize(self.__path)
+        except OSError:
+            return 0
+
+
+def percentile(values: List[float], percent: float) -> float:
+    """Returns the nearest-rank percentile of values."""
+
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(math.ceil(percent / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+def summarize(records: Iterator[dict], key: Callable[[dict], str]) -> Dict[str, dict]:
+    """Groups the records by key, returns the percentiles and totals of every group."""
+
+    groups: Dict[str, List[dict]] = defaultdict(list)
+    for record in records:
+        groups[key(record)].append(record)
+
+    summaries = {}
+    for name in sorted(groups):
+        group = groups[name]
+        latencies = [record["latency"] for record in group]
+        ttfts = [record["ttft"] for record in group]
+        rates = [record["tokens_per_second"] for record in group]
+        summaries[name] = {
+            "requests": len(group),
+            "latency_p50": percentile(latencies, 50),
+            "latency_p95": percentile(latencies, 95),
+            "ttft_p50": percentile(ttfts, 50),
+            "ttft_p95": percentile(ttfts, 95),
+            "tokens_per_second_p50": percentile(rates, 50),
+            "prompt_tokens": sum(record["prompt_tokens"] for record in group),
+            "completion_tokens": sum(record["completion_tokens"] for record in group),
+            "retries": sum(record["retries"] for record in group),
+        }
+    return summaries
+
+
+def format_summaries(summaries: Dict[str, dict]) -> str:
+    """Returns the summaries of summarize() as a table, one row per group."""
+
+    rows = [
+        f"    {'':<14}{'requests':>9}{'latency p50/p95':>18}"
+        f"{'TTFT p50/p95':>16}{'tok/s p50':>11}{'tokens in/out':>16}{'retries':>9}"
+    ]
+    for name, summary in summaries.items():
+        latency = f"{summary['latency_p50']:.2f}/{summary['latency_p95']:.2f}s"
+        ttft = f"{summary['ttft_p50']:.2f}/{summary['ttft_p95']:.2f}s"
+        tokens = f"{summary['prompt_tokens']}/{summary['completion_tokens']}"
+        rows.append(
+            f"    {name:<14}{summary['requests']:>9}{latency:>18}{ttft:>16}"
+            f"{summary['tokens_per_second_p50']:>11.1f}{tokens:>16}"
+            f"{summary['retries']:>9}"
+        )
+    return "\n".join(rows)
+
+
+def day(record: dict) -> str:
+    """Returns the local day of a record, as YYYY-MM-DD."""
+    return time.strftime("%Y-%m-%d", time.localtime(record["time"]))
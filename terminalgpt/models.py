@@ -0,0 +1,105 @@
+"""Model registry: the tokenizer, context window and maximum output of every model.
+
+The built-in models are config.MODELS. The "models" of defaults.json override
+them field by field, and may add new models. A number alone sets the token limit
+of a model, as in the defaults.json files of older versions:
+
+    "models": {
+        "gpt-4o": {"token_limit": 64000},
+        "gpt-4.1": {"encoding": "o200k_base", "context_window": 1047576},
+        "o1-mini": 32000
+    }
+
+A model without an encoding uses the one tiktoken knows it by, or
+config.ENCODING_MODEL. Encoders are loaded once per encoding and shared by the
+whole process.
+"""
+
+import threading
+from functools import lru_cache
+from typing import TYPE_CHECKING, Dict
+
+from terminalgpt import config
+
+if TYPE_CHECKING:
+    from tiktoken.core import Encoding
+
+    from terminalgpt.tokens import Tokenizer
+
+# fields of a model missing from both config.MODELS and defaults.json
+UNKNOWN_MODEL = {
+    "encoding": None,
+    "context_window": 16385,
+    "max_output": 4096,
+    "token_limit": 16385,
+}
+
+_ENCODERS: Dict[str, "Encoding"] = {}
+_ENCODERS_LOCK = threading.Lock()
+
+
+@lru_cache(maxsize=None)
+def get_models() -> Dict[str, dict]:
+    """Returns the models of config.MODELS with the overrides of defaults.json."""
+
+    models = {name: dict(model) for name, model in config.MODELS.items()}
+    for name, override in config.get_default_config().get("models", {}).items():
+        if isinstance(override, (int, float)):
+            override = {"token_limit": int(override)}
+        models[name] = {**UNKNOWN_MODEL, **models.get(name, {}), **override}
+    return models
+
+
+def get_model(model: str) -> dict:
+    """Returns the registry entry of a model."""
+
+    return get_models().get(model, UNKNOWN_MODEL)
+
+
+def encoding_name(model: str) -> str:
+    """Returns the name of the tokenizer encoding of a model."""
+
+    encoding = get_model(model)["encoding"]
+    if encoding:
+        return encoding
+
+    # pylint: disable-next=import-outside-toplevel
+    import tiktoken
+
+    try:
+        return tiktoken.encoding_name_for_model(model)
+    except KeyError:
+        return config.ENCODING_MODEL
+
+
+def get_encoder(model: str) -> "Encoding":
+    """Returns the tokenizer encoder of a model, loaded on first use."""
+
+    name = encoding_name(model)
+    with _ENCODERS_LOCK:
+        if name not in _ENCODERS:
+            # pylint: disable-next=import-outside-toplevel
+            import tiktoken
+
+            _ENCODERS[name] = tiktoken.get_encoding(name)
+        return _ENCODERS[name]
+
+
+def get_tokenizer(model: str) -> "Tokenizer":
+    """Returns a tokenizer counting tokens like model does."""
+
+    # pylint: disable-next=import-outside-toplevel
+    from terminalgpt.tokens import Tokenizer
+
+    return Tokenizer(get_encoder(model))
+
+
+def chat_token_limit(model: str, token_limit: int) -> int:
+    """Returns the tokens of history a chat of model may send.
+
+    A quarter of the token limit is kept as a safety buffer, and the history
+    always leaves room in the context window for a full answer.
+    """
+
+    entry = get_model(model)
+    return min(int(token_limit * 0.75), entry["context_window"] - entry["max_output"])
@@ -1,19 +1,62 @@
 """This module contains the Printer class, which is responsible for printing messages to the user."""
 
 import random
+import sys
 import time
 from abc import ABC, abstractmethod
-from typing import List
+from typing import Iterable, List, Optional, Tuple
 
 from colorama import Fore, Style
-from rich.console import Console
-from rich.markdown import Markdown
 
 from terminalgpt import config
+from terminalgpt.profiling import profiled
+
+
+class Typewriter:
+    """Types text at a target characters per second, flushing one chunk per frame.
+
+    Instead of a write, flush and sleep per character, the text is written in
+    chunks of cps / fps characters, and each frame sleeps only what is left of
+    it after writing. Instant mode writes everything at once.
+    """
+
+    def __init__(self, cps: float, fps: float, instant: bool = False):
+        self.cps = cps
+        self.fps = fps
+        self.instant = instant
+
+    @profiled("print")
+    def write(self, text: str, cps: Optional[float] = None):
+        """Types text, at cps characters per second if given."""
+
+        if self.instant or not text:
+            sys.stdout.write(text)
+            sys.stdout.flush()
+            return
+
+        frame = 1 / self.fps
+        chunk_size = max(1, round((cps or self.cps) * frame))
+        start = time.perf_counter()
+
+        for frame_number, offset in enumerate(range(0, len(text), chunk_size), 1):
+            sys.stdout.write(text[offset : offset + chunk_size])
+            sys.stdout.flush()
+            delay = start + frame_number * frame - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
 
 
 class Printer(ABC):
-    PRINT_DELAY = 0.002
+    def __init__(
+        self,
+        instant: Optional[bool] = None,
+        cps: float = config.PRINT_CPS,
+        fps: float = config.PRINT_FPS,
+    ):
+        # Typing effects are pointless when the output is not a terminal
+        if instant is None:
+            instant = not sys.stdout.isatty()
+        self.typewriter = Typewriter(cps=cps, fps=fps, instant=instant)
 
     @abstractmethod
     def printt(self, text: str = ""):
@@ -22,13 +65,43 @@ class Printer(ABC):
     def print_assistant_message(self, message, color=Fore.YELLOW):
         pass
 
+    def print_assistant_stream(self, chunks: Iterable[str], color=Fore.YELLOW) -> str:
+        """Prints the assistant message chunk by chunk as it arrives, returns the full message."""
+        parts = []
+        print(Style.BRIGHT + "Assistant:" + Style.RESET_ALL)
+        stream = self.open_stream(color)
+        try:
+            for chunk in chunks:
+                parts.append(chunk)
+                stream.feed(chunk)
+        finally:
+            stream.close()
+        return "".join(parts)
+
+    def open_stream(self, color=Fore.YELLOW) -> "TextStream":
+        """Returns a stream to feed a message into while it arrives."""
+        return TextStream(color)
+
+
+class TextStream:
+    """Prints a streamed text as it arrives."""
+
+    def __init__(self, color=Fore.YELLOW):
+        print(color, end="", flush=True)
+
+    def feed(self, text: str):
+        """Prints streamed text."""
+        print(text, end="", flush=True)
+
+    def close(self):
+        """Ends the streamed text."""
+        print(Style.RESET_ALL)
+
 
 class PlainPrinter(Printer):
     def printt(self, text: str = ""):
         try:
-            for char in text:
-                print(char, end="", flush=True)
-                time.sleep(self.PRINT_DELAY)
+            self.typewriter.write(text)
         except KeyboardInterrupt:
             print()
         finally:
@@ -41,21 +114,35 @@ class PlainPrinter(Printer):
 
 
 class MarkdownPrinter(Printer):
-    def __init__(self):
-        self.__console = Console()
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.__console = None
+
+    @property
+    def console(self):
+        """The rich console, rich is only imported once something is printed."""
+        if self.__console is None:
+            # pylint: disable-next=import-outside-toplevel
+            from rich.console import Console
+
+            self.__console = Console()
+        return self.__console
 
     def printt(self, text: str = "", style="yellow"):
+        # pylint: disable-next=import-outside-toplevel
+        from rich.markdown import Markdown
+
         text_markdown = ""
         txt_arr = self._split_highlighted_string(text)
         for txt in txt_arr:
-            with self.__console.capture() as capture:
+            with self.console.capture() as capture:
                 text_markdown = Markdown(txt)
-                self.__console.print(text_markdown, style=style)
+                self.console.print(text_markdown, style=style)
             text_markdown = capture.get()
             if txt.startswith("```"):
-                delay = self.PRINT_DELAY / 14
+                delay = 1 / (self.typewriter.cps * 14)
             else:
-                delay = self.PRINT_DELAY
+                delay = 1 / self.typewriter.cps
             self._print_with_delay(text_markdown, delay)
 
     def print_assistant_message(self, message, color=Fore.YELLOW):
@@ -63,6 +150,37 @@ class MarkdownPrinter(Printer):
         print(Style.BRIGHT + "Assistant:" + Style.RESET_ALL)
         self.printt(color + message + Style.RESET_ALL)
 
+    def open_stream(self, color=Fore.YELLOW) -> "MarkdownStream":
+        """Returns a stream rendering a message as markdown while it arrives."""
+        return MarkdownStream(self)
+
+    def split_complete_blocks(self, string: str) -> Tuple[List[str], str]:
+        """Splits the finished markdown blocks off a text that is still being written.
+
+        Finished blocks are closed code blocks and paragraphs followed by an
+        empty line. Returns them and the trailing open block.
+        """
+        blocks = []
+        consumed = 0
+        pieces = self._split_highlighted_string(string)
+
+        for index, piece in enumerate(pieces[:-1]):
+            # odd pieces are closed code blocks, even ones are the text between
+            if index % 2 or piece.strip():
+                blocks.append(piece)
+            consumed += len(piece)
+
+        # the last piece is text, maybe followed by a code block still open
+        last = pieces[-1]
+        fence = last.find("```")
+        paragraph_end = (last if fence == -1 else last[:fence]).rfind("\n\n")
+        if paragraph_end != -1:
+            if last[:paragraph_end].strip():
+                blocks.append(last[:paragraph_end])
+            consumed += paragraph_end + 2
+
+        return blocks, string[consumed:]
+
     def _split_highlighted_string(self, string: str) -> List[str]:
         result = []
         start = 0
@@ -82,22 +200,89 @@ class MarkdownPrinter(Printer):
 
     def _print_with_delay(self, text: str, delay: float):
         try:
-            for char in text:
-                print(char, end="", flush=True)
-                time.sleep(delay)
+            self.typewriter.write(text, cps=1 / delay)
         except KeyboardInterrupt:
             print()
         finally:
             print()
 
 
+class MarkdownStream:
+    """Renders a markdown text incrementally while it is streamed.
+
+    Finished blocks are rendered and printed once, as soon as they are complete.
+    Only the trailing open block is re-rendered as text arrives, in a live region
+    refreshed at the printer frame rate.
+    """
+
+    def __init__(self, printer: MarkdownPrinter, style="yellow"):
+        self.__printer = printer
+        self.__style = style
+        self.__buffer = ""
+        self.__live = None
+
+    def feed(self, text: str):
+        """Adds streamed text, printing the blocks it completes."""
+        self.__buffer += text
+        blocks, self.__buffer = self.__printer.split_complete_blocks(self.__buffer)
+        for block in blocks:
+            self.__commit(block)
+
+        if self.__buffer.strip():
+            self.__update_live()
+        elif blocks and self.__live is not None:
+            # the live region still shows the text just printed above it
+            self.__live.update("")
+
+    def close(self):
+        """Prints the last block, finished or not."""
+        if self.__buffer.strip():
+            self.__commit(self.__buffer)
+        self.__buffer = ""
+
+        if self.__live is not None:
+            self.__live.stop()
+            self.__live = None
+
+    @profiled("render")
+    def __commit(self, block: str):
+        # pylint: disable-next=import-outside-toplevel
+        from rich.markdown import Markdown
+
+        # while live, the console prints above the live region
+        self.__printer.console.print(Markdown(block), style=self.__style)
+
+    def __update_live(self):
+        # pylint: disable-next=import-outside-toplevel
+        from rich.markdown import Markdown
+
+        if self.__printer.typewriter.instant:
+            return  # not a terminal, blocks are printed once finished
+
+        renderable = Markdown(self.__buffer, style=self.__style)
+        if self.__live is None:
+            # pylint: disable-next=import-outside-toplevel
+            from rich.live import Live
+
+            self.__live = Live(
+                renderable,
+                console=self.__printer.console,
+                transient=True,
+                refresh_per_second=self.__printer.typewriter.fps,
+            )
+            self.__live.start()
+        else:
+            self.__live.update(renderable)
+
+
 class PrinterFactory:
     @staticmethod
-    def get_printer(style: str) -> Printer:
+    def get_printer(style: str, **kwargs) -> Printer:
+        """Returns a printer, kwargs are passed to the printer (instant, cps, fps)."""
         if style == "plain":
-            return PlainPrinter()
+            return PlainPrinter(**kwargs)
         if style == "markdown":
-            return MarkdownPrinter()
+            return MarkdownPrinter(**kwargs)
 
         raise ValueError(f"Invalid style: {style}")
 
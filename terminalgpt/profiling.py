@@ -0,0 +1,228 @@
+"""Lightweight span profiling of the chat phases, enabled with --profile.
+
+Instrumented code wraps a phase in a span (or a @profiled method). When
+profiling is off, a span is a shared no-op, so the phases only pay an attribute
+check. When it is on, the spans of every turn are summed up per phase and
+printed to stderr before the next prompt, and all the spans can be written as a
+Chrome trace (chrome://tracing, Perfetto), or the whole run as a cProfile dump.
+
+Independently of --profile, print_startup_report() prints how long the CLI took
+to start up, on LOG_LEVEL=DEBUG.
+"""
+
+import functools
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+from typing import Callable, List, Optional, Tuple
+
+from colorama import Fore, Style
+
+from terminalgpt import STARTUP_TIME
+
+
+class _NullSpan:
+    """Span of a disabled profiler, does nothing."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        return False
+
+
+NULL_SPAN = _NullSpan()
+
+
+class Span:
+    """Times a phase and records it in its profiler."""
+
+    def __init__(self, profiler: "Profiler", name: str):
+        self.__profiler = profiler
+        self.__name = name
+        self.__start = 0.0
+
+    def __enter__(self):
+        self.__start = time.perf_counter()
+        return self
+
+    def __exit__(self, *_):
+        self.__profiler.record(self.__name, self.__start, time.perf_counter())
+        return False
+
+
+class Profiler:
+    """Collects spans and prints a per turn breakdown of them."""
+
+    def __init__(self):
+        self.enabled = False
+        self.__output: Optional[str] = None
+        self.__lock = threading.Lock()
+        self.__origin = time.perf_counter()
+        self.__turn_start: Optional[float] = None
+        self.__turn_label = "Turn"
+        self.__turn_spans: List[Tuple[str, float, bool]] = []
+        self.__trace_events: List[dict] = []
+        self.__cprofile = None
+
+    def enable(self, output: Optional[str] = None):
+        """Enables profiling, output is a Chrome trace .json or a cProfile dump path."""
+
+        self.enabled = True
+        self.__output = output
+        # until the first prompt, everything the command does counts as a turn
+        self.begin_turn("Command")
+        if output and not output.endswith(".json"):
+            # pylint: disable-next=import-outside-toplevel
+            import cProfile
+
+            self.__cprofile = cProfile.Profile()
+            self.__cprofile.enable()
+
+    def span(self, name: str):
+        """Returns a context manager timing the phase name."""
+
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, name)
+
+    def record(self, name: str, start: float, end: float):
+        """Records a finished span."""
+
+        thread = threading.current_thread()
+        background = thread is not threading.main_thread()
+        with self.__lock:
+            if self.__turn_start is not None:
+                self.__turn_spans.append((name, end - start, background))
+            if self.__output and self.__output.endswith(".json"):
+                self.__trace_events.append(
+                    {
+                        "name": name,
+                        "ph": "X",
+                        "ts": (start - self.__origin) * 1e6,
+                        "dur": (end - start) * 1e6,
+                        "pid": os.getpid(),
+                        "tid": thread.ident,
+                    }
+                )
+
+    def begin_turn(self, label: str = "Turn"):
+        """Starts collecting the spans of a turn."""
+
+        if not self.enabled:
+            return
+        with self.__lock:
+            self.__turn_start = time.perf_counter()
+            self.__turn_label = label
+            self.__turn_spans = []
+
+    def end_turn(self):
+        """Prints the breakdown of the current turn, if there is one."""
+
+        if not self.enabled or self.__turn_start is None:
+            return
+        with self.__lock:
+            duration = time.perf_counter() - self.__turn_start
+            spans, self.__turn_spans = self.__turn_spans, []
+            self.__turn_start = None
+
+        print_breakdown(self.__turn_label, duration, spans)
+
+    def finish(self):
+        """Ends the current turn and writes the output file."""
+
+        self.end_turn()
+        if not self.enabled or not self.__output:
+            return
+
+        if self.__cprofile is not None:
+            self.__cprofile.disable()
+            self.__cprofile.dump_stats(self.__output)
+        else:
+            # pylint: disable-next=import-outside-toplevel
+            import json
+
+            with self.__lock, open(self.__output, "w", encoding="utf-8") as file:
+                json.dump({"traceEvents": self.__trace_events}, file)
+
+        print(
+            Fore.LIGHTBLUE_EX + f"Profile written to {self.__output}" + Style.RESET_ALL,
+            file=sys.stderr,
+        )
+
+
+def print_breakdown(label: str, duration: float, spans: List[Tuple[str, float, bool]]):
+    """Prints the total time and count of every phase of a turn, to stderr."""
+
+    totals = defaultdict(lambda: [0.0, 0, False])
+    for name, span_duration, background in spans:
+        totals[name][0] += span_duration
+        totals[name][1] += 1
+        totals[name][2] = totals[name][2] or background
+
+    lines = [f"{label}: {duration * 1000:.1f} ms"]
+    for name, (total, count, background) in sorted(
+        totals.items(), key=lambda item: -item[1][0]
+    ):
+        lines.append(
+            f"  {name:<10}{total * 1000:>10.1f} ms {count:>3}x"
+            + (" (background)" if background else "")
+        )
+
+    print(
+        Fore.LIGHTBLUE_EX + "\n".join(lines) + Style.RESET_ALL,
+        file=sys.stderr,
+    )
+
+
+# Modules that are only imported by the commands that need them
+HEAVY_MODULES = [
+    "openai",
+    "tiktoken",
+    "rich",
+    "cryptography",
+    "yaspin",
+    "prompt_toolkit",
+]
+
+
+def print_startup_report(stage: str):
+    """Prints the time since startup and the heavy modules loaded so far, on LOG_LEVEL=DEBUG."""
+
+    if os.environ.get("LOG_LEVEL") != "DEBUG":
+        return
+
+    elapsed = (time.perf_counter() - STARTUP_TIME) * 1000
+    loaded = [module for module in HEAVY_MODULES if module in sys.modules]
+    print(
+        Fore.LIGHTBLUE_EX
+        + f"Startup ({stage}): {elapsed:.1f} ms, loaded: {', '.join(loaded) or 'none'}"
+        + Style.RESET_ALL,
+        file=sys.stderr,
+    )
+
+
+PROFILER = Profiler()
+
+
+def span(name: str):
+    """Returns a context manager timing the phase name on the global profiler."""
+    return PROFILER.span(name)
+
+
+def profiled(name: str) -> Callable:
+    """Decorates a function to be timed as the phase name."""
+
+    def decorator(function: Callable) -> Callable:
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not PROFILER.enabled:
+                return function(*args, **kwargs)
+            with PROFILER.span(name):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,159 @@
+"""Local BM25 retrieval over the messages of a conversation.
+
+The index is an inverted index of term frequencies, updated one document at a
+time, so appending a message only tokenizes that message. Scores are Okapi
+BM25 with the usual k1 and b parameters, computed from the postings of the
+query terms only.
+"""
+
+import heapq
+import math
+import re
+from collections import Counter, defaultdict
+from collections.abc import Hashable
+from typing import Dict, Iterable, List, Optional, Tuple
+
+WORD_PATTERN = re.compile(r"\w+")
+
+STOPWORDS = frozenset(
+    """
+    a an and are as at be but by can do does for from has have how i if in is it
+    its me my no not of on or so that the their them then there these they this
+    to was we were what when where which who why will with you your
+    """.split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    """Returns the lowercase words of text, without stopwords."""
+
+    return [
+        word for word in WORD_PATTERN.findall(text.lower()) if word not in STOPWORDS
+    ]
+
+
+class BM25Index:
+    """Inverted index scoring documents against queries with Okapi BM25."""
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.__k1 = k1
+        self.__b = b
+        self.__postings: Dict[str, Dict[Hashable, int]] = defaultdict(dict)
+        self.__terms: Dict[Hashable, Counter] = {}
+        self.__lengths: Dict[Hashable, int] = {}
+        self.__total_length = 0
+
+    def __len__(self) -> int:
+        return len(self.__terms)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self.__terms
+
+    def add(self, key: Hashable, text: str):
+        """Indexes text under key, replacing what was indexed under it before."""
+
+        self.remove(key)
+        terms = Counter(tokenize(text))
+        self.__terms[key] = terms
+        self.__lengths[key] = sum(terms.values())
+        self.__total_length += self.__lengths[key]
+        for term, frequency in terms.items():
+            self.__postings[term][key] = frequency
+
+    def remove(self, key: Hashable):
+        """Forgets the document indexed under key, if any."""
+
+        terms = self.__terms.pop(key, None)
+        if terms is None:
+            return
+
+        self.__total_length -= self.__lengths.pop(key)
+        for term in terms:
+            postings = self.__postings[term]
+            del postings[key]
+            if not postings:
+                del self.__postings[term]
+
+    def scores(
+        self, query: str, keys: Optional[Iterable[Hashable]] = None
+    ) -> Dict[Hashable, float]:
+        """Returns the BM25 scores of the documents matching query, or only of keys."""
+
+        if not self.__terms:
+            return {}
+
+        allowed = set(keys) if keys is not None else None
+        documents = len(self.__terms)
+        average_length = self.__total_length / documents or 1
+        scores: Dict[Hashable, float] = defaultdict(float)
+
+        for term in set(tokenize(query)):
+            postings = self.__postings.get(term)
+            if not postings:
+                continue
+            matches = len(postings)
+            idf = math.log(1 + (documents - matches + 0.5) / (matches + 0.5))
+            for key, frequency in postings.items():
+                if allowed is not None and key not in allowed:
+                    continue
+                length = self.__lengths[key]
+                norm = self.__k1 * (1 - self.__b + self.__b * length / average_length)
+                scores[key] += idf * frequency * (self.__k1 + 1) / (frequency + norm)
+
+        return scores
+
+    def search(
+        self, query: str, k: int = 10, keys: Optional[Iterable[Hashable]] = None
+    ) -> List[Tuple[Hashable, float]]:
+        """Returns the k best (key, score) matches of query, best first."""
+
+        scores = self.scores(query, keys)
+        return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+
+
+class MessageIndex:
+    """BM25 index over chat messages, kept in sync with a messages list.
+
+    Messages are keyed by object id. The indexed message objects are kept, so
+    their ids are not reused while they are in the index.
+    """
+
+    def __init__(self):
+        self.__index = BM25Index()
+        self.__messages: Dict[int, dict] = {}
+
+    def __len__(self) -> int:
+        return len(self.__messages)
+
+    def add(self, message: dict):
+        """Indexes a message."""
+
+        self.__messages[id(message)] = message
+        self.__index.add(id(message), str(message.get("content") or ""))
+
+    def sync(self, messages: list):
+        """Forgets the messages that are not in messages and indexes the new ones."""
+
+        live = {id(message) for message in messages}
+        for key in [key for key in self.__messages if key not in live]:
+            self.__index.remove(key)
+            del self.__messages[key]
+
+        for message in messages:
+            if id(message) not in self.__messages:
+                self.add(message)
+
+    def search(self, query: str, messages: list, k: int) -> List[int]:
+        """Returns the positions in messages of the k best matches of query."""
+
+        positions = {id(message): position for position, message in enumerate(messages)}
+        return [
+            positions[key]
+            for key, _ in self.__index.search(query, k, keys=positions.keys())
+        ]
+
+    def scores(self, query: str, messages: list) -> List[float]:
+        """Returns the BM25 score of query for every message of messages."""
+
+        scores = self.__index.scores(query, [id(message) for message in messages])
+        return [scores.get(id(message), 0.0) for message in messages]
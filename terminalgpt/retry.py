@@ -0,0 +1,205 @@
+"""Retry scheduling for OpenAI API requests.
+
+Transient errors (rate limits, connection errors and server errors) are retried
+with jittered exponential backoff, or after the wait the server asks for in the
+retry-after-ms, Retry-After and x-ratelimit-reset-* headers. A request gives up
+after max_attempts attempts, or when the next wait would take its total wait
+past max_wait seconds.
+
+Context length errors are not retried as is, the caller may trim the context
+and retry right away.
+"""
+
+import asyncio
+import random
+import re
+import time
+from email.utils import parsedate_to_datetime
+from typing import Awaitable, Callable, Optional, TypeVar
+
+import openai
+
+from terminalgpt import config
+
+CONTEXT_LENGTH_EXCEEDED = "context_length_exceeded"
+INSUFFICIENT_QUOTA = "insufficient_quota"
+
+# x-ratelimit-reset-* values look like 1s, 6m0s, 20ms or 1h2m3.5s
+DURATION_PATTERN = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+T = TypeVar("T")
+
+
+def parse_duration(value: str) -> Optional[float]:
+    """Parses a rate limit reset duration into seconds, None if it is not one."""
+
+    parts = DURATION_PATTERN.findall(value)
+    if not parts or DURATION_PATTERN.sub("", value).strip():
+        return None
+    return sum(float(amount) * DURATION_UNITS[unit] for amount, unit in parts)
+
+
+def server_delay(error: Exception) -> Optional[float]:
+    """Returns the wait the response headers of error ask for, in seconds."""
+
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return max(float(retry_after_ms) / 1000, 0)
+        except ValueError:
+            pass
+
+    retry_after = headers.get("retry-after")
+    if retry_after:
+        try:
+            return max(float(retry_after), 0)
+        except ValueError:
+            pass
+        try:
+            return max(parsedate_to_datetime(retry_after).timestamp() - time.time(), 0)
+        except (TypeError, ValueError):
+            pass
+
+    # wait for the exhausted limits to reset
+    resets = []
+    for limit in ("requests", "tokens"):
+        reset = headers.get(f"x-ratelimit-reset-{limit}")
+        if reset and headers.get(f"x-ratelimit-remaining-{limit}") in ("0", None):
+            seconds = parse_duration(reset)
+            if seconds is not None:
+                resets.append(seconds)
+
+    return max(resets) if resets else None
+
+
+def is_context_length_error(error: Exception) -> bool:
+    """Returns True if the request failed for having too many tokens."""
+
+    return (
+        isinstance(error, openai.BadRequestError)
+        and getattr(error, "code", None) == CONTEXT_LENGTH_EXCEEDED
+    )
+
+
+def is_retryable(error: Exception) -> bool:
+    """Returns True if the same request may succeed later."""
+
+    if isinstance(error, openai.RateLimitError):
+        # an exhausted quota does not come back by waiting
+        return getattr(error, "code", None) != INSUFFICIENT_QUOTA
+    return isinstance(error, (openai.APIConnectionError, openai.InternalServerError))
+
+
+class RetryScheduler:
+    """Runs requests, retrying the transient errors and counting the retries and waits."""
+
+    def __init__(self, **kwargs):
+        self.__max_attempts: int = kwargs.get("max_attempts", config.RETRY_MAX_ATTEMPTS)
+        self.__max_wait: float = kwargs.get("max_wait", config.RETRY_MAX_WAIT)
+        self.__base_delay: float = kwargs.get("base_delay", config.RETRY_BASE_DELAY)
+        self.__max_delay: float = kwargs.get("max_delay", config.RETRY_MAX_DELAY)
+        self.__retries = 0
+        self.__waited = 0.0
+
+    @property
+    def retries(self) -> int:
+        """Returns the number of retries of all the requests so far."""
+        return self.__retries
+
+    @property
+    def waited(self) -> float:
+        """Returns the seconds waited before retries of all the requests so far."""
+        return self.__waited
+
+    def backoff(self, attempt: int) -> float:
+        """Returns a full jitter exponential backoff for the retry after attempt (0-based)."""
+        return random.uniform(
+            0, min(self.__max_delay, self.__base_delay * 2**attempt)
+        )
+
+    def next_delay(
+        self, error: Exception, attempt: int, waited: float
+    ) -> Optional[float]:
+        """Returns the wait before retrying a failed attempt, or None to give up."""
+
+        if not is_retryable(error) or attempt + 1 >= self.__max_attempts:
+            return None
+
+        delay = server_delay(error)
+        if delay is None:
+            delay = self.backoff(attempt)
+        else:
+            # spread the clients told to come back at the same time
+            delay += random.uniform(0, self.__base_delay)
+
+        if waited + delay > self.__max_wait:
+            return None
+        return delay
+
+    def call(
+        self,
+        request: Callable[[], T],
+        trim_context: Optional[Callable[[], bool]] = None,
+    ) -> T:
+        """Returns the result of request, retried on transient errors.
+
+        On a context length error, trim_context is called to make room and the
+        request is retried if it returns True.
+        """
+        attempt, waited = 0, 0.0
+        while True:
+            try:
+                return request()
+            except openai.OpenAIError as error:
+                delay = self.__retry_delay(error, attempt, waited, trim_context)
+            time.sleep(delay)
+            attempt += 1
+            waited += delay
+
+    async def acall(
+        self,
+        request: Callable[[], Awaitable[T]],
+        trim_context: Optional[Callable[[], bool]] = None,
+    ) -> T:
+        """Like call, for a request coroutine function."""
+        attempt, waited = 0, 0.0
+        while True:
+            try:
+                return await request()
+            except openai.OpenAIError as error:
+                delay = self.__retry_delay(error, attempt, waited, trim_context)
+            await asyncio.sleep(delay)
+            attempt += 1
+            waited += delay
+
+    def __retry_delay(
+        self,
+        error: Exception,
+        attempt: int,
+        waited: float,
+        trim_context: Optional[Callable[[], bool]],
+    ) -> float:
+        """Returns the wait before the next attempt, raises error to give up."""
+
+        if is_context_length_error(error):
+            if (
+                trim_context is None
+                or attempt + 1 >= self.__max_attempts
+                or not trim_context()
+            ):
+                raise error
+            delay = 0.0
+        else:
+            delay = self.next_delay(error, attempt, waited)
+            if delay is None:
+                raise error
+
+        self.__retries += 1
+        self.__waited += delay
+        return delay
@@ -0,0 +1,191 @@
+"""Full-text search over the saved conversations.
+
+The user and assistant messages of every conversation are kept in an SQLite
+FTS5 index next to the conversation logs. ConversationManager updates it as
+conversations are saved, renamed and deleted, so a search only reads the index
+and never the logs. Hits are ranked with FTS5's BM25 and come with a snippet of
+the matching message.
+
+Python's sqlite3 may be built without FTS5, fts5_available() tells once per
+process, and the index is left alone without it.
+"""
+
+import sqlite3
+import threading
+from functools import lru_cache
+from typing import Iterable, List, Optional
+
+SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS messages USING fts5(
+    conversation UNINDEXED, role UNINDEXED, content, tokenize = 'porter unicode61'
+);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+SEARCHED_ROLES = ("user", "assistant")
+
+
+def match_query(query: str) -> str:
+    """Returns an FTS5 query matching all the words of query, as prefixes.
+
+    Every word is quoted, so FTS5 operators and punctuation in the user's
+    query are searched as text.
+    """
+
+    words = query.split()
+    return " ".join('"' + word.replace('"', '""') + '"*' for word in words)
+
+
+@lru_cache(maxsize=None)
+def fts5_available() -> bool:
+    """Returns True if the sqlite3 module was built with FTS5."""
+
+    connection = sqlite3.connect(":memory:")
+    try:
+        connection.execute("CREATE VIRTUAL TABLE probe USING fts5(content)")
+        return True
+    except sqlite3.Error:
+        return False
+    finally:
+        connection.close()
+
+
+class SearchIndex:
+    """FTS5 index of the conversations messages."""
+
+    def __init__(self, path: str):
+        self.__path = path
+        self.__connection: Optional[sqlite3.Connection] = None
+        self.__lock = threading.Lock()
+
+    @property
+    def built(self) -> bool:
+        """Returns True once the index was built from all the conversations."""
+
+        with self.__lock:
+            row = (
+                self.__connect()
+                .execute("SELECT value FROM meta WHERE key = 'built'")
+                .fetchone()
+            )
+        return row is not None
+
+    def add(self, conversation: str, messages: Iterable[dict]):
+        """Indexes messages appended to a conversation."""
+
+        rows = [
+            (conversation, message["role"], str(message.get("content") or ""))
+            for message in messages
+            if message.get("role") in SEARCHED_ROLES
+        ]
+        if not rows:
+            return
+
+        with self.__lock, self.__connect() as connection:
+            connection.executemany(
+                "INSERT INTO messages (conversation, role, content) VALUES (?, ?, ?)",
+                rows,
+            )
+
+    def replace(self, conversation: str, messages: Iterable[dict]):
+        """Indexes the messages of a conversation instead of the ones indexed so far."""
+
+        self.delete(conversation)
+        self.add(conversation, messages)
+
+    def rename(self, old_name: str, new_name: str):
+        """Moves the messages of a renamed conversation to its new name."""
+
+        with self.__lock, self.__connect() as connection:
+            connection.execute(
+                "UPDATE messages SET conversation = ? WHERE conversation = ?",
+                (new_name, old_name),
+            )
+
+    def delete(self, conversation: str):
+        """Forgets the messages of a conversation."""
+
+        with self.__lock, self.__connect() as connection:
+            connection.execute(
+                "DELETE FROM messages WHERE conversation = ?", (conversation,)
+            )
+
+    def rebuild(self, conversations: dict):
+        """Indexes all the conversations, a dict of name to messages, from scratch."""
+
+        rows = [
+            (name, message["role"], str(message.get("content") or ""))
+            for name, messages in conversations.items()
+            for message in messages
+            if message.get("role") in SEARCHED_ROLES
+        ]
+        with self.__lock, self.__connect() as connection:
+            connection.execute("DELETE FROM messages")
+            connection.executemany(
+                "INSERT INTO messages (conversation, role, content) VALUES (?, ?, ?)",
+                rows,
+            )
+            connection.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('built', '1')"
+            )
+
+    def search(
+        self,
+        query: str,
+        limit: int = 10,
+        highlight: tuple = ("[", "]"),
+    ) -> List[dict]:
+        """Returns the best hit of the limit best matching conversations, best first.
+
+        A hit has the conversation name, the role and a snippet of the matching
+        message, with the matches wrapped in highlight.
+        """
+
+        match = match_query(query)
+        if not match:
+            return []
+
+        with self.__lock:
+            rows = self.__connect().execute(
+                """
+                SELECT conversation, role,
+                       snippet(messages, 2, ?, ?, '...', 12), bm25(messages)
+                FROM messages WHERE messages MATCH ? ORDER BY rank
+                """,
+                (*highlight, match),
+            )
+
+            hits = []
+            seen = set()
+            for conversation, role, snippet, score in rows:
+                if conversation in seen:
+                    continue
+                seen.add(conversation)
+                hits.append(
+                    {
+                        "conversation": conversation,
+                        "role": role,
+                        "snippet": " ".join(snippet.split()),
+                        "score": -score,  # bm25() is lower for better matches
+                    }
+                )
+                if len(hits) == limit:
+                    break
+
+        return hits
+
+    def close(self):
+        with self.__lock:
+            if self.__connection is not None:
+                self.__connection.close()
+                self.__connection = None
+
+    def __connect(self) -> sqlite3.Connection:
+        """Returns the connection, creating the index on first use."""
+
+        if self.__connection is None:
+            # saves come from the chat loop, the title thread and the save worker
+            connection = sqlite3.connect(self.__path, check_same_thread=False)
+            connection.executescript(SCHEMA)
+            self.__connection = connection
+        return self.__connection
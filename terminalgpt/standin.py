@@ -0,0 +1,314 @@
+"""Local stand-in for the OpenAI chat completions endpoint.
+
+Answers POST /v1/chat/completions like the API does, as a single JSON response
+or streamed as server-sent events, with a configurable latency before the first
+byte, token rate and error injection. Meant for tests and benchmarks, with a
+client pointed at it through base_url=server.url (or OPENAI_BASE_URL).
+
+Run it on its own with: python -m terminalgpt.standin --port 8080
+"""
+
+import itertools
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional
+
+import click
+
+ANSWER_WORDS = (
+    "Sure! Here is a short answer with a few words and a `code` span, "
+    "followed by a list:\n\n- one item\n- another item\n\n"
+    "And a closing sentence to round it up."
+).split(" ")
+
+
+class StandInServer:
+    """Serves fake chat completions from a background thread."""
+
+    def __init__(self, **kwargs):
+        self.host: str = kwargs.get("host", "127.0.0.1")
+        self.port: int = kwargs.get("port", 0)  # 0 picks a free port
+        self.latency: float = kwargs.get("latency", 0.0)
+        self.tokens_per_second: float = kwargs.get("tokens_per_second", 0.0)
+        self.answer_tokens: int = kwargs.get("answer_tokens", 20)
+        self.error_rate: float = kwargs.get("error_rate", 0.0)
+        self.error_status: int = kwargs.get("error_status", 429)
+        self.retry_after: Optional[float] = kwargs.get("retry_after", None)
+        self.__random = random.Random(kwargs.get("seed", None))
+        self.__lock = threading.Lock()
+        self.__requests = 0
+        self.__httpd: Optional[ThreadingHTTPServer] = None
+        self.__thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        """Returns the base URL to point a client at."""
+        return f"http://{self.host}:{self.port}/v1"
+
+    @property
+    def requests(self) -> int:
+        """Returns the number of requests served so far, errors included."""
+        return self.__requests
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *_):
+        self.stop()
+
+    def start(self):
+        """Starts serving in a daemon thread."""
+
+        self.__bind()
+        self.__thread = threading.Thread(
+            target=self.__httpd.serve_forever,
+            kwargs={"poll_interval": 0.05},  # stop quickly
+            name="standin",
+            daemon=True,
+        )
+        self.__thread.start()
+
+    def serve_forever(self):
+        """Serves in the calling thread until interrupted."""
+
+        self.__bind()
+        try:
+            self.__httpd.serve_forever()
+        finally:
+            self.__httpd.server_close()
+
+    def stop(self):
+        """Stops serving and closes the socket."""
+
+        if self.__httpd is not None:
+            self.__httpd.shutdown()
+            self.__httpd.server_close()
+            self.__httpd = None
+        if self.__thread is not None:
+            self.__thread.join()
+            self.__thread = None
+
+    def answer_tokens_for(self, request: dict) -> List[str]:
+        """Returns the answer to request, split into tokens (words).
+
+        The answer is answer_tokens long, or cut to the max_tokens (or
+        max_completion_tokens) of the request.
+        """
+
+        answer_tokens = self.answer_tokens
+        max_tokens = request.get("max_completion_tokens") or request.get("max_tokens")
+        if max_tokens:
+            answer_tokens = min(answer_tokens, max_tokens)
+        words = itertools.islice(itertools.cycle(ANSWER_WORDS), answer_tokens)
+        return [word + " " for word in words]
+
+    def should_fail(self) -> bool:
+        """Counts a request and draws whether it gets an injected error."""
+
+        with self.__lock:
+            self.__requests += 1
+            return self.error_rate > 0 and self.__random.random() < self.error_rate
+
+    def __bind(self):
+        handler = type("StandInHandler", (StandInHandler,), {"standin": self})
+        self.__httpd = ThreadingHTTPServer((self.host, self.port), handler)
+        self.__httpd.daemon_threads = True
+        self.port = self.__httpd.server_address[1]
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Handles chat completion requests for a StandInServer."""
+
+    protocol_version = "HTTP/1.1"  # keep connections alive like the real API
+    standin: StandInServer
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        pass
+
+    def do_HEAD(self):  # pylint: disable=invalid-name
+        """Answers the connection warm-ups, keeping the connection alive."""
+
+        self.send_response(404)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        """Answers a chat completion request."""
+
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self.__send_json(404, error("Unknown endpoint", "invalid_request_error"))
+            return
+
+        try:
+            request = json.loads(body)
+        except ValueError:
+            self.__send_json(400, error("Invalid JSON body", "invalid_request_error"))
+            return
+
+        standin = self.standin
+        if standin.should_fail():
+            headers = {}
+            if standin.retry_after is not None:
+                headers["retry-after"] = str(standin.retry_after)
+            self.__send_json(
+                standin.error_status,
+                error(
+                    "Injected error",
+                    "rate_limit_exceeded"
+                    if standin.error_status == 429
+                    else "server_error",
+                ),
+                headers,
+            )
+            return
+
+        time.sleep(standin.latency)
+
+        tokens = standin.answer_tokens_for(request)
+        usage = {
+            "prompt_tokens": prompt_tokens(request.get("messages", [])),
+            "completion_tokens": len(tokens),
+        }
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+
+        if request.get("stream"):
+            include_usage = (request.get("stream_options") or {}).get("include_usage")
+            self.__send_stream(request, tokens, usage if include_usage else None)
+        else:
+            self.__pace(len(tokens), time.perf_counter())
+            self.__send_json(200, completion(request, "".join(tokens), usage))
+
+    def __pace(self, tokens_sent: int, start: float):
+        """Sleeps until tokens_sent tokens are due at the token rate."""
+
+        if self.standin.tokens_per_second > 0:
+            delay = start + tokens_sent / self.standin.tokens_per_second
+            delay -= time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+    def __send_json(self, status: int, data: dict, headers: Optional[dict] = None):
+        payload = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def __send_stream(self, request: dict, tokens: List[str], usage: Optional[dict]):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        start = time.perf_counter()
+        for number, token in enumerate(tokens):
+            self.__pace(number, start)
+            self.__send_event(chunk(request, {"content": token}))
+        self.__send_event(chunk(request, {}, finish_reason="stop"))
+        if usage is not None:
+            self.__send_event({**chunk(request, {}), "choices": [], "usage": usage})
+        self.__send_chunk(b"data: [DONE]\n\n")
+        self.__send_chunk(b"")
+
+    def __send_event(self, data: dict):
+        self.__send_chunk(f"data: {json.dumps(data)}\n\n".encode("utf-8"))
+
+    def __send_chunk(self, data: bytes):
+        """Writes an HTTP/1.1 chunk, an empty one ends the response."""
+
+        self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+
+def prompt_tokens(messages: list) -> int:
+    """Returns a rough prompt token count, a word is a token."""
+    return sum(len(str(message.get("content", "")).split()) + 4 for message in messages)
+
+
+def error(message: str, code: str) -> dict:
+    """Returns an API error body."""
+    return {"error": {"message": message, "type": code, "param": None, "code": code}}
+
+
+def completion(request: dict, content: str, usage: dict) -> dict:
+    """Returns a chat.completion body."""
+
+    return {
+        "id": "chatcmpl-standin",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": request.get("model", "standin"),
+        "choices": [
+            {
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }
+        ],
+        "usage": usage,
+    }
+
+
+def chunk(request: dict, delta: dict, finish_reason: Optional[str] = None) -> dict:
+    """Returns a chat.completion.chunk body."""
+
+    return {
+        "id": "chatcmpl-standin",
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": request.get("model", "standin"),
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+
+
+@click.command(help="Serve a local stand-in for the OpenAI chat completions API.")
+@click.option("--host", default="127.0.0.1", show_default=True)
+@click.option("--port", type=click.IntRange(1, 65535), default=8080, show_default=True)
+@click.option(
+    "--latency",
+    type=float,
+    default=0.0,
+    show_default=True,
+    help="Seconds before the first byte.",
+)
+@click.option(
+    "--tokens-per-second",
+    type=float,
+    default=0.0,
+    show_default=True,
+    help="Answer token rate, 0 sends the answer at once.",
+)
+@click.option("--answer-tokens", type=int, default=20, show_default=True)
+@click.option(
+    "--error-rate",
+    type=click.FloatRange(0, 1),
+    default=0.0,
+    show_default=True,
+    help="Share of the requests answered with an error.",
+)
+@click.option("--error-status", type=int, default=429, show_default=True)
+@click.option(
+    "--retry-after", type=float, default=None, help="Retry-After of the errors."
+)
+@click.option("--seed", type=int, default=None, help="Seed of the error injection.")
+def main(**options):
+    """Serve the stand-in until interrupted."""
+
+    server = StandInServer(**options)
+    print(f"Serving on {server.url} ...")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()  # pylint: disable=no-value-for-parameter
@@ -0,0 +1,230 @@
+"""Token accounting for chat messages.
+
+Messages are encoded as ordinary text, special tokens written in a message are
+counted as the text they are, like the API does.
+"""
+
+import os
+import threading
+from bisect import bisect_left
+from concurrent.futures import ThreadPoolExecutor
+from itertools import accumulate
+from typing import TYPE_CHECKING, List, Optional, Tuple
+
+from terminalgpt import config
+
+if TYPE_CHECKING:
+    from tiktoken.core import Encoding
+
+MESSAGE_OVERHEAD = 4  # every message follows <im_start>{role/name}\n{content}<im_end>\n
+REPLY_PRIMING = 2  # every reply is primed with <im_start>assistant
+
+# tokenizer threads shared by the whole process, started on the first large batch
+_POOL_LOCK = threading.Lock()
+_POOL: Optional[ThreadPoolExecutor] = None
+
+
+def count_message_tokens(encoder: "Encoding", message: dict) -> int:
+    """Returns the number of tokens a single message adds to the prompt."""
+
+    num_tokens = MESSAGE_OVERHEAD
+    for key, value in message.items():
+        num_tokens += len(encoder.encode_ordinary(value))
+        if key == "name":  # if there's a name, the role is omitted
+            num_tokens -= 1  # role is always required and always 1 token
+    return num_tokens
+
+
+def tokenizer_threads(threads: int = 0) -> int:
+    """Returns threads, config.TOKENIZER_THREADS, or one thread per CPU up to 8.
+
+    Never more threads than CPUs: threads sharing a CPU only add their overhead.
+    """
+
+    cpus = os.cpu_count() or 1
+    return min(threads or config.TOKENIZER_THREADS or 8, cpus)
+
+
+def _pool() -> ThreadPoolExecutor:
+    global _POOL  # pylint: disable=global-statement
+
+    with _POOL_LOCK:
+        if _POOL is None:
+            _POOL = ThreadPoolExecutor(
+                max_workers=tokenizer_threads(), thread_name_prefix="tokenizer"
+            )
+        return _POOL
+
+
+class Tokenizer:
+    """Counts the tokens of many messages at once.
+
+    tiktoken releases the GIL while it encodes, so the texts of a large batch are
+    split in one chunk per thread and encoded in parallel on the shared pool.
+    Batches under config.TOKENIZER_BATCH_SIZE texts are encoded inline, the
+    threads cost more than they save on them, and so is every batch on a single
+    CPU. Repeated texts of a batch, like the roles of the messages, are encoded
+    once.
+    """
+
+    def __init__(self, encoder: Optional["Encoding"], **kwargs):
+        self.__encoder = encoder
+        self.__threads: int = tokenizer_threads(kwargs.get("threads", 0))
+        self.__batch_size: int = kwargs.get("batch_size", config.TOKENIZER_BATCH_SIZE)
+
+    @property
+    def encoder(self) -> "Encoding":
+        return self.__encoder
+
+    def encode(self, text: str) -> List[int]:
+        return self.encoder.encode_ordinary(text)
+
+    def decode(self, tokens: List[int]) -> str:
+        return self.encoder.decode(tokens)
+
+    def count_texts(self, texts: List[str]) -> List[int]:
+        """Returns the number of tokens of every text."""
+
+        unique = list(dict.fromkeys(texts))
+        if self.__threads <= 1 or len(unique) < self.__batch_size:
+            counts = self.__count_chunk(unique)
+        else:
+            size = -(-len(unique) // self.__threads)
+            chunks = [
+                unique[start : start + size] for start in range(0, len(unique), size)
+            ]
+            counts = []
+            for chunk_counts in _pool().map(self.__count_chunk, chunks):
+                counts.extend(chunk_counts)
+
+        lengths = dict(zip(unique, counts))
+        return [lengths[text] for text in texts]
+
+    def count_message(self, message: dict) -> int:
+        """Returns the number of tokens a single message adds to the prompt."""
+
+        return count_message_tokens(self.encoder, message)
+
+    def count_messages(self, messages: list) -> List[int]:
+        """Returns the number of tokens every message adds to the prompt."""
+
+        texts = [value for message in messages for value in message.values()]
+        lengths = iter(self.count_texts(texts))
+        counts = []
+        for message in messages:
+            num_tokens = MESSAGE_OVERHEAD
+            for key in message:
+                num_tokens += next(lengths)
+                if key == "name":  # if there's a name, the role is omitted
+                    num_tokens -= 1
+            counts.append(num_tokens)
+        return counts
+
+    def __count_chunk(self, texts: List[str]) -> List[int]:
+        encode = self.encoder.encode_ordinary
+        return [len(encode(text)) for text in texts]
+
+
+def plan_truncation(counts: List[int], excess: int, start: int = 1) -> Tuple[int, int]:
+    """Plans how to remove at least excess tokens from the oldest messages.
+
+    Messages before start are always kept. Returns the number of whole messages
+    to drop from start on, and the number of tokens to cut from the beginning of
+    the message right after them (the boundary message).
+    """
+
+    if excess <= 0:
+        return 0, 0
+
+    prefix = list(accumulate(counts[start:]))
+    boundary = bisect_left(prefix, excess)
+    if boundary == len(prefix):  # not enough to remove, drop everything
+        return len(prefix), 0
+
+    remainder = excess - (prefix[boundary - 1] if boundary else 0)
+    if remainder == counts[start + boundary]:
+        return boundary + 1, 0
+
+    return boundary, remainder
+
+
+class TokenLedger:
+    """Keeps a memoized token count per message and a running total.
+
+    The ledger mirrors a list of messages index by index. Every change to the
+    messages list has to go through the ledger, so only the delta is encoded.
+    """
+
+    def __init__(self, tokenizer: Tokenizer, messages: Optional[list] = None):
+        self.__tokenizer = tokenizer
+        self.__counts: List[int] = []
+        self.__total = 0
+        self.reset(messages or [])
+
+    @property
+    def counts(self) -> List[int]:
+        return self.__counts
+
+    @property
+    def total(self) -> int:
+        """Returns the number of tokens of the whole messages list."""
+        return self.__total - REPLY_PRIMING
+
+    def __len__(self) -> int:
+        return len(self.__counts)
+
+    def reset(self, messages: list):
+        """Recounts a whole messages list."""
+
+        self.__counts = self.__tokenizer.count_messages(messages)
+        self.__total = sum(self.__counts)
+
+    def append(self, message: dict) -> int:
+        """Counts a new message appended to the end of the list."""
+
+        count = self.__tokenizer.count_message(message)
+        self.__counts.append(count)
+        self.__total += count
+        return count
+
+    def insert(self, index: int, message: dict, count: Optional[int] = None) -> int:
+        """Counts a message inserted at index, unless its count is already known."""
+
+        if count is None:
+            count = self.__tokenizer.count_message(message)
+        self.__counts.insert(index, count)
+        self.__total += count
+        return count
+
+    def pop(self, index: int = -1) -> int:
+        """Forgets the message at index and returns its count."""
+
+        count = self.__counts.pop(index)
+        self.__total -= count
+        return count
+
+    def delete(self, start: int, stop: int) -> int:
+        """Forgets the messages in [start, stop) and returns their total count."""
+
+        count = sum(self.__counts[start:stop])
+        del self.__counts[start:stop]
+        self.__total -= count
+        return count
+
+    def update(self, index: int, count: int):
+        """Sets a known new count for the message at index, e.g. after truncating it."""
+
+        self.__total += count - self.__counts[index]
+        self.__counts[index] = count
+
+    def recount(self, messages: list) -> int:
+        """Returns the total of a full recount, without touching the ledger."""
+
+        return sum(self.__tokenizer.count_messages(messages)) - REPLY_PRIMING
+
+    def verify(self, messages: list) -> bool:
+        """Cross-checks the ledger against a full recount of messages."""
+
+        return len(self.__counts) == len(messages) and self.total == self.recount(
+            messages
+        )
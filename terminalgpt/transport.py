@@ -0,0 +1,237 @@
+"""HTTP transport shared by the OpenAI clients of a process.
+
+Every client of the process (the chat, the titles and summaries, the batch
+runner and the daemon) sends its requests through the same pooled HTTP client,
+so connections are kept alive and reused between requests. Pool size, keep-alive
+expiry, connect and read timeouts and HTTP/2 are set in config.py and can be
+overridden in defaults.json.
+
+A new connection costs DNS, TCP and TLS round trips before the first request.
+prewarm() opens one in the background, e.g. while the user types the first
+prompt, and the first request waits for it instead of opening a second one.
+prewarm_async() does the same for the async client of the async engine.
+
+With LOG_LEVEL=DEBUG every request prints whether it reused a pooled connection
+or how long the new connection's TCP and TLS handshakes took.
+"""
+
+import asyncio
+import importlib
+import importlib.util
+import os
+import sys
+import threading
+import time
+from typing import Optional
+
+from colorama import Fore, Style
+
+from terminalgpt import config
+
+
+def http_module():
+    """Returns the httpx module the installed openai package is built on.
+
+    openai only accepts http clients of its own httpx, which is not always the
+    one installed as httpx, so the pool is built with the same one.
+    """
+    # pylint: disable-next=import-outside-toplevel
+    import openai
+
+    # an httpx.Limits instance
+    limits_module = type(openai.DEFAULT_CONNECTION_LIMITS).__module__
+    return importlib.import_module(limits_module.partition(".")[0])
+
+
+def debug(message: str):
+    """Prints a transport trace on LOG_LEVEL=DEBUG."""
+
+    if os.environ.get("LOG_LEVEL") == "DEBUG":
+        print(Fore.LIGHTBLUE_EX + f"HTTP: {message}" + Style.RESET_ALL, file=sys.stderr)
+
+
+class ConnectionTrace:
+    """Collects the httpcore trace events of one request and reports them.
+
+    The request reused a pooled connection unless a TCP connect shows up in
+    its trace before the request headers are sent.
+    """
+
+    def __init__(self, request):
+        self.__target = f"{request.method} {request.url.host}{request.url.path}"
+        self.__started = {}
+        self.__took = {}
+
+    def __call__(self, event: str, _info: dict):
+        name, _, stage = event.rpartition(".")
+        now = time.perf_counter()
+        if stage == "started":
+            self.__started[name] = now
+        elif stage == "complete" and name in self.__started:
+            self.__took[name] = (now - self.__started[name]) * 1000
+        if name.endswith("send_request_headers") and stage == "started":
+            self.report()
+
+    async def atrace(self, event: str, info: dict):
+        """The trace callback of async requests."""
+        self(event, info)
+
+    def report(self):
+        if "connection.connect_tcp" not in self.__took:
+            debug(f"{self.__target} on a reused connection")
+            return
+
+        handshakes = f"TCP {self.__took['connection.connect_tcp']:.1f} ms"
+        if "connection.start_tls" in self.__took:
+            handshakes += f", TLS {self.__took['connection.start_tls']:.1f} ms"
+        debug(f"{self.__target} on a new connection ({handshakes})")
+
+
+class HttpTransport:
+    """Builds the pooled HTTP clients and warms their connections up."""
+
+    def __init__(self, **kwargs):
+        defaults = config.get_default_config()
+        self.__max_connections: int = kwargs.get(
+            "max_connections",
+            defaults.get("max_connections", config.HTTP_MAX_CONNECTIONS),
+        )
+        self.__keepalive_expiry: float = kwargs.get(
+            "keepalive_expiry",
+            defaults.get("keepalive_expiry", config.HTTP_KEEPALIVE_EXPIRY),
+        )
+        self.__connect_timeout: float = kwargs.get(
+            "connect_timeout",
+            defaults.get("connect_timeout", config.HTTP_CONNECT_TIMEOUT),
+        )
+        self.__read_timeout: float = kwargs.get(
+            "read_timeout", defaults.get("read_timeout", config.HTTP_READ_TIMEOUT)
+        )
+        self.__http2: bool = kwargs.get("http2", defaults.get("http2", config.HTTP2))
+        self.__http_client = None
+        self.__async_http_client = None
+        self.__prewarm: Optional[threading.Thread] = None
+        self.__async_prewarm: Optional[asyncio.Task] = None
+
+    @property
+    def max_connections(self) -> int:
+        return self.__max_connections
+
+    @max_connections.setter
+    def max_connections(self, max_connections: int):
+        """Sets the pool size of the http clients built from now on."""
+        self.__max_connections = max_connections
+
+    @property
+    def http_client(self):
+        """Returns the shared http client, built on first use."""
+
+        if self.__http_client is None:
+            # pylint: disable-next=import-outside-toplevel
+            from openai import DefaultHttpxClient
+
+            self.__http_client = DefaultHttpxClient(
+                **self.__settings(),
+                event_hooks={"request": [self.__before_request]},
+            )
+        return self.__http_client
+
+    @property
+    def async_http_client(self):
+        """Returns the shared async http client, built on first use."""
+
+        if self.__async_http_client is None:
+            # pylint: disable-next=import-outside-toplevel
+            from openai import DefaultAsyncHttpxClient
+
+            self.__async_http_client = DefaultAsyncHttpxClient(
+                **self.__settings(),
+                event_hooks={"request": [self.__before_async_request]},
+            )
+        return self.__async_http_client
+
+    def prewarm(self, base_url):
+        """Opens a pooled connection to base_url in the background.
+
+        The answer does not matter, the connection stays in the pool for the
+        next request. Failures are left for the real requests to report.
+        """
+        if self.__prewarm is not None:
+            return
+
+        http = http_module()
+        http_client = self.http_client
+
+        def warm_up():
+            try:
+                http_client.head(str(base_url), timeout=self.__connect_timeout)
+            except http.HTTPError as error:
+                debug(f"prewarm failed: {error!r}")
+
+        self.__prewarm = threading.Thread(target=warm_up, name="prewarm", daemon=True)
+        self.__prewarm.start()
+
+    def prewarm_async(self, base_url):
+        """Opens a pooled connection of the async client to base_url.
+
+        Runs as a task of the running event loop, the loop the async client is
+        used on, like prewarm() does for the sync client.
+        """
+        if self.__async_prewarm is not None:
+            return
+
+        http = http_module()
+        http_client = self.async_http_client
+
+        async def warm_up():
+            try:
+                await http_client.head(str(base_url), timeout=self.__connect_timeout)
+            except http.HTTPError as error:
+                debug(f"prewarm failed: {error!r}")
+
+        self.__async_prewarm = asyncio.ensure_future(warm_up())
+
+    def __settings(self) -> dict:
+        http = http_module()
+        http2 = self.__http2
+        if http2 and importlib.util.find_spec("h2") is None:
+            debug("HTTP/2 needs the h2 package, using HTTP/1.1")
+            http2 = False
+
+        return {
+            "limits": http.Limits(
+                max_connections=self.__max_connections,
+                max_keepalive_connections=self.__max_connections,
+                keepalive_expiry=self.__keepalive_expiry,
+            ),
+            "timeout": http.Timeout(
+                self.__read_timeout, connect=self.__connect_timeout
+            ),
+            "http2": http2,
+        }
+
+    def __wait_for_prewarm(self):
+        """Lets the first request reuse the connection being warmed up."""
+
+        prewarm = self.__prewarm
+        if prewarm is not None and prewarm is not threading.current_thread():
+            prewarm.join(self.__connect_timeout)
+
+    def __before_request(self, request):
+        self.__wait_for_prewarm()
+        if os.environ.get("LOG_LEVEL") == "DEBUG":
+            request.extensions["trace"] = ConnectionTrace(request)
+
+    async def __before_async_request(self, request):
+        prewarm = self.__async_prewarm
+        if (
+            prewarm is not None
+            and not prewarm.done()
+            and prewarm is not asyncio.current_task()
+        ):
+            await asyncio.wait([prewarm], timeout=self.__connect_timeout)
+        if os.environ.get("LOG_LEVEL") == "DEBUG":
+            request.extensions["trace"] = ConnectionTrace(request).atrace
+
+
+TRANSPORT = HttpTransport()
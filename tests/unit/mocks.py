@@ -1,3 +1,5 @@
+from typing import Optional
+
 from pydantic import BaseModel
 
 
@@ -15,8 +17,28 @@ class ChoiceMock(BaseModel):
         arbitrary_types_allowed = True
 
 
+class UsageMock(BaseModel):
+    total_tokens: int
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+
+
 class ChatCompletionMock(BaseModel):
     choices: list[ChoiceMock]
+    usage: Optional[UsageMock] = None
 
     class Config:
         arbitrary_types_allowed = True
+
+
+class ChunkDeltaMock(BaseModel):
+    content: Optional[str] = None
+
+
+class ChunkChoiceMock(BaseModel):
+    delta: ChunkDeltaMock
+
+
+class ChatCompletionChunkMock(BaseModel):
+    choices: list[ChunkChoiceMock]
+    usage: Optional[UsageMock] = None
@@ -0,0 +1,225 @@
+"""Tests for async_chat.py."""
+
+import asyncio
+import os
+import signal
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from mocks import (
+    ChatCompletionChunkMock,
+    ChatCompletionMessageMock,
+    ChatCompletionMock,
+    ChoiceMock,
+    ChunkChoiceMock,
+    ChunkDeltaMock,
+    UsageMock,
+)
+
+from terminalgpt.async_chat import AsyncChatManager
+from terminalgpt.chat import ChatManager
+from terminalgpt.printer import PrinterFactory
+
+
+class AsyncStreamMock:
+    """Async iterator over chunks, like the AsyncStream of the openai client."""
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.closed = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            chunk = next(self.chunks)
+        except StopIteration:
+            raise StopAsyncIteration from None
+        await asyncio.sleep(0)
+        return chunk
+
+    async def close(self):
+        self.closed = True
+
+
+def completion(content, total_tokens=42):
+    """Returns a mocked chat completion."""
+    return ChatCompletionMock(
+        choices=[ChoiceMock(message=ChatCompletionMessageMock(content=content))],
+        usage=UsageMock(total_tokens=total_tokens),
+    )
+
+
+class TestAsyncChatManager(unittest.IsolatedAsyncioTestCase):
+    """Tests for the AsyncChatManager class."""
+
+    def set_test(self, stream=False, inputs=()):
+        """Sets a test."""
+
+        messages = [
+            {"role": "system", "content": "Hello user Hello user"},
+        ]
+
+        printer = PrinterFactory.get_printer("plain", instant=True)
+        conv_manager = MagicMock()
+        session = MagicMock()
+        inputs = iter(inputs)
+
+        async def prompt_async():
+            await asyncio.sleep(0.01)  # the user is typing
+            return next(inputs)
+
+        session.prompt_async = prompt_async
+
+        chat_manager = ChatManager(
+            conversations_manager=conv_manager,
+            token_limit=4096,
+            session=session,
+            messages=messages,
+            model="gpt-3.5-turbo",
+            printer=printer,
+        )
+        async_chat = AsyncChatManager(
+            chat_manager=chat_manager,
+            conversations_manager=conv_manager,
+            session=session,
+            model="gpt-3.5-turbo",
+            printer=printer,
+            stream=stream,
+            client=MagicMock(),
+        )
+
+        return async_chat, chat_manager, conv_manager
+
+    @patch("builtins.print")
+    async def test_chat_loop(self, _):
+        """Tests a turn of the chat loop until exit."""
+
+        async_chat, chat_manager, conv_manager = self.set_test(inputs=["exit"])
+        async_chat.client.chat.completions.create = AsyncMock(
+            return_value=completion("Bye!")
+        )
+
+        await async_chat.chat_loop()
+
+        self.assertEqual(chat_manager.messages[-1]["content"], "Bye!")
+        self.assertEqual(chat_manager.total_usage, 42)
+        conv_manager.save_context.assert_called_once()
+        saved_messages = conv_manager.save_context.call_args.args[0]
+        self.assertEqual(saved_messages, chat_manager.messages)
+
+    @patch("builtins.print")
+    async def test_stream_user_answer(self, _):
+        """Tests stream_user_answer function."""
+
+        async_chat, chat_manager, _ = self.set_test(stream=True)
+        stream = AsyncStreamMock(
+            [
+                ChatCompletionChunkMock(
+                    choices=[ChunkChoiceMock(delta=ChunkDeltaMock(content=chunk))]
+                )
+                for chunk in ["Hello", " there", "!"]
+            ]
+            + [ChatCompletionChunkMock(choices=[], usage=UsageMock(total_tokens=42))]
+        )
+        async_chat.client.chat.completions.create = AsyncMock(return_value=stream)
+
+        message, interrupted = await async_chat.stream_user_answer(
+            chat_manager.messages, spinner=False
+        )
+
+        self.assertEqual(message, "Hello there!")
+        self.assertFalse(interrupted)
+        self.assertEqual(chat_manager.total_usage, 42)
+        self.assertTrue(stream.closed)
+
+    @patch("builtins.print")
+    async def test_ctrl_c_cancels_request(self, _):
+        """Tests that Ctrl-C cancels the in-flight request instead of leaving it running."""
+
+        async_chat, chat_manager, _ = self.set_test()
+        cancelled = asyncio.Event()
+
+        async def hanging_request(**_):
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        async_chat.client.chat.completions.create = hanging_request
+        asyncio.get_running_loop().call_later(0.05, os.kill, os.getpid(), signal.SIGINT)
+
+        with patch("terminalgpt.chat.yaspin"):
+            await async_chat.one_shot(chat_manager.messages)
+
+        self.assertTrue(cancelled.is_set())
+
+    @patch("builtins.print")
+    async def test_welcome_discarded(self, _):
+        """Tests that a welcome arriving after the first prompt is cached, not printed."""
+
+        async_chat, chat_manager, _ = self.set_test(inputs=["exit"])
+        welcome_answered = asyncio.Event()
+        welcomes = []
+
+        async def create(messages, **_):
+            if messages[-1]["content"] == "Welcome!":
+                await welcome_answered.wait()
+                return completion("Welcome back!")
+            # the welcome arrives after the first prompt was sent
+            welcome_answered.set()
+            return completion("Bye!")
+
+        async_chat.client.chat.completions.create = create
+
+        with patch("terminalgpt.chat.yaspin"), patch.object(
+            async_chat, "_AsyncChatManager__printer"
+        ) as printer:
+            await async_chat.chat_loop(
+                chat_manager.messages + [{"role": "system", "content": "Welcome!"}],
+                welcomes.append,
+            )
+
+        self.assertEqual(welcomes, ["Welcome back!"])
+        printed = [
+            call.args[0] for call in printer.print_assistant_message.call_args_list
+        ]
+        self.assertNotIn("Welcome back!", printed)
+        self.assertEqual(chat_manager.messages[-1]["content"], "Bye!")
+
+    @patch("builtins.print")
+    async def test_welcome_cancelled_without_on_welcome(self, _):
+        """Tests that exiting does not wait for a welcome nothing keeps."""
+
+        async_chat, chat_manager, _ = self.set_test(inputs=["exit"])
+        cancelled = asyncio.Event()
+
+        async def create(messages, **_):
+            if messages[-1]["content"] == "Welcome!":
+                try:
+                    await asyncio.sleep(60)
+                except asyncio.CancelledError:
+                    cancelled.set()
+                    raise
+            return completion("Bye!")
+
+        async_chat.client.chat.completions.create = create
+
+        with patch("terminalgpt.chat.yaspin"), patch.object(
+            async_chat, "_AsyncChatManager__printer"
+        ):
+            await asyncio.wait_for(
+                async_chat.chat_loop(
+                    chat_manager.messages + [{"role": "system", "content": "Welcome!"}]
+                ),
+                timeout=5,
+            )
+            await asyncio.sleep(0)
+
+        self.assertTrue(cancelled.is_set())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,114 @@
+"""Tests for batch.py."""
+
+import io
+import json
+import time
+import unittest
+from unittest.mock import MagicMock
+
+import openai
+from mocks import ChatCompletionMessageMock, ChatCompletionMock, ChoiceMock, UsageMock
+
+from terminalgpt.batch import BatchRunner, percentile, read_prompts
+
+
+class TestReadPrompts(unittest.TestCase):
+    """Tests for the read_prompts function."""
+
+    def test_plain_and_json_lines(self):
+        """Tests mixed plain and JSON prompt lines."""
+
+        prompts = read_prompts(
+            ["What is 1+1?\n", "\n", '{"id": "q2", "prompt": "And 2+2?"}\n', "Bye\n"]
+        )
+
+        self.assertEqual(
+            prompts,
+            [
+                {"id": 0, "prompt": "What is 1+1?"},
+                {"id": "q2", "prompt": "And 2+2?"},
+                {"id": 2, "prompt": "Bye"},
+            ],
+        )
+
+    def test_json_without_prompt(self):
+        """Tests that a JSON line without a prompt is reported with its line number."""
+
+        with self.assertRaisesRegex(ValueError, "line 2"):
+            read_prompts(["Hi", '{"question": "Hi"}'])
+
+
+class TestBatchRunner(unittest.TestCase):
+    """Tests for the BatchRunner class."""
+
+    def set_test(self, order="input"):
+        """Sets a test, each answer takes as many tenths of a second as its prompt says."""
+
+        def create(messages, **_):
+            content = messages[-1]["content"]
+            if content == "fail":
+                raise openai.BadRequestError(
+                    "bad request", response=MagicMock(), body=None
+                )
+            time.sleep(float(content) / 10)
+            return ChatCompletionMock(
+                choices=[
+                    ChoiceMock(message=ChatCompletionMessageMock(content=content))
+                ],
+                usage=UsageMock(total_tokens=10),
+            )
+
+        client = MagicMock()
+        client.chat.completions.create.side_effect = create
+
+        return BatchRunner(
+            client=client, model="gpt-3.5-turbo", concurrency=3, order=order
+        )
+
+    def run_batch(self, runner, lines):
+        """Runs a batch and returns its results and report."""
+
+        output = io.StringIO()
+        report = runner.run(read_prompts(lines), output)
+        results = [json.loads(line) for line in output.getvalue().splitlines()]
+
+        return results, report
+
+    def test_input_order(self):
+        """Tests that results keep the input order."""
+
+        results, report = self.run_batch(self.set_test(), ["3", "1", "2"])
+
+        self.assertEqual([result["answer"] for result in results], ["3", "1", "2"])
+        self.assertEqual(report["prompts"], 3)
+        self.assertEqual(report["tokens"], 30)
+        # answered concurrently, not one after another
+        self.assertLess(report["elapsed"], 0.5)
+
+    def test_completion_order(self):
+        """Tests that results are written as they complete."""
+
+        results, _ = self.run_batch(self.set_test("completion"), ["3", "1", "2"])
+
+        self.assertEqual([result["id"] for result in results], [1, 2, 0])
+
+    def test_errors_are_recorded(self):
+        """Tests that a failed prompt gets an error result and the others go on."""
+
+        results, report = self.run_batch(self.set_test(), ["fail", "0"])
+
+        self.assertIn("error", results[0])
+        self.assertEqual(results[1]["answer"], "0")
+        self.assertEqual(report["errors"], 1)
+
+    def test_percentile(self):
+        """Tests the nearest-rank percentile."""
+
+        values = [float(value) for value in range(1, 21)]
+        self.assertEqual(percentile(values, 50), 10)
+        self.assertEqual(percentile(values, 95), 19)
+        self.assertEqual(percentile([], 95), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,154 @@
+"""Tests for cache.py."""
+
+import os
+import shutil
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+
+from openai.types.chat import ChatCompletion
+
+from terminalgpt.cache import ResponseCache
+from terminalgpt.chat import ChatManager
+
+
+def completion(content: str) -> ChatCompletion:
+    """Returns a chat completion answering content."""
+
+    return ChatCompletion.model_validate(
+        {
+            "id": "chatcmpl-test",
+            "object": "chat.completion",
+            "created": 0,
+            "model": "gpt-3.5-turbo",
+            "choices": [
+                {
+                    "index": 0,
+                    "finish_reason": "stop",
+                    "message": {"role": "assistant", "content": content},
+                }
+            ],
+            "usage": {"prompt_tokens": 5, "completion_tokens": 5, "total_tokens": 10},
+        }
+    )
+
+
+class TestResponseCache(unittest.TestCase):
+    """Tests for the ResponseCache class."""
+
+    def setUp(self):
+        self.test_cache_path = "test_cache"
+        self.messages = [
+            {"role": "system", "content": "You are a helpful assistant."},
+            {"role": "user", "content": "What is 1+1?"},
+        ]
+
+    def tearDown(self):
+        shutil.rmtree(self.test_cache_path, ignore_errors=True)
+
+    def test_put_and_get(self):
+        """Tests that a cached answer comes back with the same shape."""
+
+        cache = ResponseCache(path=self.test_cache_path)
+        self.assertIsNone(cache.get("gpt-3.5-turbo", self.messages))
+        self.assertFalse(cache.last_hit)
+
+        cache.put("gpt-3.5-turbo", self.messages, completion("2"))
+        answer = cache.get("gpt-3.5-turbo", self.messages)
+
+        self.assertTrue(cache.last_hit)
+        self.assertIsInstance(answer, ChatCompletion)
+        self.assertEqual(answer, completion("2"))
+        self.assertEqual(cache.stats()["hits"], 1)
+        self.assertEqual(cache.stats()["misses"], 1)
+
+    def test_key_covers_model_and_messages(self):
+        """Tests that another model or question is a miss."""
+
+        cache = ResponseCache(path=self.test_cache_path)
+        cache.put("gpt-3.5-turbo", self.messages, completion("2"))
+
+        self.assertIsNone(cache.get("gpt-4o", self.messages))
+        other_question = [self.messages[0], {"role": "user", "content": "And 2+2?"}]
+        self.assertIsNone(cache.get("gpt-3.5-turbo", other_question))
+
+    def test_ttl(self):
+        """Tests that expired answers are misses."""
+
+        cache = ResponseCache(path=self.test_cache_path, ttl=60)
+        cache.put("gpt-3.5-turbo", self.messages, completion("2"))
+
+        with patch("time.time", return_value=time.time() + 61):
+            self.assertIsNone(cache.get("gpt-3.5-turbo", self.messages))
+        self.assertEqual(cache.stats()["entries"], 0)
+
+    def test_lru_eviction(self):
+        """Tests that the least recently used answers are evicted past the size limit."""
+
+        cache = ResponseCache(path=self.test_cache_path)
+        questions = [
+            [self.messages[0], {"role": "user", "content": f"What is {n}+{n}?"}]
+            for n in range(3)
+        ]
+        for age, question in enumerate(questions):
+            cache.put("gpt-3.5-turbo", question, completion("answer"))
+            path = os.path.join(
+                self.test_cache_path, f"{cache.key('gpt-3.5-turbo', question)}.json"
+            )
+            os.utime(path, (time.time() - 100 + age, time.time() - 100 + age))
+
+        # the oldest answer is used again, the second one is now the least recent
+        self.assertIsNotNone(cache.get("gpt-3.5-turbo", questions[0]))
+
+        # one byte over the limit, evicting one answer is enough
+        size = cache.stats()["size"]
+        cache = ResponseCache(path=self.test_cache_path, max_bytes=size - 1)
+        self.assertEqual(cache.evict(), 1)
+
+        self.assertIsNone(cache.get("gpt-3.5-turbo", questions[1]))
+        self.assertIsNotNone(cache.get("gpt-3.5-turbo", questions[0]))
+        self.assertIsNotNone(cache.get("gpt-3.5-turbo", questions[2]))
+
+    @patch("builtins.print")
+    def test_put_unwritable(self, mock_print):
+        """Tests that an answer that cannot be cached is skipped, logged on debug."""
+
+        # a file where the cache directory should be
+        with open(self.test_cache_path, "w", encoding="utf-8"):
+            pass
+        self.addCleanup(os.remove, self.test_cache_path)
+        cache = ResponseCache(path=self.test_cache_path)
+
+        cache.put("gpt-3.5-turbo", self.messages, completion("2"))
+        mock_print.assert_not_called()
+
+        with patch.dict(os.environ, {"LOG_LEVEL": "DEBUG"}):
+            cache.put("gpt-3.5-turbo", self.messages, completion("2"))
+        self.assertIn("Cache write failed", mock_print.call_args.args[0])
+        self.assertIsNone(cache.get("gpt-3.5-turbo", self.messages))
+
+    def test_get_user_answer_hit_skips_request(self):
+        """Tests that ChatManager.get_user_answer returns cached answers without a request."""
+
+        cache = ResponseCache(path=self.test_cache_path)
+        chat_manager = ChatManager(
+            conversations_manager=MagicMock(),
+            token_limit=4096,
+            session=MagicMock(),
+            messages=[],
+            model="gpt-3.5-turbo",
+            printer=MagicMock(),
+            client=MagicMock(),
+        )
+        chat_manager.client.chat.completions.create.return_value = completion("2")
+
+        first = chat_manager.get_user_answer(self.messages, cache=cache)
+        second = chat_manager.get_user_answer(self.messages, cache=cache)
+
+        chat_manager.client.chat.completions.create.assert_called_once()
+        self.assertEqual(first, second)
+        self.assertTrue(cache.last_hit)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,15 +1,25 @@
 """Tests for chat_utils.py."""
 
+import threading
 import unittest
 from unittest.mock import MagicMock, patch
 
 import openai
+from mocks import (
+    ChatCompletionChunkMock,
+    ChatCompletionMessageMock,
+    ChatCompletionMock,
+    ChoiceMock,
+    ChunkChoiceMock,
+    ChunkDeltaMock,
+    UsageMock,
+)
 from prompt_toolkit import PromptSession
 from prompt_toolkit.styles import Style as PromptStyle
 
 from terminalgpt import config
 from terminalgpt.chat import ChatManager
-from terminalgpt.conversations import ConversationManager
+from terminalgpt.conversations import ConversationManager, is_summary
 from terminalgpt.printer import PrinterFactory
 
 
@@ -151,6 +161,207 @@ class TestChatUtils(unittest.TestCase):
         self.assertEqual(chat_manager.total_usage, 20)
         self.assertEqual(24, reduced)
 
+    def test_trim_context(self):
+        """Tests that only the chat context is trimmed, keeping the first message."""
+
+        chat_manager = self.set_test()
+        first, second = chat_manager.messages[0], chat_manager.messages[2]
+
+        self.assertFalse(chat_manager.trim_context(list(chat_manager.messages)))
+        self.assertTrue(chat_manager.trim_context(chat_manager.messages))
+        self.assertEqual(chat_manager.messages[:2], [first, second])
+
+    def test_summarize_context(self):
+        """Tests that the oldest messages are folded into a rolling summary."""
+
+        chat_manager = self.set_test()
+        chat_manager.client = MagicMock()
+        chat_manager.client.chat.completions.create.return_value = ChatCompletionMock(
+            choices=[ChoiceMock(message=ChatCompletionMessageMock(content="- greeted"))]
+        )
+        question = chat_manager.messages[-1]
+        chat_manager.token_limit = chat_manager.num_tokens_from_messages() - 1
+        chat_manager.total_usage = chat_manager.num_tokens_from_messages()
+
+        self.assertTrue(chat_manager.summarize_context())
+
+        self.assertEqual(len(chat_manager.messages), 3)
+        self.assertEqual(
+            chat_manager.messages[1]["content"], config.SUMMARY_PREFIX + "- greeted"
+        )
+        self.assertIs(chat_manager.messages[-1], question)
+        _, kwargs = chat_manager.client.chat.completions.create.call_args
+        self.assertEqual(kwargs["model"], config.COMPACTION_MODEL)
+        self.assertIn("Hello system", kwargs["messages"][1]["content"])
+
+        # the next summary starts from the previous one, which is kept when truncating
+        chat_manager.append_message({"role": "assistant", "content": "Hi again"})
+        chat_manager.append_message({"role": "user", "content": "And now?"})
+        chat_manager.total_usage = chat_manager.num_tokens_from_messages()
+        chat_manager.token_limit = chat_manager.total_usage - 1
+        self.assertTrue(chat_manager.summarize_context())
+        _, kwargs = chat_manager.client.chat.completions.create.call_args
+        self.assertIn("Current summary:\n- greeted", kwargs["messages"][1]["content"])
+        self.assertNotIn("Hello system", kwargs["messages"][1]["content"])
+
+    def test_fit_context_falls_back_to_truncation(self):
+        """Tests that a failed summary truncates the context instead."""
+
+        chat_manager = self.set_test()
+        chat_manager.compaction = "summarize"
+        chat_manager.client = MagicMock()
+        chat_manager.client.chat.completions.create.side_effect = ValueError("down")
+        chat_manager.token_limit = chat_manager.num_tokens_from_messages() - 1
+        chat_manager.total_usage = chat_manager.num_tokens_from_messages()
+
+        chat_manager.fit_context()
+
+        self.assertFalse(chat_manager.exceeding_token_limit())
+        self.assertFalse(any(is_summary(message) for message in chat_manager.messages))
+
+    def set_stream(self, chat_manager, chunks):
+        """Sets a mocked client streaming the given text chunks."""
+
+        stream = MagicMock()
+        stream.__iter__.return_value = iter(
+            [
+                ChatCompletionChunkMock(
+                    choices=[ChunkChoiceMock(delta=ChunkDeltaMock(content=chunk))]
+                )
+                for chunk in chunks
+            ]
+            + [ChatCompletionChunkMock(choices=[], usage=UsageMock(total_tokens=42))]
+        )
+        chat_manager.client = MagicMock()
+        chat_manager.client.chat.completions.create.return_value = stream
+
+        return stream
+
+    @patch("builtins.print")
+    def test_stream_user_answer(self, _):
+        """Tests stream_user_answer function."""
+
+        chat_manager = self.set_test()
+        self.set_stream(chat_manager, ["Hello", " there", "!"])
+
+        message, interrupted = chat_manager.stream_user_answer(chat_manager.messages)
+
+        self.assertEqual(message, "Hello there!")
+        self.assertFalse(interrupted)
+        self.assertEqual(chat_manager.total_usage, 42)
+        _, kwargs = chat_manager.client.chat.completions.create.call_args
+        self.assertTrue(kwargs["stream"])
+
+    def test_stream_user_answer_interrupted(self):
+        """Tests stream_user_answer function keeps the partial answer on Ctrl-C."""
+
+        chat_manager = self.set_test()
+        stream = self.set_stream(chat_manager, ["Hello", " there", "!"])
+
+        def print_until_interrupted(chunks, **_):
+            next(chunks)
+            raise KeyboardInterrupt
+
+        with patch(
+            "terminalgpt.printer.MarkdownPrinter.print_assistant_stream",
+            side_effect=print_until_interrupted,
+        ):
+            message, interrupted = chat_manager.stream_user_answer(
+                chat_manager.messages
+            )
+
+        self.assertEqual(message, "Hello")
+        self.assertTrue(interrupted)
+        stream.close.assert_called()
+
+    def set_welcome_test(self, welcome_answered: threading.Event):
+        """Sets a chat whose welcome request waits for welcome_answered."""
+
+        printer = MagicMock()
+        session = MagicMock()
+        chat_manager = ChatManager(
+            conversations_manager=MagicMock(),
+            token_limit=4096,
+            session=session,
+            messages=[{"role": "system", "content": "Hello user"}],
+            model="gpt-3.5-turbo",
+            printer=printer,
+            client=MagicMock(),
+        )
+
+        def create(messages, **_):
+            content = "Bye!"
+            if messages[-1]["content"] == "Welcome back!":
+                welcome_answered.wait(5)
+                content = "Welcome back, user!"
+            message = ChatCompletionMessageMock(content=content)
+            return ChatCompletionMock(
+                choices=[ChoiceMock(message=message)], usage=UsageMock(total_tokens=42)
+            )
+
+        chat_manager.client.chat.completions.create.side_effect = create
+        welcome_messages = chat_manager.messages + [
+            {"role": "system", "content": "Welcome back!"}
+        ]
+        return chat_manager, printer, session, welcome_messages
+
+    @patch("sys.stdin")
+    @patch("terminalgpt.chat.yaspin")
+    def test_welcome_while_typing(self, *_):
+        """Tests that the welcome message is printed while the user types."""
+
+        welcome_answered = threading.Event()
+        welcome_answered.set()
+        chat_manager, printer, session, welcome_messages = self.set_welcome_test(
+            welcome_answered
+        )
+        welcome_printed = threading.Event()
+        printer.print_assistant_message.side_effect = (
+            lambda *_, **__: welcome_printed.set()
+        )
+
+        def prompt():
+            self.assertTrue(welcome_printed.wait(5))
+            return "exit"
+
+        session.prompt.side_effect = prompt
+        welcomes = []
+
+        with self.assertRaises(SystemExit):
+            chat_manager.chat_loop(welcome_messages, welcomes.append)
+
+        printed = [
+            call.args[0] for call in printer.print_assistant_message.call_args_list
+        ]
+        self.assertEqual(printed, ["Welcome back, user!", "Bye!"])
+        self.assertEqual(welcomes, ["Welcome back, user!"])
+
+    @patch("sys.stdin")
+    @patch("terminalgpt.chat.yaspin")
+    def test_welcome_discarded(self, *_):
+        """Tests that a welcome arriving after the first message is not printed."""
+
+        welcome_answered = threading.Event()
+        chat_manager, printer, session, welcome_messages = self.set_welcome_test(
+            welcome_answered
+        )
+        session.prompt.return_value = "exit"
+        welcomes = []
+
+        with self.assertRaises(SystemExit):
+            chat_manager.chat_loop(welcome_messages, welcomes.append)
+        welcome_answered.set()
+        for thread in threading.enumerate():
+            if thread.name == "welcome":
+                thread.join(5)
+
+        printed = [
+            call.args[0] for call in printer.print_assistant_message.call_args_list
+        ]
+        self.assertEqual(printed, ["Bye!"])
+        # not printed, but still cached for the next load
+        self.assertEqual(welcomes, ["Welcome back, user!"])
+
 
 if __name__ == "__main__":
     unittest.main()
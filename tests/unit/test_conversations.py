@@ -1,8 +1,11 @@
 import json
 import os
+import shutil
+import threading
 import unittest
 from unittest.mock import MagicMock, patch
 
+import openai
 from mocks import ChatCompletionMessageMock, ChatCompletionMock, ChoiceMock
 
 from terminalgpt import config
@@ -16,10 +19,7 @@ class TestConversations(unittest.TestCase):
         config.CONVERSATIONS_PATH = self.test_conversation_path
 
     def tearDown(self):
-        if os.path.exists(self.test_conversation_path):
-            for filename in os.listdir(self.test_conversation_path):
-                os.remove(os.path.join(self.test_conversation_path, filename))
-            os.rmdir(self.test_conversation_path)
+        shutil.rmtree(self.test_conversation_path, ignore_errors=True)
 
     def create_conversation_manager(self):
         cm = ConversationManager(
@@ -149,6 +149,334 @@ class TestConversations(unittest.TestCase):
         result = cm.get_conversations()
         self.assertTrue(cm.conversation_name in result)
 
+    def read_lines(self, cm):
+        with open(
+            os.path.join(self.test_conversation_path, cm.conversation_name),
+            "r",
+            encoding="utf-8",
+        ) as f:
+            return f.read().splitlines()
+
+    def test_save_conversation_appends_only_new_messages(self):
+        cm = self.create_conversation_manager()
+        messages = [
+            {"role": "system", "content": "Test system message"},
+            {"role": "user", "content": "Test message"},
+        ]
+        cm.save_conversation(messages)
+
+        messages.append({"role": "assistant", "content": "Test answer"})
+        messages.pop(1)  # dropped from the context, stays in the log
+        cm.save_conversation(messages)
+
+        self.assertEqual(len(self.read_lines(cm)), 3)
+        self.assertEqual(cm.load_conversation()[2]["content"], "Test answer")
+
+    def test_save_conversation_converts_legacy_format(self):
+        cm = self.create_conversation_manager()
+        os.makedirs(self.test_conversation_path, exist_ok=True)
+        messages = [{"role": "user", "content": "Test message"}]
+
+        with open(
+            os.path.join(self.test_conversation_path, cm.conversation_name),
+            "w",
+            encoding="utf-8",
+        ) as f:
+            json.dump(messages, f)
+
+        messages = cm.load_conversation()
+        messages.append({"role": "assistant", "content": "Test answer"})
+        cm.save_conversation(messages)
+
+        self.assertEqual(
+            [json.loads(line) for line in self.read_lines(cm)],
+            messages,
+        )
+
+    def test_load_conversation_torn_write(self):
+        cm = self.create_conversation_manager()
+        messages = [{"role": "user", "content": "Test message"}]
+        cm.save_conversation(messages)
+
+        with open(
+            os.path.join(self.test_conversation_path, cm.conversation_name),
+            "a",
+            encoding="utf-8",
+        ) as f:
+            f.write('{"role": "assistant", "cont')
+
+        messages.append({"role": "user", "content": "Another message"})
+        cm.save_conversation(messages)
+
+        self.assertEqual(cm.load_conversation(), messages)
+
+    def test_compact_conversation(self):
+        cm = self.create_conversation_manager()
+        cm.save_conversation([{"role": "user", "content": "Test message"}])
+
+        messages = [{"role": "user", "content": "Another conversation"}]
+        cm.save_conversation(messages)
+        self.assertEqual(len(self.read_lines(cm)), 3)
+        self.assertEqual(cm.load_conversation(), messages)
+
+        cm.compact_conversation()
+        self.assertEqual(len(self.read_lines(cm)), 1)
+        self.assertEqual(cm.load_conversation(), messages)
+
+    def test_compact_conversation_after_rename(self):
+        cm = self.create_conversation_manager()
+        cm.save_conversation([{"role": "user", "content": "Test message"}])
+        messages = [{"role": "user", "content": "Another conversation"}]
+        cm.save_conversation(messages)
+
+        # the title was generated before the compaction thread ran
+        cm.rename_conversation("titled")
+        cm.compact_conversation()
+        self.assertEqual(len(self.read_lines(cm)), 1)
+        self.assertEqual(cm.load_conversation(), messages)
+
+        os.remove(os.path.join(self.test_conversation_path, "titled"))
+        cm.compact_conversation()
+
+    def test_save_conversation_summary(self):
+        cm = self.create_conversation_manager()
+        messages = [{"role": "system", "content": "Test system message"}] + [
+            {"role": "user", "content": f"Test message {number}"} for number in range(4)
+        ]
+        cm.save_conversation(messages)
+
+        # the first two messages are folded into a summary, then a turn is added
+        summary = {"role": "system", "content": config.SUMMARY_PREFIX + "- tested"}
+        messages[1:3] = [summary]
+        messages.append({"role": "assistant", "content": "Test answer"})
+        cm.save_conversation(messages)
+
+        records = [json.loads(line) for line in self.read_lines(cm)]
+        self.assertEqual(records[5], {"op": "summary", "message": summary, "keep": 2})
+        self.assertEqual(records[6:], messages[-1:])
+        self.assertEqual(cm.load_conversation(), messages)
+
+        # a loaded summary is not recorded again
+        messages = cm.load_conversation()
+        messages.append({"role": "user", "content": "Another message"})
+        cm.save_conversation(messages)
+        self.assertEqual(len(self.read_lines(cm)), 8)
+        self.assertEqual(cm.load_conversation(), messages)
+
+    def test_conversations_index(self):
+        cm = self.create_conversation_manager()
+        cm.save_conversation([{"role": "user", "content": "Test message"}], tokens=9)
+
+        info = cm.get_conversation_info(cm.conversation_name)
+        self.assertEqual(info["messages"], 1)
+        self.assertEqual(info["tokens"], 9)
+        self.assertEqual(cm.get_conversations(), [cm.conversation_name])
+
+        cm.delete_conversation(cm.conversation_name)
+        self.assertEqual(cm.get_conversations(), [])
+
+    def test_index_written_on_close(self):
+        cm = self.create_conversation_manager()
+        messages = [{"role": "user", "content": "Test message"}]
+        cm.save_conversation(messages, tokens=9)
+        index_path = os.path.join(
+            self.test_conversation_path, config.CONVERSATIONS_INDEX
+        )
+        with open(index_path, encoding="utf-8") as f:
+            written = f.read()
+
+        # later saves do not rewrite the index
+        messages.append({"role": "assistant", "content": "Test answer"})
+        cm.save_conversation(messages, tokens=18)
+        with open(index_path, encoding="utf-8") as f:
+            self.assertEqual(f.read(), written)
+
+        cm.close()
+        with open(index_path, encoding="utf-8") as f:
+            entry = json.load(f)["conversations"][cm.conversation_name]
+        self.assertEqual(entry["messages"], 2)
+        self.assertEqual(entry["tokens"], 18)
+
+    def test_cached_welcome(self):
+        cm = self.create_conversation_manager()
+        history = [{"role": "system", "content": "Test system message"}] + [
+            {"role": "user", "content": f"Test message {number}"} for number in range(4)
+        ]
+        cm.save_conversation(history)
+
+        # a first load asks for the whole history
+        self.assertIsNone(cm.cached_welcome(history))
+        self.assertEqual(
+            cm.welcome_back_messages(history),
+            history + [config.INIT_WELCOME_BACK_MESSAGE],
+        )
+        cm.save_welcome(history, "Welcome back, we tested")
+        self.assertNotIn("welcome", cm.get_conversation_info(cm.conversation_name))
+
+        # an unchanged history needs no request
+        self.assertEqual(cm.cached_welcome(list(history)), "Welcome back, we tested")
+
+        # a grown one only sends the new turns after the last welcome
+        history.append({"role": "assistant", "content": "Test answer"})
+        self.assertIsNone(cm.cached_welcome(history))
+        self.assertEqual(
+            cm.welcome_back_messages(history),
+            [
+                history[0],
+                {"role": "assistant", "content": "Welcome back, we tested"},
+                history[-1],
+                config.WELCOME_BACK_UPDATE_MESSAGE,
+            ],
+        )
+
+        # also after the oldest messages were truncated
+        del history[1:3]
+        self.assertEqual(cm.welcome_back_messages(history)[2:-1], history[-1:])
+
+        # the welcome survives an index rebuild
+        cm.rebuild_index()
+        self.assertIsNone(cm.cached_welcome(history[:-1]))
+        cm.save_welcome(history, "Welcome back again")
+        cm.rebuild_index()
+        self.assertEqual(cm.cached_welcome(history), "Welcome back again")
+
+        # and follows the conversation when it is renamed
+        cm.rename_conversation("renamed_conversation")
+        self.assertEqual(cm.cached_welcome(history), "Welcome back again")
+        cm.delete_conversation(cm.conversation_name)
+        self.assertIsNone(cm.cached_welcome(history))
+
+    def test_rebuild_index(self):
+        cm = self.create_conversation_manager()
+        cm.save_conversation([{"role": "user", "content": "Test message"}])
+
+        # a conversation added behind the index back
+        with open(
+            os.path.join(self.test_conversation_path, "other_conversation"),
+            "w",
+            encoding="utf-8",
+        ) as f:
+            json.dump([{"role": "user", "content": "Test message"}], f)
+        self.assertNotIn("other_conversation", cm.get_conversations())
+
+        self.assertEqual(cm.rebuild_index(), 2)
+        self.assertIn("other_conversation", cm.get_conversations())
+        self.assertEqual(cm.get_conversation_info("other_conversation")["messages"], 1)
+        # and its tokens are counted
+        self.assertGreater(cm.get_conversation_info("other_conversation")["tokens"], 0)
+
+    def test_save_context_titles_in_background(self):
+        cm = self.create_conversation_manager()
+        cm.conversation_name = ""
+        messages = [{"role": "user", "content": "Test message"}]
+
+        title_requested = threading.Event()
+
+        def generate_title(_):
+            title_requested.wait()
+            return "test_title"
+
+        with patch(
+            "terminalgpt.conversations.ConversationManager.generate_conversation_title",
+            side_effect=generate_title,
+        ):
+            cm.save_context(messages, total_usage=1000, token_limit=4096)
+            self.assertTrue(cm.conversation_name.startswith("untitled_"))
+            title_requested.set()
+            cm.wait_for_title()
+
+        self.assertEqual(cm.conversation_name, "test_title")
+        self.assertEqual(cm.get_conversations(), ["test_title"])
+
+        # saving goes on in the renamed file
+        messages.append({"role": "assistant", "content": "Test answer"})
+        cm.save_context(messages, total_usage=1000, token_limit=4096)
+        self.assertEqual(cm.load_conversation(), messages)
+
+    def test_save_context_title_failure_keeps_temporary_name(self):
+        cm = self.create_conversation_manager()
+        cm.conversation_name = ""
+
+        with patch(
+            "terminalgpt.conversations.ConversationManager.generate_conversation_title",
+            side_effect=Exception("Test exception"),
+        ):
+            cm.save_context(
+                [{"role": "user", "content": "Test message"}],
+                total_usage=1000,
+                token_limit=4096,
+            )
+            cm.wait_for_title()
+
+        self.assertTrue(cm.conversation_name.startswith("untitled_"))
+        self.assertEqual(cm.get_conversations(), [cm.conversation_name])
+
+    def test_untitled_conversation_titled_on_next_save(self):
+        cm = self.create_conversation_manager()
+        cm.conversation_name = "untitled_20240101_000000"
+        messages = [{"role": "user", "content": "Test message"}]
+        cm.save_conversation(messages)
+
+        with patch(
+            "terminalgpt.conversations.ConversationManager.generate_conversation_title",
+            return_value="test_title",
+        ):
+            cm.save_context(messages, total_usage=1000, token_limit=4096)
+            cm.wait_for_title()
+
+        self.assertEqual(cm.conversation_name, "test_title")
+        self.assertEqual(cm.get_conversations(), ["test_title"])
+
+    @patch("time.strftime", return_value="untitled_20240101_000000_")
+    def test_untitled_conversations_started_in_the_same_second(self, _):
+        messages = [
+            [{"role": "user", "content": "First session"}],
+            [{"role": "user", "content": "Second session"}],
+        ]
+        managers = []
+        with patch(
+            "terminalgpt.conversations.ConversationManager.generate_conversation_title",
+            return_value="",
+        ):
+            for session in messages:
+                cm = self.create_conversation_manager()
+                cm.conversation_name = ""
+                cm.save_context(session, total_usage=1000, token_limit=4096)
+                cm.wait_for_title()
+                managers.append(cm)
+
+        self.assertNotEqual(
+            managers[0].conversation_name, managers[1].conversation_name
+        )
+        for cm, session in zip(managers, messages):
+            self.assertEqual(cm.load_conversation(), session)
+
+    def test_rename_conversation_taken_name(self):
+        cm = self.create_conversation_manager()
+        cm.save_conversation([{"role": "user", "content": "Test message"}])
+        cm.conversation_name = "other_conversation"
+        cm.save_conversation([{"role": "user", "content": "Test message"}])
+
+        self.assertEqual(
+            cm.rename_conversation(self.test_conversation_name),
+            f"{self.test_conversation_name}_2",
+        )
+
+    @patch("time.sleep")
+    def test_get_system_answer_gives_up(self, _):
+        cm = self.create_conversation_manager()
+        cm.client = MagicMock()
+        cm.client.chat.completions.create.side_effect = openai.APIConnectionError(
+            request=MagicMock()
+        )
+
+        with self.assertRaises(openai.APIConnectionError):
+            cm.get_system_answer([{"role": "user", "content": "Test message"}])
+        self.assertEqual(
+            cm.client.chat.completions.create.call_count,
+            config.SYSTEM_ANSWER_ATTEMPTS,
+        )
+
     def test_is_conversations_empty(self):
         cm = self.create_conversation_manager()
         message = "No conversations found."
@@ -0,0 +1,193 @@
+"""Tests for daemon.py."""
+
+import os
+import shutil
+import stat
+import threading
+import unittest
+from unittest.mock import patch
+
+import openai
+from openai import OpenAI
+
+from terminalgpt.cache import ResponseCache
+from terminalgpt.daemon import (
+    DaemonClient,
+    DaemonError,
+    DaemonServer,
+    DaemonTokenizer,
+    connect,
+)
+from terminalgpt.metrics import MetricsStore
+from terminalgpt.models import get_tokenizer
+from terminalgpt.standin import StandInServer
+
+MESSAGES = [{"role": "user", "content": "Hello"}]
+
+
+class TestDaemon(unittest.TestCase):
+    """Tests for the DaemonServer and DaemonClient classes."""
+
+    def setUp(self):
+        self.test_path = "test_daemon"
+        self.socket_path = os.path.join(self.test_path, "daemon.sock")
+        self.standin = StandInServer(answer_tokens=5)
+        self.standin.start()
+        self.metrics = MetricsStore(path=os.path.join(self.test_path, "metrics.bin"))
+        self.server = None
+        self.thread = None
+
+    def tearDown(self):
+        if self.server is not None:
+            self.server.stop()
+            self.thread.join()
+        self.standin.stop()
+        shutil.rmtree(self.test_path, ignore_errors=True)
+
+    def start(self, **kwargs):
+        """Serves a daemon backed by the stand-in server from a thread."""
+
+        ready = threading.Event()
+        self.server = DaemonServer(
+            path=self.socket_path,
+            client=OpenAI(api_key="mock", base_url=self.standin.url, max_retries=0),
+            cache=ResponseCache(path=os.path.join(self.test_path, "cache")),
+            metrics=self.metrics,
+            **kwargs,
+        )
+        self.thread = threading.Thread(
+            target=self.server.serve_forever, kwargs={"ready": ready.set}, daemon=True
+        )
+        self.thread.start()
+        self.assertTrue(ready.wait(5))
+        return DaemonClient(self.socket_path)
+
+    def one_shot(self, client, **kwargs) -> list:
+        request = {"command": "one_shot", "model": "gpt-4o-mini", "messages": MESSAGES}
+        request.update(kwargs)
+        return list(client.request(request))
+
+    def test_socket_permissions(self):
+        """Tests that only the user may connect to the socket."""
+
+        client = self.start()
+
+        mode = stat.S_IMODE(os.stat(self.socket_path).st_mode)
+        self.assertEqual(mode, 0o600)
+        self.assertEqual(client.ping()["pid"], os.getpid())
+        self.assertIsNotNone(connect(self.socket_path))
+
+    def test_no_daemon(self):
+        """Tests that the commands fall back to in-process without a daemon."""
+
+        self.assertIsNone(connect(self.socket_path))
+        with self.assertRaises(OSError):
+            DaemonClient(self.socket_path).request({"command": "ping"})
+
+    def test_stale_socket(self):
+        """Tests that the socket of a killed daemon is replaced."""
+
+        os.makedirs(self.test_path)
+        with open(self.socket_path, "w", encoding="utf-8"):
+            pass
+
+        self.assertIsNotNone(self.start().ping())
+
+    def test_one_shot_cached(self):
+        """Tests that the daemon answers, caches and records one shot questions."""
+
+        client = self.start()
+
+        (first,) = self.one_shot(client, cache=True)
+        (second,) = self.one_shot(client, cache=True)
+
+        self.assertFalse(first["cached"])
+        self.assertTrue(second["cached"])
+        self.assertEqual(first["answer"], second["answer"])
+        self.assertEqual(self.standin.requests, 1)
+        (record,) = self.metrics.read()
+        self.assertEqual(record["completion_tokens"], 5)
+
+    def test_one_shot_stream(self):
+        """Tests that a streamed one shot answer arrives as deltas."""
+
+        client = self.start()
+
+        events = self.one_shot(client, stream=True)
+
+        deltas = [event["delta"] for event in events if "delta" in event]
+        self.assertEqual(len(deltas), 5)
+        self.assertEqual(events[-1]["answer"], "".join(deltas))
+
+    def test_complete(self):
+        """Tests that the client stands in for the OpenAI client of a chat."""
+
+        client = self.start()
+
+        answer = client.chat.completions.create(model="gpt-4o-mini", messages=MESSAGES)
+        chunks = list(
+            client.chat.completions.create(
+                model="gpt-4o-mini",
+                messages=MESSAGES,
+                stream=True,
+                stream_options={"include_usage": True},
+            )
+        )
+
+        streamed = "".join(
+            chunk.choices[0].delta.content or "" for chunk in chunks if chunk.choices
+        )
+        self.assertEqual(streamed, answer.choices[0].message.content)
+        self.assertEqual(chunks[-1].usage.completion_tokens, 5)
+
+    def test_complete_errors(self):
+        """Tests that errors are raised as the OpenAI errors they were."""
+
+        self.standin.error_rate = 1.0
+        self.standin.retry_after = 2
+        client = self.start()
+
+        with self.assertRaises(openai.RateLimitError) as raised:
+            client.chat.completions.create(model="gpt-4o-mini", messages=MESSAGES)
+        self.assertEqual(raised.exception.response.headers["retry-after"], "2")
+
+        with self.assertRaises(DaemonError):
+            list(client.request({"command": "unknown"}))
+
+    def test_malformed_request(self):
+        """Tests that a request failing in its handler is answered with an error."""
+
+        client = self.start()
+
+        with self.assertRaises(DaemonError):
+            list(client.request({"command": "one_shot"}))
+        self.assertIsNotNone(client.ping())
+
+    def test_count_tokens(self):
+        """Tests that a chat session counts its tokens with the daemon's encoder."""
+
+        client = self.start()
+        messages = MESSAGES + [{"role": "assistant", "name": "Bob", "content": "Hi"}]
+
+        with patch(
+            "terminalgpt.daemon.get_encoder", side_effect=AssertionError("loaded")
+        ):
+            tokenizer = DaemonTokenizer(client, "gpt-4o-mini")
+            counts = tokenizer.count_messages(messages)
+            count = tokenizer.count_message(messages[0])
+
+        self.assertEqual(counts, get_tokenizer("gpt-4o-mini").count_messages(messages))
+        self.assertEqual(count, counts[0])
+
+    def test_idle_shutdown(self):
+        """Tests that the daemon exits and removes its socket once idle."""
+
+        self.start(idle_timeout=0.2)
+
+        self.thread.join(5)
+        self.assertFalse(self.thread.is_alive())
+        self.assertFalse(os.path.exists(self.socket_path))
+
+
+if __name__ == "__main__":
+    unittest.main()
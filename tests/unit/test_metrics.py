@@ -0,0 +1,145 @@
+"""Tests for metrics.py."""
+
+import os
+import shutil
+import time
+import unittest
+from unittest.mock import MagicMock
+
+from mocks import ChatCompletionChunkMock, ChunkChoiceMock, ChunkDeltaMock, UsageMock
+
+from terminalgpt.chat import ChatManager
+from terminalgpt.metrics import RECORD, MetricsStore, day, summarize
+
+
+class TestMetricsStore(unittest.TestCase):
+    """Tests for the MetricsStore class."""
+
+    def setUp(self):
+        self.test_metrics_path = os.path.join("test_metrics", "metrics.bin")
+
+    def tearDown(self):
+        shutil.rmtree("test_metrics", ignore_errors=True)
+
+    def record(self, store, **kwargs):
+        """Records a request with default metrics overridden by kwargs."""
+
+        metrics = {
+            "model": "gpt-4o-mini",
+            "prompt_tokens": 10,
+            "completion_tokens": 20,
+            "latency": 2.0,
+        }
+        metrics.update(kwargs)
+        store.record(**metrics)
+
+    def test_record_and_read(self):
+        """Tests that records are fixed-size and read back."""
+
+        store = MetricsStore(path=self.test_metrics_path)
+        self.record(store, ttft=1.0, retries=2)
+        self.record(store, model="gpt-4o")
+
+        self.assertEqual(os.path.getsize(self.test_metrics_path), 2 * RECORD.size)
+        first, second = store.read()
+        self.assertEqual(first["model"], "gpt-4o-mini")
+        self.assertEqual(first["prompt_tokens"], 10)
+        self.assertEqual(first["retries"], 2)
+        # streamed, the 20 tokens were generated in the second after the first one
+        self.assertAlmostEqual(first["tokens_per_second"], 20)
+        # not streamed, the first token is the whole answer
+        self.assertEqual(second["ttft"], second["latency"])
+        self.assertAlmostEqual(second["tokens_per_second"], 10)
+
+    def test_read_since(self):
+        """Tests that older records are filtered out."""
+
+        store = MetricsStore(path=self.test_metrics_path)
+        self.record(store, time=time.time() - 3600)
+        self.record(store)
+
+        self.assertEqual(len(list(store.read(since=time.time() - 60))), 1)
+
+    def test_rotation(self):
+        """Tests that a full file is rotated to a single backup."""
+
+        store = MetricsStore(path=self.test_metrics_path, max_bytes=2 * RECORD.size)
+        for tokens in range(5):
+            self.record(store, prompt_tokens=tokens)
+
+        self.assertTrue(os.path.exists(self.test_metrics_path + ".1"))
+        # the backup holds records 2 and 3, the current file record 4
+        tokens = [record["prompt_tokens"] for record in store.read()]
+        self.assertEqual(tokens, [2, 3, 4])
+
+    def test_torn_record(self):
+        """Tests that a partially written last record is skipped."""
+
+        store = MetricsStore(path=self.test_metrics_path)
+        self.record(store)
+        with open(self.test_metrics_path, "ab") as file:
+            file.write(b"\0" * (RECORD.size // 2))
+
+        self.assertEqual(len(list(store.read())), 1)
+
+    def test_summarize(self):
+        """Tests the percentiles and totals per model and per day."""
+
+        store = MetricsStore(path=self.test_metrics_path)
+        for latency in range(1, 11):
+            self.record(store, latency=float(latency))
+        self.record(store, model="gpt-4o", retries=3)
+
+        per_model = summarize(store.read(), lambda record: record["model"])
+        self.assertEqual(list(per_model), ["gpt-4o", "gpt-4o-mini"])
+        self.assertEqual(per_model["gpt-4o-mini"]["requests"], 10)
+        self.assertEqual(per_model["gpt-4o-mini"]["latency_p50"], 5)
+        self.assertEqual(per_model["gpt-4o-mini"]["latency_p95"], 10)
+        self.assertEqual(per_model["gpt-4o-mini"]["completion_tokens"], 200)
+        self.assertEqual(per_model["gpt-4o"]["retries"], 3)
+
+        per_day = summarize(store.read(), day)
+        self.assertEqual(list(per_day), [time.strftime("%Y-%m-%d")])
+        self.assertEqual(per_day[time.strftime("%Y-%m-%d")]["requests"], 11)
+
+    def test_chat_manager_records_streams(self):
+        """Tests that ChatManager records a streamed answer with its time to first token."""
+
+        store = MetricsStore(path=self.test_metrics_path)
+        printer = MagicMock()
+        printer.print_assistant_stream.side_effect = list  # drains the chunks
+        chat_manager = ChatManager(
+            conversations_manager=MagicMock(),
+            token_limit=4096,
+            session=MagicMock(),
+            messages=[],
+            model="gpt-4o-mini",
+            printer=printer,
+            client=MagicMock(),
+            metrics=store,
+        )
+        chat_manager.client.chat.completions.create.return_value = iter(
+            [
+                ChatCompletionChunkMock(
+                    choices=[ChunkChoiceMock(delta=ChunkDeltaMock(content="Hi"))]
+                ),
+                ChatCompletionChunkMock(
+                    choices=[],
+                    usage=UsageMock(
+                        total_tokens=12, prompt_tokens=11, completion_tokens=1
+                    ),
+                ),
+            ]
+        )
+
+        chat_manager.stream_user_answer([{"role": "user", "content": "Hello"}])
+
+        (record,) = store.read()
+        self.assertEqual(record["model"], "gpt-4o-mini")
+        self.assertEqual(record["prompt_tokens"], 11)
+        self.assertEqual(record["completion_tokens"], 1)
+        self.assertLessEqual(record["ttft"], record["latency"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,75 @@
+"""Tests for models.py."""
+
+import unittest
+from unittest.mock import patch
+
+from terminalgpt import config, models
+
+
+class TestModels(unittest.TestCase):
+    """Tests for the model registry."""
+
+    def setUp(self):
+        models.get_models.cache_clear()
+
+    def tearDown(self):
+        models.get_models.cache_clear()
+
+    def with_defaults(self, defaults: dict):
+        """Patches the defaults.json configuration."""
+
+        patcher = patch.object(config, "get_default_config", return_value=defaults)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_encodings(self):
+        """Tests that the gpt-4o and newer models use o200k_base."""
+
+        for model in ("gpt-4o", "gpt-4o-mini", "o1", "gpt-5-mini"):
+            self.assertEqual(models.encoding_name(model), "o200k_base")
+        self.assertEqual(models.encoding_name("gpt-3.5-turbo"), "cl100k_base")
+
+    def test_defaults_override(self):
+        """Tests that defaults.json overrides fields, adds models and keeps old limits."""
+
+        self.with_defaults(
+            {
+                "models": {
+                    "gpt-4o": {"token_limit": 64000},
+                    "gpt-4.1": {"encoding": "o200k_base", "context_window": 1047576},
+                    "o1-mini": 32000,
+                }
+            }
+        )
+
+        gpt_4o = models.get_model("gpt-4o")
+        self.assertEqual(gpt_4o["token_limit"], 64000)
+        self.assertEqual(gpt_4o["encoding"], "o200k_base")
+        self.assertEqual(gpt_4o["context_window"], 128000)
+        self.assertEqual(models.get_model("gpt-4.1")["context_window"], 1047576)
+        self.assertEqual(models.get_model("gpt-4.1")["max_output"], 4096)
+        self.assertEqual(models.get_model("o1-mini")["token_limit"], 32000)
+        self.assertIn("gpt-4.1", models.get_models())
+
+    def test_unknown_model(self):
+        """Tests that an unknown model falls back to the default encoding."""
+
+        self.with_defaults({"models": {"my-model": {}}})
+
+        self.assertEqual(models.encoding_name("my-model"), config.ENCODING_MODEL)
+        self.assertEqual(models.get_model("other-model"), models.UNKNOWN_MODEL)
+
+    def test_encoder_cached(self):
+        """Tests that the encoder of an encoding is loaded once."""
+
+        self.assertIs(models.get_encoder("gpt-4o"), models.get_encoder("o1"))
+
+    def test_chat_token_limit(self):
+        """Tests that the history leaves room for the safety buffer and the answer."""
+
+        self.assertEqual(models.chat_token_limit("gpt-4o", 16000), 12000)
+        self.assertEqual(models.chat_token_limit("o1", 200000), 100000)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -3,8 +3,13 @@
 import unittest
 from unittest.mock import patch
 
-from terminalgpt.printer import (MarkdownPrinter, PlainPrinter, Printer,
-                                 PrinterFactory, PrintUtils)
+from terminalgpt.printer import (
+    MarkdownPrinter,
+    PlainPrinter,
+    Printer,
+    PrinterFactory,
+    PrintUtils,
+)
 
 
 class TestPrintUtils_1(unittest.TestCase):
@@ -57,6 +62,33 @@ class TestPrintUtils_1(unittest.TestCase):
         ]
         self.assertEqual(markdown._split_highlighted_string(input_str), expected_output)
 
+    def test_split_complete_blocks_open_paragraph(self):
+        """Tests that a paragraph is kept open until an empty line follows it."""
+
+        _, markdown = self.set_test()
+        self.assertEqual(
+            markdown.split_complete_blocks("First paragraph.\n\nSecond"),
+            (["First paragraph."], "Second"),
+        )
+
+    def test_split_complete_blocks_open_code_block(self):
+        """Tests that a code block is kept open until its fence is closed."""
+
+        _, markdown = self.set_test()
+        self.assertEqual(
+            markdown.split_complete_blocks("Text\n\n```python\nprint()\n\nx = 1"),
+            (["Text"], "```python\nprint()\n\nx = 1"),
+        )
+
+    def test_split_complete_blocks_closed_code_block(self):
+        """Tests that a closed code block is finished."""
+
+        _, markdown = self.set_test()
+        self.assertEqual(
+            markdown.split_complete_blocks("Text ```code``` more"),
+            (["Text ", "```code```"], " more"),
+        )
+
     def test_adjacent_highlighted_blocks(self):
         """Tests string with adjacent highlighted blocks."""
 
@@ -77,8 +109,46 @@ class TestPrintUtils_1(unittest.TestCase):
 from unittest import TestCase
 from unittest.mock import MagicMock, patch
 
-from terminalgpt.printer import (MarkdownPrinter, PlainPrinter, Printer,
-                                 PrinterFactory, PrintUtils)
+from terminalgpt.printer import (
+    MarkdownPrinter,
+    PlainPrinter,
+    Printer,
+    PrinterFactory,
+    PrintUtils,
+    Typewriter,
+)
+
+
+class TestTypewriter(TestCase):
+    """Tests for the Typewriter class."""
+
+    @patch("time.sleep")
+    @patch("sys.stdout")
+    def test_write_in_frames(self, mock_stdout, mock_sleep):
+        """Tests that text is written in chunks of cps / fps characters."""
+        Typewriter(cps=100, fps=10).write("x" * 25)
+        self.assertEqual(
+            [call.args[0] for call in mock_stdout.write.call_args_list],
+            ["x" * 10, "x" * 10, "x" * 5],
+        )
+        self.assertEqual(mock_stdout.flush.call_count, 3)
+        self.assertTrue(mock_sleep.called)
+
+    @patch("time.sleep")
+    @patch("sys.stdout")
+    def test_write_instant(self, mock_stdout, mock_sleep):
+        """Tests that instant mode writes everything at once."""
+        Typewriter(cps=100, fps=10, instant=True).write("x" * 25)
+        mock_stdout.write.assert_called_once_with("x" * 25)
+        mock_sleep.assert_not_called()
+
+    @patch("sys.stdout")
+    def test_printer_instant_when_not_a_terminal(self, mock_stdout):
+        """Tests that printers type instantly when stdout is not a terminal."""
+        mock_stdout.isatty.return_value = False
+        self.assertTrue(PlainPrinter().typewriter.instant)
+        mock_stdout.isatty.return_value = True
+        self.assertFalse(PlainPrinter().typewriter.instant)
 
 
 class TestPrinter(TestCase):
@@ -113,6 +183,13 @@ class TestPlainPrinter(TestCase):
         self.printer.print_assistant_message("Test")
         mock_print.assert_called()
 
+    @patch("builtins.print")
+    def test_print_assistant_stream(self, mock_print):
+        """Tests the print_assistant_stream method."""
+        message = self.printer.print_assistant_stream(iter(["Te", "st"]))
+        self.assertEqual(message, "Test")
+        mock_print.assert_called()
+
 
 class TestMarkdownPrinter(TestCase):
     """Tests for the MarkdownPrinter class."""
@@ -132,6 +209,29 @@ class TestMarkdownPrinter(TestCase):
         self.printer.print_assistant_message("Test")
         mock_print.assert_called()
 
+    @patch("builtins.print")
+    def test_print_assistant_stream(self, _):
+        """Tests the print_assistant_stream method renders each block once."""
+        printer = MarkdownPrinter(instant=True)
+        with patch.object(MarkdownPrinter, "console") as mock_console:
+            message = printer.print_assistant_stream(
+                iter(["First para", "graph.\n\n", "```py\nx = 1\n", "```", "\nEnd"])
+            )
+
+        self.assertEqual(message, "First paragraph.\n\n```py\nx = 1\n```\nEnd")
+        self.assertEqual(mock_console.print.call_count, 3)
+
+    @patch("rich.live.Live")
+    def test_stream_clears_live_region(self, mock_live):
+        """Tests that the live region is emptied when its block is printed."""
+        printer = MarkdownPrinter(instant=False)
+        with patch.object(MarkdownPrinter, "console"):
+            stream = printer.open_stream()
+            stream.feed("First para")
+            stream.feed("graph.\n\n")
+
+        mock_live.return_value.update.assert_called_with("")
+
     @patch("builtins.print")
     def test_print_with_delay(self, mock_print):
         """Tests the _print_with_delay method."""
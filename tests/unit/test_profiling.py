@@ -0,0 +1,134 @@
+"""Tests for profiling.py."""
+
+import io
+import json
+import os
+import pstats
+import tempfile
+import threading
+import time
+import unittest
+from contextlib import redirect_stderr
+from unittest.mock import patch
+
+from terminalgpt import profiling
+from terminalgpt.profiling import NULL_SPAN, Profiler, profiled
+
+
+class TestProfiler(unittest.TestCase):
+    """Tests for the Profiler class."""
+
+    def test_disabled_spans_are_no_ops(self):
+        """Tests that a disabled profiler hands out the shared no-op span."""
+
+        profiler = Profiler()
+        self.assertIs(profiler.span("request"), NULL_SPAN)
+
+        stderr = io.StringIO()
+        with redirect_stderr(stderr):
+            profiler.begin_turn()
+            with profiler.span("request"):
+                pass
+            profiler.end_turn()
+        self.assertEqual(stderr.getvalue(), "")
+
+    def test_turn_breakdown(self):
+        """Tests that the spans of a turn are summed up per phase."""
+
+        profiler = Profiler()
+        profiler.enable()
+        profiler.begin_turn()
+        for _ in range(2):
+            with profiler.span("tokens"):
+                pass
+        with profiler.span("request"):
+            time.sleep(0.01)
+
+        stderr = io.StringIO()
+        with redirect_stderr(stderr):
+            profiler.end_turn()
+            profiler.end_turn()  # no turn open, prints nothing
+        lines = stderr.getvalue().strip().splitlines()
+
+        self.assertEqual(len(lines), 3)
+        self.assertIn("Turn:", lines[0])
+        self.assertIn("request", lines[1])  # the slowest phase comes first
+        self.assertIn("tokens", lines[2])
+        self.assertIn("2x", lines[2])
+
+    def test_background_spans(self):
+        """Tests that spans of other threads are marked as background."""
+
+        profiler = Profiler()
+        profiler.enable()
+        profiler.begin_turn()
+
+        def title():
+            with profiler.span("title"):
+                pass
+
+        thread = threading.Thread(target=title)
+        thread.start()
+        thread.join()
+
+        stderr = io.StringIO()
+        with redirect_stderr(stderr):
+            profiler.end_turn()
+        self.assertIn("(background)", stderr.getvalue())
+
+    def test_chrome_trace(self):
+        """Tests that a .json output is a Chrome trace of all the spans."""
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "trace.json")
+            profiler = Profiler()
+            profiler.enable(path)
+            with profiler.span("save"):
+                pass
+            with redirect_stderr(io.StringIO()):
+                profiler.finish()
+
+            with open(path, "r", encoding="utf-8") as file:
+                events = json.load(file)["traceEvents"]
+
+        self.assertEqual([event["name"] for event in events], ["save"])
+        self.assertEqual(events[0]["ph"], "X")
+        self.assertGreaterEqual(events[0]["dur"], 0)
+
+    def test_cprofile_dump(self):
+        """Tests that any other output is a cProfile dump."""
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "run.prof")
+            profiler = Profiler()
+            profiler.enable(path)
+            sorted(range(1000))
+            with redirect_stderr(io.StringIO()):
+                profiler.finish()
+
+            self.assertGreater(pstats.Stats(path).total_calls, 0)
+
+    def test_profiled(self):
+        """Tests that profiled functions are timed only while profiling."""
+
+        @profiled("tokens")
+        def count():
+            return 42
+
+        profiler = Profiler()
+        with patch.object(profiling, "PROFILER", profiler):
+            self.assertEqual(count(), 42)
+            profiler.enable()
+            profiler.begin_turn()
+            self.assertEqual(count(), 42)
+
+            stderr = io.StringIO()
+            with redirect_stderr(stderr):
+                profiler.end_turn()
+
+        self.assertIn("tokens", stderr.getvalue())
+        self.assertIn("1x", stderr.getvalue())
+
+
+if __name__ == "__main__":
+    unittest.main()
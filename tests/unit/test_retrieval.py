@@ -0,0 +1,147 @@
+"""Tests for retrieval.py."""
+
+import unittest
+from unittest.mock import MagicMock, patch
+
+from terminalgpt import config
+from terminalgpt.chat import ChatManager
+from terminalgpt.retrieval import BM25Index, MessageIndex, tokenize
+from terminalgpt.tokens import REPLY_PRIMING, count_message_tokens
+
+
+class TestBM25Index(unittest.TestCase):
+    """Tests for the BM25Index class."""
+
+    def test_tokenize(self):
+        """Tests that words are lowercased and stopwords dropped."""
+
+        self.assertEqual(
+            tokenize("How do I sort a Python list?"), ["sort", "python", "list"]
+        )
+
+    def test_search(self):
+        """Tests that the documents sharing rare query terms rank first."""
+
+        index = BM25Index()
+        index.add("sort", "Use sorted() to sort a python list, or sort() it in place.")
+        index.add("docker", "Docker images are built from a Dockerfile.")
+        index.add("python", "Python is a programming language.")
+
+        results = index.search("how do I sort a list", k=2)
+
+        self.assertEqual(results[0][0], "sort")
+        self.assertEqual(len(results), 1)  # the other documents share no term
+        self.assertEqual(index.search("kubernetes"), [])
+
+    def test_incremental_updates(self):
+        """Tests that adding and removing documents scores like a fresh index."""
+
+        texts = {
+            "a": "python list sort",
+            "b": "docker compose file",
+            "c": "python docker image",
+        }
+        index = BM25Index()
+        for key, text in texts.items():
+            index.add(key, text)
+        index.add("d", "temporary python document")
+        index.remove("d")
+        index.add("b", "docker compose file")  # indexing a key again replaces it
+
+        fresh = BM25Index()
+        for key, text in texts.items():
+            fresh.add(key, text)
+
+        self.assertEqual(len(index), 3)
+        self.assertEqual(index.scores("python docker"), fresh.scores("python docker"))
+
+    def test_message_index_sync(self):
+        """Tests that syncing forgets dropped messages and indexes new ones."""
+
+        old = {"role": "user", "content": "python list sort"}
+        new = {"role": "user", "content": "python docker image"}
+        index = MessageIndex()
+        index.sync([old])
+        index.sync([new])
+
+        self.assertEqual(len(index), 1)
+        self.assertEqual(index.search("python", [new], k=5), [0])
+
+
+class TestSelectContext(unittest.TestCase):
+    """Tests for ChatManager.select_context."""
+
+    def set_test(self):
+        """Returns a chat manager of a long conversation, with 1 token per word."""
+
+        self.encoder = MagicMock()
+        self.encoder.encode_ordinary.side_effect = lambda text: text.split()
+        topics = ["python lists", "docker images", "git rebase", "rust traits"]
+        messages = [{"role": "system", "content": "assistant"}]
+        for number in range(20):
+            topic = topics[number % len(topics)]
+            for role in ("user", "assistant"):
+                messages.append({"role": role, "content": f"{role} {number} {topic}"})
+
+        with patch("terminalgpt.chat.get_encoder", return_value=self.encoder):
+            chat_manager = ChatManager(
+                conversations_manager=MagicMock(),
+                token_limit=4096,
+                session=MagicMock(),
+                messages=messages,
+                model="gpt-4o-mini",
+                printer=MagicMock(),
+                context="relevant",
+            )
+        return chat_manager
+
+    def test_select_context(self):
+        """Tests that the first, relevant and recent messages are selected in order."""
+
+        chat_manager = self.set_test()
+        chat_manager.append_message({"role": "user", "content": "more on git rebase"})
+        messages = chat_manager.messages
+
+        selected = chat_manager.select_context()
+
+        self.assertIs(selected[0], messages[0])
+        recent = messages[-config.CONTEXT_RECENT_MESSAGES :]
+        self.assertEqual(selected[-len(recent) :], recent)
+        older = selected[1 : -len(recent)]
+        self.assertEqual(len(older), config.CONTEXT_RELEVANT_MESSAGES)
+        self.assertTrue(all("git rebase" in message["content"] for message in older))
+        positions = [messages.index(message) for message in selected]
+        self.assertEqual(positions, sorted(positions))
+
+    def test_select_context_budget(self):
+        """Tests that the selection stays within the token budget."""
+
+        chat_manager = self.set_test()
+        chat_manager.append_message({"role": "user", "content": "more on git rebase"})
+
+        selected = chat_manager.select_context(budget=40)
+
+        tokens = sum(count_message_tokens(self.encoder, m) for m in selected)
+        self.assertLessEqual(tokens - REPLY_PRIMING, 40)
+        self.assertIs(selected[-1], chat_manager.messages[-1])
+
+    def test_trim_selected_context(self):
+        """Tests that a too long selection loses its least relevant message."""
+
+        chat_manager = self.set_test()
+        chat_manager.append_message({"role": "user", "content": "more on git rebase"})
+        selected = chat_manager.select_context()
+        length = len(selected)
+        unrelated = [m for m in selected[1:-1] if "git rebase" not in m["content"]]
+
+        self.assertTrue(chat_manager.trim_context(selected))
+
+        self.assertEqual(len(selected), length - 1)
+        self.assertNotIn(unrelated[0], selected)
+        self.assertIs(selected[0], chat_manager.messages[0])
+        self.assertIs(selected[-1], chat_manager.messages[-1])
+        self.assertEqual(len(chat_manager.messages), 42)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,168 @@
+"""Tests for retry.py."""
+
+import unittest
+from unittest.mock import MagicMock, patch
+
+import openai
+
+from terminalgpt.retry import RetryScheduler, is_retryable, parse_duration, server_delay
+
+
+def api_error(error_class, headers=None, code=None):
+    """Returns an API error with the given response headers and error code."""
+
+    response = MagicMock()
+    response.headers = headers or {}
+    return error_class("error", response=response, body={"code": code})
+
+
+class TestServerDelay(unittest.TestCase):
+    """Tests for reading the wait asked for by the server."""
+
+    def test_parse_duration(self):
+        """Tests the x-ratelimit-reset-* duration formats."""
+
+        self.assertEqual(parse_duration("1s"), 1)
+        self.assertEqual(parse_duration("6m0s"), 360)
+        self.assertEqual(parse_duration("20ms"), 0.02)
+        self.assertEqual(parse_duration("1h2m3.5s"), 3723.5)
+        self.assertIsNone(parse_duration("soon"))
+
+    def test_retry_after_ms_first(self):
+        """Tests that retry-after-ms wins over Retry-After."""
+
+        error = api_error(
+            openai.RateLimitError, {"retry-after-ms": "1500", "retry-after": "9"}
+        )
+        self.assertEqual(server_delay(error), 1.5)
+
+    def test_retry_after(self):
+        """Tests Retry-After in seconds."""
+
+        error = api_error(openai.RateLimitError, {"retry-after": "3"})
+        self.assertEqual(server_delay(error), 3)
+
+    def test_exhausted_limit_reset(self):
+        """Tests that only the resets of exhausted limits are waited for."""
+
+        error = api_error(
+            openai.RateLimitError,
+            {
+                "x-ratelimit-remaining-requests": "12",
+                "x-ratelimit-reset-requests": "30s",
+                "x-ratelimit-remaining-tokens": "0",
+                "x-ratelimit-reset-tokens": "1m2s",
+            },
+        )
+        self.assertEqual(server_delay(error), 62)
+
+    def test_no_headers(self):
+        """Tests an error without a response."""
+
+        self.assertIsNone(server_delay(openai.APIConnectionError(request=MagicMock())))
+
+
+class TestRetryScheduler(unittest.TestCase):
+    """Tests for the RetryScheduler class."""
+
+    def test_is_retryable(self):
+        """Tests which errors are worth retrying."""
+
+        self.assertTrue(is_retryable(api_error(openai.RateLimitError)))
+        self.assertTrue(is_retryable(api_error(openai.InternalServerError)))
+        self.assertTrue(is_retryable(openai.APITimeoutError(request=MagicMock())))
+        self.assertFalse(
+            is_retryable(api_error(openai.RateLimitError, code="insufficient_quota"))
+        )
+        self.assertFalse(is_retryable(api_error(openai.BadRequestError)))
+
+    def test_backoff_is_capped(self):
+        """Tests that the jittered backoff stays under its cap."""
+
+        scheduler = RetryScheduler(base_delay=1, max_delay=5)
+        for attempt in range(10):
+            self.assertLessEqual(scheduler.backoff(attempt), min(5, 2**attempt))
+
+    @patch("time.sleep")
+    def test_call_retries_then_succeeds(self, sleep):
+        """Tests that a rate limit is waited out as the server asks."""
+
+        request = MagicMock(
+            side_effect=[api_error(openai.RateLimitError, {"retry-after": "2"}), "ok"]
+        )
+        scheduler = RetryScheduler(base_delay=0.5)
+
+        self.assertEqual(scheduler.call(request), "ok")
+        self.assertEqual(scheduler.retries, 1)
+        (delay,), _ = sleep.call_args
+        self.assertGreaterEqual(delay, 2)
+        self.assertLessEqual(delay, 2.5)
+        self.assertEqual(scheduler.waited, delay)
+
+    @patch("time.sleep")
+    def test_call_gives_up_after_max_attempts(self, _):
+        """Tests the attempts cap."""
+
+        request = MagicMock(side_effect=api_error(openai.InternalServerError))
+        scheduler = RetryScheduler(max_attempts=3)
+
+        with self.assertRaises(openai.InternalServerError):
+            scheduler.call(request)
+        self.assertEqual(request.call_count, 3)
+
+    @patch("time.sleep")
+    def test_call_gives_up_past_max_wait(self, sleep):
+        """Tests that a wait longer than the budget is not waited for."""
+
+        request = MagicMock(
+            side_effect=api_error(openai.RateLimitError, {"retry-after": "120"})
+        )
+        scheduler = RetryScheduler(max_wait=60)
+
+        with self.assertRaises(openai.RateLimitError):
+            scheduler.call(request)
+        request.assert_called_once()
+        sleep.assert_not_called()
+
+    @patch("time.sleep")
+    def test_context_length_trims_context(self, sleep):
+        """Tests that only a context length error trims the context."""
+
+        request = MagicMock(
+            side_effect=[
+                api_error(openai.BadRequestError, code="context_length_exceeded"),
+                "ok",
+            ]
+        )
+        trim_context = MagicMock(return_value=True)
+
+        self.assertEqual(RetryScheduler().call(request, trim_context), "ok")
+        trim_context.assert_called_once()
+        sleep.assert_called_once_with(0.0)
+
+    def test_context_length_nothing_to_trim(self):
+        """Tests that the error is raised when the context can't be trimmed."""
+
+        request = MagicMock(
+            side_effect=api_error(
+                openai.BadRequestError, code="context_length_exceeded"
+            )
+        )
+
+        with self.assertRaises(openai.BadRequestError):
+            RetryScheduler().call(request, MagicMock(return_value=False))
+        request.assert_called_once()
+
+    @patch("time.sleep")
+    def test_rate_limit_keeps_context(self, _):
+        """Tests that a rate limit never trims the context."""
+
+        request = MagicMock(side_effect=[api_error(openai.RateLimitError), "ok"])
+        trim_context = MagicMock(return_value=True)
+
+        RetryScheduler().call(request, trim_context)
+        trim_context.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,115 @@
+"""Tests for search.py."""
+
+import os
+import shutil
+import unittest
+from unittest.mock import MagicMock, patch
+
+from terminalgpt import config
+from terminalgpt.conversations import ConversationManager
+from terminalgpt.search import SearchIndex, fts5_available, match_query
+
+
+class TestSearchIndex(unittest.TestCase):
+    """Tests for the SearchIndex class."""
+
+    def setUp(self):
+        self.test_search_path = "test_search"
+        os.makedirs(self.test_search_path, exist_ok=True)
+        self.index = SearchIndex(os.path.join(self.test_search_path, "search.db"))
+
+    def tearDown(self):
+        self.index.close()
+        shutil.rmtree(self.test_search_path, ignore_errors=True)
+
+    def test_match_query(self):
+        """Tests that the words are quoted prefixes, operators included."""
+
+        self.assertEqual(
+            match_query('flux "capacitor" OR'), '"flux"* """capacitor"""* "OR"*'
+        )
+        self.assertEqual(match_query("  "), "")
+
+    def test_search(self):
+        """Tests ranked hits with snippets, one per conversation."""
+
+        self.index.add(
+            "time_travel",
+            [
+                {"role": "system", "content": "flux capacitor"},  # not searched
+                {"role": "user", "content": "How does the flux capacitor work?"},
+                {"role": "assistant", "content": "The flux capacitor makes it work."},
+            ],
+        )
+        self.index.add(
+            "cooking", [{"role": "user", "content": "A capacitor in my oven?"}]
+        )
+
+        hits = self.index.search("flux capacitor")
+        self.assertEqual([hit["conversation"] for hit in hits], ["time_travel"])
+        self.assertIn("[flux] [capacitor]", hits[0]["snippet"])
+
+        hits = self.index.search("capacit")
+        self.assertEqual(len(hits), 2)
+        self.assertEqual(self.index.search("kubernetes"), [])
+
+    def test_rename_and_delete(self):
+        """Tests that renamed conversations move to their new name."""
+
+        self.index.add("untitled", [{"role": "user", "content": "flux capacitor"}])
+        self.index.rename("untitled", "time_travel")
+        self.assertEqual(self.index.search("flux")[0]["conversation"], "time_travel")
+
+        self.index.delete("time_travel")
+        self.assertEqual(self.index.search("flux"), [])
+
+
+class TestConversationsSearch(unittest.TestCase):
+    """Tests for the search index updates of ConversationManager."""
+
+    def setUp(self):
+        self.test_conversation_path = "test_search_conversations"
+        config.CONVERSATIONS_PATH = self.test_conversation_path
+
+    def tearDown(self):
+        shutil.rmtree(self.test_conversation_path, ignore_errors=True)
+
+    def test_save_updates_index(self):
+        """Tests that saves index the new messages only, and a missing index is built."""
+
+        cm = ConversationManager(printer=MagicMock())
+        cm.conversation_name = "time_travel"
+        messages = [{"role": "user", "content": "flux capacitor"}]
+        cm.save_conversation(messages)
+        messages.append({"role": "assistant", "content": "needs plutonium"})
+        cm.save_conversation(messages)
+
+        hits = cm.search_conversations("plutonium")
+        self.assertEqual(hits[0]["conversation"], "time_travel")
+        self.assertEqual(len(cm.search_conversations("flux")), 1)
+
+        # an index lost or never built is rebuilt from the logs
+        os.remove(os.path.join(self.test_conversation_path, config.SEARCH_INDEX))
+        cm = ConversationManager(printer=MagicMock())
+        self.assertEqual(cm.search_conversations("plutonium"), hits)
+
+    def test_without_fts5(self):
+        """Tests that without FTS5 saves skip the index and searches find nothing."""
+
+        self.assertTrue(fts5_available())
+        with patch("terminalgpt.conversations.fts5_available", return_value=False):
+            cm = ConversationManager(printer=MagicMock())
+            cm.conversation_name = "time_travel"
+            cm.save_conversation([{"role": "user", "content": "flux capacitor"}])
+
+            self.assertFalse(cm.search_available)
+            self.assertEqual(cm.search_conversations("flux"), [])
+        self.assertFalse(
+            os.path.exists(
+                os.path.join(self.test_conversation_path, config.SEARCH_INDEX)
+            )
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
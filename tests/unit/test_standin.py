@@ -0,0 +1,100 @@
+"""Tests for standin.py."""
+
+import time
+import unittest
+
+import openai
+
+from terminalgpt.standin import StandInServer
+
+
+class TestStandInServer(unittest.TestCase):
+    """Tests for the StandInServer class, through the openai client."""
+
+    def create_client(self, server):
+        """Returns a client of the stand-in server."""
+        return openai.OpenAI(api_key="standin", base_url=server.url, max_retries=0)
+
+    def test_completion(self):
+        """Tests a non streamed answer and its usage."""
+
+        with StandInServer(answer_tokens=5) as server:
+            answer = self.create_client(server).chat.completions.create(
+                model="gpt-4o-mini", messages=[{"role": "user", "content": "Hi there"}]
+            )
+
+        self.assertEqual(len(answer.choices[0].message.content.split(" ")), 6)
+        self.assertEqual(answer.usage.completion_tokens, 5)
+        self.assertEqual(answer.usage.total_tokens, answer.usage.prompt_tokens + 5)
+        self.assertEqual(server.requests, 1)
+
+    def test_max_tokens(self):
+        """Tests that the answer is cut to the max_tokens of the request."""
+
+        with StandInServer(answer_tokens=5) as server:
+            answer = self.create_client(server).chat.completions.create(
+                model="gpt-4o-mini",
+                messages=[{"role": "user", "content": "Hi there"}],
+                max_tokens=3,
+            )
+
+        self.assertEqual(answer.usage.completion_tokens, 3)
+
+    def test_stream(self):
+        """Tests a streamed answer with the usage chunk at its end."""
+
+        with StandInServer(answer_tokens=5) as server:
+            stream = self.create_client(server).chat.completions.create(
+                model="gpt-4o-mini",
+                messages=[{"role": "user", "content": "Hi"}],
+                stream=True,
+                stream_options={"include_usage": True},
+            )
+            chunks = list(stream)
+
+        contents = [
+            chunk.choices[0].delta.content
+            for chunk in chunks
+            if chunk.choices and chunk.choices[0].delta.content
+        ]
+        self.assertEqual(len(contents), 5)
+        self.assertEqual(chunks[-1].usage.completion_tokens, 5)
+
+    def test_latency_and_token_rate(self):
+        """Tests that the answer waits for the latency and the token rate."""
+
+        with StandInServer(
+            latency=0.1, tokens_per_second=100, answer_tokens=10
+        ) as server:
+            start = time.perf_counter()
+            self.create_client(server).chat.completions.create(
+                model="gpt-4o-mini", messages=[{"role": "user", "content": "Hi"}]
+            )
+            elapsed = time.perf_counter() - start
+
+        self.assertGreaterEqual(elapsed, 0.2)
+
+    def test_error_injection(self):
+        """Tests injected rate limits and their Retry-After header."""
+
+        with StandInServer(error_rate=1, retry_after=2) as server:
+            with self.assertRaises(openai.RateLimitError) as context:
+                self.create_client(server).chat.completions.create(
+                    model="gpt-4o-mini", messages=[]
+                )
+
+        self.assertEqual(context.exception.code, "rate_limit_exceeded")
+        self.assertEqual(context.exception.response.headers["retry-after"], "2")
+
+    def test_server_errors(self):
+        """Tests injected server errors."""
+
+        with StandInServer(error_rate=1, error_status=500) as server:
+            with self.assertRaises(openai.InternalServerError):
+                self.create_client(server).chat.completions.create(
+                    model="gpt-4o-mini", messages=[]
+                )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,34 @@
+import subprocess
+import sys
+import unittest
+
+CHECK_LOADED_MODULES = """
+import sys
+from click.testing import CliRunner
+from terminalgpt.main import cli
+
+CliRunner().invoke(cli, {args!r})
+print(",".join(m for m in ("openai", "tiktoken") if m in sys.modules))
+"""
+
+
+class TestStartup(unittest.TestCase):
+    def loaded_modules(self, args):
+        # run in a fresh interpreter, this one already imported everything
+        result = subprocess.run(
+            [sys.executable, "-c", CHECK_LOADED_MODULES.format(args=args)],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        return result.stdout.strip()
+
+    def test_help_does_not_load_sdk(self):
+        self.assertEqual(self.loaded_modules(["--help"]), "")
+
+    def test_delete_does_not_load_sdk(self):
+        self.assertEqual(self.loaded_modules(["delete", "--help"]), "")
+
+
+if __name__ == "__main__":
+    unittest.main()
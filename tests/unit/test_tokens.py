@@ -0,0 +1,146 @@
+"""Tests for tokens.py."""
+
+import unittest
+from unittest.mock import patch
+
+import tiktoken
+
+from terminalgpt import config
+from terminalgpt.tokens import (
+    Tokenizer,
+    TokenLedger,
+    count_message_tokens,
+    plan_truncation,
+)
+
+
+class TestTokenLedger(unittest.TestCase):
+    """Tests for the TokenLedger class."""
+
+    def set_test(self):
+        """Sets a test."""
+
+        encoder = tiktoken.get_encoding(config.ENCODING_MODEL)
+        messages = [
+            {"role": "system", "content": "Hello user Hello user"},
+            {"role": "user", "content": "Hello system Hello system"},
+            {"role": "assistant", "name": "Alice", "content": "Hi, I'm Alice."},
+        ]
+
+        return TokenLedger(Tokenizer(encoder), messages), encoder, messages
+
+    def test_total_matches_recount(self):
+        """Tests the initial total against a full recount."""
+
+        ledger, _, messages = self.set_test()
+        self.assertEqual(ledger.total, ledger.recount(messages))
+        self.assertTrue(ledger.verify(messages))
+
+    def test_append_and_pop(self):
+        """Tests that appends and pops only move the total by the message count."""
+
+        ledger, encoder, messages = self.set_test()
+        message = {"role": "user", "content": "What's the weather like?"}
+        total = ledger.total
+
+        messages.append(message)
+        count = ledger.append(message)
+
+        self.assertEqual(count, count_message_tokens(encoder, message))
+        self.assertEqual(ledger.total, total + count)
+        self.assertTrue(ledger.verify(messages))
+
+        messages.pop(1)
+        ledger.pop(1)
+        self.assertTrue(ledger.verify(messages))
+
+    def test_insert_with_known_count(self):
+        """Tests that insert trusts a precomputed count."""
+
+        ledger, _, messages = self.set_test()
+        message = messages.pop(1)
+        count = ledger.pop(1)
+
+        messages.insert(1, message)
+        ledger.insert(1, message, count=count)
+        self.assertTrue(ledger.verify(messages))
+
+    def test_verify_detects_drift(self):
+        """Tests that verify notices a list changed behind the ledger."""
+
+        ledger, _, messages = self.set_test()
+        messages[1]["content"] += " and some more words"
+        self.assertFalse(ledger.verify(messages))
+
+
+class TestTokenizer(unittest.TestCase):
+    """Tests for the Tokenizer class."""
+
+    def test_batched_counts(self):
+        """Tests that a batch on the thread pool counts like one message at a time."""
+
+        encoder = tiktoken.get_encoding(config.ENCODING_MODEL)
+        messages = [
+            {"role": "user", "content": f"Message {number}: " + "some words " * number}
+            for number in range(100)
+        ]
+        messages.append({"role": "assistant", "name": "Alice", "content": "Hi"})
+
+        with patch("os.cpu_count", return_value=4):
+            tokenizer = Tokenizer(encoder, threads=4, batch_size=1)
+
+        self.assertEqual(
+            tokenizer.count_messages(messages),
+            [count_message_tokens(encoder, message) for message in messages],
+        )
+        self.assertEqual(tokenizer.count_messages([]), [])
+
+    def test_single_cpu_inline(self):
+        """Tests that a single CPU encodes batches inline, whatever the threads asked."""
+
+        encoder = tiktoken.get_encoding(config.ENCODING_MODEL)
+        messages = [{"role": "user", "content": "Hello"}] * 10
+
+        with patch("os.cpu_count", return_value=1):
+            tokenizer = Tokenizer(encoder, threads=4, batch_size=1)
+        with patch("terminalgpt.tokens._pool") as pool:
+            counts = tokenizer.count_messages(messages)
+
+        pool.assert_not_called()
+        self.assertEqual(counts, [count_message_tokens(encoder, messages[0])] * 10)
+
+    def test_special_tokens_as_text(self):
+        """Tests that special tokens written in a message are counted as text."""
+
+        tokenizer = Tokenizer(tiktoken.get_encoding(config.ENCODING_MODEL))
+        message = {"role": "user", "content": "What is <|endoftext|>?"}
+
+        self.assertGreater(tokenizer.count_message(message), 4)
+
+
+class TestPlanTruncation(unittest.TestCase):
+    """Tests for the plan_truncation function."""
+
+    def test_nothing_to_remove(self):
+        """Tests a plan without excess tokens."""
+        self.assertEqual(plan_truncation([10, 10, 10], 0), (0, 0))
+
+    def test_cut_first_candidate(self):
+        """Tests a plan cutting only the oldest message after the first one."""
+        self.assertEqual(plan_truncation([10, 10, 10], 4), (0, 4))
+
+    def test_drop_and_cut(self):
+        """Tests a plan dropping whole messages and cutting the boundary one."""
+        self.assertEqual(plan_truncation([10, 5, 5, 20, 10], 15), (2, 5))
+
+    def test_exact_boundary(self):
+        """Tests a plan where the excess ends exactly at a message boundary."""
+        self.assertEqual(plan_truncation([10, 5, 5, 20, 10], 10), (2, 0))
+
+    def test_not_enough_to_remove(self):
+        """Tests a plan that has to drop everything but the first message."""
+        self.assertEqual(plan_truncation([10, 5, 5], 100), (2, 0))
+
+
+if __name__ == "__main__":
+    unittest.main()
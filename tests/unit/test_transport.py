@@ -0,0 +1,108 @@
+"""Tests for transport.py."""
+
+import asyncio
+import io
+import os
+import unittest
+from contextlib import redirect_stderr
+from unittest.mock import patch
+
+from openai import AsyncOpenAI, OpenAI
+
+from terminalgpt.standin import StandInServer
+from terminalgpt.transport import HttpTransport
+
+MESSAGES = [{"role": "user", "content": "Hello"}]
+
+
+class TestHttpTransport(unittest.TestCase):
+    """Tests for the HttpTransport class."""
+
+    def setUp(self):
+        self.standin = StandInServer(answer_tokens=3)
+        self.standin.start()
+
+    def tearDown(self):
+        self.standin.stop()
+
+    def traced_requests(self, transport: HttpTransport, requests: int) -> list:
+        """Sends requests through transport, returns the debug traces."""
+
+        stderr = io.StringIO()
+        with patch.dict(os.environ, {"LOG_LEVEL": "DEBUG"}), redirect_stderr(stderr):
+            client = OpenAI(
+                api_key="mock",
+                base_url=self.standin.url,
+                max_retries=0,
+                http_client=transport.http_client,
+            )
+            transport.prewarm(client.base_url)
+            for _ in range(requests):
+                client.chat.completions.create(model="gpt-4o-mini", messages=MESSAGES)
+        return stderr.getvalue().splitlines()
+
+    def test_prewarmed_connection_is_reused(self):
+        """Tests that the requests reuse the connection opened by the warm-up."""
+
+        traces = self.traced_requests(HttpTransport(), 2)
+
+        self.assertEqual(len(traces), 3)
+        self.assertIn("HEAD", traces[0])
+        self.assertIn("new connection", traces[0])
+        for trace in traces[1:]:
+            self.assertIn("POST", trace)
+            self.assertIn("reused connection", trace)
+        # the warm-up is not a chat completion
+        self.assertEqual(self.standin.requests, 2)
+
+    def test_async_prewarmed_connection_is_reused(self):
+        """Tests that the async requests reuse the connection of the async warm-up."""
+
+        transport = HttpTransport()
+
+        async def requests():
+            client = AsyncOpenAI(
+                api_key="mock",
+                base_url=self.standin.url,
+                max_retries=0,
+                http_client=transport.async_http_client,
+            )
+            transport.prewarm_async(client.base_url)
+            for _ in range(2):
+                await client.chat.completions.create(
+                    model="gpt-4o-mini", messages=MESSAGES
+                )
+
+        stderr = io.StringIO()
+        with patch.dict(os.environ, {"LOG_LEVEL": "DEBUG"}), redirect_stderr(stderr):
+            asyncio.run(requests())
+        traces = stderr.getvalue().splitlines()
+
+        self.assertEqual(len(traces), 3)
+        self.assertIn("HEAD", traces[0])
+        self.assertIn("new connection", traces[0])
+        for trace in traces[1:]:
+            self.assertIn("reused connection", trace)
+        self.assertEqual(self.standin.requests, 2)
+
+    def test_http2_without_h2(self):
+        """Tests that HTTP/2 falls back to HTTP/1.1 without the h2 package."""
+
+        with patch("importlib.util.find_spec", return_value=None):
+            traces = self.traced_requests(HttpTransport(http2=True), 1)
+
+        self.assertIn("HTTP/1.1", traces[0])
+        self.assertIn("reused connection", traces[-1])
+
+    def test_max_connections(self):
+        """Tests that the pool size can be raised before the clients are built."""
+
+        transport = HttpTransport(max_connections=2)
+        transport.max_connections = 8
+
+        self.assertEqual(transport.max_connections, 8)
+        self.assertEqual(len(self.traced_requests(transport, 1)), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()